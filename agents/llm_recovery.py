@@ -0,0 +1,335 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from agents.recovery import RecoveryAgent, ReasoningTrace
+
+logger = logging.getLogger("llm_recovery")
+
+ACTIONS = ("retry", "retry_alternate", "block", "escalate", "none")
+
+
+class LocalStandInModel:
+    """
+    Offline stand-in for the recovery LLM. Answers a batch of failure
+    descriptions with the heuristic RecoveryAgent's decisions after a fixed
+    simulated round-trip latency, so LLM mode can run and be measured
+    without network access.
+    """
+
+    def __init__(self, latency: float = 0.3):
+        self.latency = latency
+        self._heuristic = RecoveryAgent()
+
+    def decide_batch(self, failures: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        time.sleep(self.latency)
+        decisions = []
+        for failure in failures:
+            analysis = self._heuristic.analyze_failure(failure["error_code"], [])
+            decisions.append({
+                "action": analysis["action"],
+                "summary": analysis["summary"],
+                "confidence": analysis["confidence"],
+                "conclusion": analysis["reason"].conclusion,
+            })
+        return decisions
+
+
+class OpenAIRecoveryModel:
+    """
+    Recovery decisions from a chat model via langchain-openai; one model call
+    answers a whole batch of failures.
+    """
+
+    SYSTEM_PROMPT = (
+        "You are the recovery agent of a payment orchestration system. For each failed payment "
+        "attempt you are given the error code, the gateway and the recent errors for that payment. "
+        f"Choose an action from {list(ACTIONS)}: retry for transient errors, retry_alternate when "
+        "another gateway may succeed, block when retrying would be wasteful or risky, escalate "
+        "when a human must look. Reply with only a JSON array, one object per failure in input "
+        'order: {"action": str, "summary": str, "confidence": float, "conclusion": str}.'
+    )
+
+    def __init__(self, model: str = "gpt-4o-mini", timeout: float = 10.0):
+        from langchain_openai import ChatOpenAI
+        self.llm = ChatOpenAI(model=model, temperature=0, timeout=timeout)
+
+    def decide_batch(self, failures: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        reply = self.llm.invoke([
+            ("system", self.SYSTEM_PROMPT),
+            ("user", json.dumps(failures)),
+        ]).content
+        reply = reply.strip().removeprefix("```json").removeprefix("```").removesuffix("```")
+        decisions = json.loads(reply)
+        if not isinstance(decisions, list) or len(decisions) != len(failures):
+            raise ValueError(f"Expected {len(failures)} decisions, got {reply[:200]!r}")
+        return decisions
+
+
+class DecisionCache:
+    """LRU cache of recovery decisions whose entries expire after ttl seconds."""
+
+    def __init__(self, capacity: int = 10_000, ttl: float = 300.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, decision = entry
+            if time.monotonic() > expires:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return decision
+
+    def put(self, key: Hashable, decision: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, decision)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class MicroBatcher:
+    """
+    Collects concurrent cache misses and answers them with one model call.
+
+    A flusher thread waits for the first pending request, then up to
+    `window` seconds (or until `max_batch` requests) before calling the
+    model; up to `max_inflight` batches are with the model at once. Requests
+    with the same key already pending or in flight share one future. Callers
+    get a concurrent.futures.Future, which threads can block on and
+    coroutines can await through asyncio.wrap_future. on_decision sees each
+    decision before its waiters do.
+    """
+
+    def __init__(
+        self,
+        model,
+        window: float = 0.01,
+        max_batch: int = 32,
+        max_inflight: int = 4,
+        on_decision: Optional[Callable[[Hashable, Dict[str, Any]], None]] = None,
+    ):
+        self.model = model
+        self.on_decision = on_decision
+        self.window = window
+        self.max_batch = max_batch
+        self._pool = ThreadPoolExecutor(max_inflight, thread_name_prefix="recovery-model")
+        self.calls = 0
+        self.batched = 0
+        self._pending: List[Tuple[Hashable, Dict[str, Any]]] = []
+        self._futures: Dict[Hashable, Future] = {}
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="recovery-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, key: Hashable, failure: Dict[str, Any]) -> Tuple[Future, bool]:
+        """Returns the future for key and whether it joined an existing request."""
+        with self._cond:
+            future = self._futures.get(key)
+            if future is not None:
+                return future, True
+            future = self._futures[key] = Future()
+            self._pending.append((key, failure))
+            self._cond.notify()
+            return future, False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.window
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+            self._pool.submit(self._call, batch)
+
+    def _call(self, batch: List[Tuple[Hashable, Dict[str, Any]]]):
+        with self._cond:
+            futures = [self._futures[key] for key, _ in batch]
+        error: Optional[Exception] = None
+        decisions: List[Dict[str, Any]] = []
+        try:
+            decisions = list(self.model.decide_batch([failure for _, failure in batch]))
+            with self._cond:
+                self.calls += 1
+                self.batched += len(batch)
+            if len(decisions) < len(batch):
+                error = ValueError(f"Recovery model answered {len(decisions)} of {len(batch)} failures")
+        except Exception as e:
+            error = e
+        try:
+            # Each future on its own: one failing must not leave the rest,
+            # and the threads blocked on them, waiting
+            for i, ((key, _), future) in enumerate(zip(batch, futures)):
+                if future.done():
+                    continue
+                try:
+                    if i >= len(decisions):
+                        raise error
+                    if self.on_decision:
+                        self.on_decision(key, decisions[i])
+                    future.set_result(decisions[i])
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+        finally:
+            with self._cond:
+                for key, _ in batch:
+                    self._futures.pop(key, None)
+
+
+class LLMRecoveryAgent(RecoveryAgent):
+    """
+    RecoveryAgent whose decisions come from a (batched, cached) model call.
+
+    Decisions are cached on (error_code, gateway, recent error signature);
+    misses are micro-batched into shared model calls. If the model fails,
+    answers with an unknown action or takes longer than `timeout` seconds,
+    the heuristic RecoveryAgent decides and nothing is cached (a late answer
+    is still cached for the next lookup).
+    """
+
+    def __init__(
+        self,
+        model=None,
+        cache_size: int = 10_000,
+        cache_ttl: float = 300.0,
+        batch_window: float = 0.01,
+        max_batch: int = 32,
+        max_inflight: int = 4,
+        signature_depth: int = 2,
+        context_depth: int = 6,
+        timeout: float = 5.0,
+    ):
+        super().__init__(context_depth=context_depth)
+        self.model = model or LocalStandInModel()
+        self.cache = DecisionCache(cache_size, cache_ttl)
+        self.batcher = MicroBatcher(self.model, batch_window, max_batch, max_inflight, self._remember)
+        self.signature_depth = signature_depth
+        self.timeout = timeout
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+        self.added_latency_s = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _describe(self, error_code: str, history: list) -> Tuple[Hashable, Dict[str, Any]]:
+        # Most recent gateway, and the errors of the attempts before this one
+        gateway = None
+        recent_errors = []
+        for entry in reversed(history):
+            step = entry.get("step")
+            if step == "route" and gateway is None:
+                gateway = entry.get("gateway")
+            elif step == "execute" and entry.get("error"):
+                recent_errors.append(entry["error"])
+                if len(recent_errors) > self.signature_depth:
+                    break
+        # recent_errors[0] is the failure being analysed
+        signature = tuple(recent_errors[1:self.signature_depth + 1])
+        key = (error_code, gateway, signature)
+        return key, {"error_code": error_code, "gateway": gateway, "recent_errors": list(signature)}
+
+    def _analysis(self, decision: Optional[Dict[str, Any]], error_code: str, history: list) -> Dict[str, Any]:
+        if decision is None or decision.get("action") not in ACTIONS:
+            with self._stats_lock:
+                self.fallbacks += 1
+            return super().analyze_failure(error_code, history)
+        return {
+            "action": decision["action"],
+            "reason": ReasoningTrace(error_code, decision.get("conclusion", ""), history, self.context_depth),
+            "summary": decision.get("summary", ""),
+            "confidence": float(decision.get("confidence", 0.5)),
+        }
+
+    def _lookup(self, error_code: str, history: list):
+        key, failure = self._describe(error_code, history)
+        decision = self.cache.get(key)
+        if decision is not None:
+            with self._stats_lock:
+                self.hits += 1
+            return decision, None
+        future, joined = self.batcher.submit(key, failure)
+        with self._stats_lock:
+            self.misses += 1
+            self.coalesced += joined
+        return None, future
+
+    def _remember(self, key: Hashable, decision: Dict[str, Any]):
+        if isinstance(decision, dict) and decision.get("action") in ACTIONS:
+            self.cache.put(key, decision)
+
+    def _settle(self, future: Future, timeout: float) -> Optional[Dict[str, Any]]:
+        try:
+            decision = future.result(timeout)
+        except TimeoutError:
+            logger.warning(f"Recovery model took over {self.timeout} s, using heuristics")
+            return None
+        except Exception as e:
+            logger.warning(f"Recovery model failed, using heuristics: {e}")
+            return None
+        return decision if isinstance(decision, dict) else None
+
+    def _account(self, start: float):
+        with self._stats_lock:
+            self.added_latency_s += time.perf_counter() - start
+
+    def analyze_failure(self, error_code: str, history: list) -> Dict[str, Any]:
+        if not error_code:
+            return super().analyze_failure(error_code, history)
+        start = time.perf_counter()
+        decision, future = self._lookup(error_code, history)
+        if future is not None:
+            decision = self._settle(future, self.timeout)
+        self._account(start)
+        return self._analysis(decision, error_code, history)
+
+    async def aanalyze_failure(self, error_code: str, history: list) -> Dict[str, Any]:
+        if not error_code:
+            return super().analyze_failure(error_code, history)
+        start = time.perf_counter()
+        decision, future = self._lookup(error_code, history)
+        if future is not None:
+            try:
+                # Shielded: the future may be shared with other waiters
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+            except Exception:
+                pass
+            decision = self._settle(future, 0)
+        self._account(start)
+        return self._analysis(decision, error_code, history)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "lookups": lookups,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "coalesced": self.coalesced,
+            "model_calls": self.batcher.calls,
+            "avg_batch_size": self.batcher.batched / self.batcher.calls if self.batcher.calls else 0.0,
+            "fallbacks": self.fallbacks,
+            "avg_added_latency_ms": self.added_latency_s / lookups * 1000 if lookups else 0.0,
+            "cache_entries": len(self.cache),
+        }
@@ -1,27 +1,53 @@
+import asyncio
 import random
 import time
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 class MockGateway:
-    def __init__(self, name: str, success_rate: float, latency_mean: float, latency_std: float):
+    def __init__(self, name: str, success_rate: float, latency_mean: float, latency_std: float, seed: Optional[int] = None):
         self.name = name
         self.success_rate = success_rate
         self.latency_mean = latency_mean
         self.latency_std = latency_std
+        # Module-level random by default; a seeded generator makes runs reproducible
+        self.rng = random.Random(seed) if seed is not None else random
     
-    def update_config(self, success_rate: float = None, latency_mean: float = None):
+    def update_config(self, success_rate: float = None, latency_mean: float = None, latency_std: float = None):
         if success_rate is not None:
             self.success_rate = success_rate
         if latency_mean is not None:
             self.latency_mean = latency_mean
+        if latency_std is not None:
+            self.latency_std = latency_std
     
     def process_payment(self, amount: float, currency: str) -> Dict[str, Any]:
         # Simulate latency
-        latency = max(0.01, random.gauss(self.latency_mean, self.latency_std))
+        latency = self._sample_latency()
         time.sleep(latency)
-        
+        return self._outcome(latency)
+
+    async def aprocess_payment(self, amount: float, currency: str) -> Dict[str, Any]:
+        """
+        Non-blocking variant of process_payment: yields to the event loop
+        while the simulated gateway is "in flight" instead of holding a thread.
+        """
+        latency = self._sample_latency()
+        await asyncio.sleep(latency)
+        return self._outcome(latency)
+
+    def sample(self) -> Dict[str, Any]:
+        """
+        Outcome of one payment without waiting for its latency, for
+        simulations that keep their own (virtual) clock.
+        """
+        return self._outcome(self._sample_latency())
+
+    def _sample_latency(self) -> float:
+        return max(0.01, self.rng.gauss(self.latency_mean, self.latency_std))
+
+    def _outcome(self, latency: float) -> Dict[str, Any]:
         # Simulate outcome
-        if random.random() < self.success_rate:
+        if self.rng.random() < self.success_rate:
             return {
                 "status": "success",
                 "gateway": self.name,
@@ -30,7 +56,7 @@ class MockGateway:
             }
         else:
             # Simulate different error types
-            error_code = random.choice(["TIMEOUT", "INSUFFICIENT_FUNDS", "BANK_DECLINE", "FRAUD_BLOCK"])
+            error_code = self.rng.choice(["TIMEOUT", "INSUFFICIENT_FUNDS", "BANK_DECLINE", "FRAUD_BLOCK"])
             return {
                 "status": "failure",
                 "gateway": self.name,
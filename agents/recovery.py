@@ -1,8 +1,54 @@
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
+
+class ReasoningTrace:
+    """
+    Reasoning text for one failure analysis, rendered on demand.
+
+    Holds the error, the conclusion and a compact summary of the last
+    `depth` route/execute steps, so building it costs the same however long
+    the history is and earlier traces are never nested into later ones.
+    """
+    __slots__ = ("error_code", "conclusion", "context")
+
+    def __init__(self, error_code: str, conclusion: str, history: List[Dict[str, Any]], depth: int = 6):
+        self.error_code = error_code
+        self.conclusion = conclusion
+        steps = []
+        for entry in reversed(history):
+            if len(steps) == depth:
+                break
+            if entry.get("step") == "route":
+                steps.append(f"route -> {entry.get('gateway')} ({entry.get('status')})")
+            elif entry.get("step") == "execute":
+                steps.append(f"execute {entry.get('result')}" + (f" ({entry['error']})" if entry.get("error") else ""))
+        self.context = tuple(reversed(steps))
+
+    def __str__(self) -> str:
+        context = "; ".join(self.context)
+        return f"""
+        ANALYSIS OF FAILURE: {self.error_code}
+        Observation: Gateway returned {self.error_code}.
+        Context: {context}
+        Knowledge:
+        - TIMEOUT implies network congestion or downstream issues.
+        - INSUFFICIENT_FUNDS is a user-side error.
+        - FRAUD_BLOCK indicates high risk.
+        - BANK_DECLINE is generic but sometimes retriable via premium routes.
+        
+        Reasoning:
+        {self.conclusion}"""
+
+    __repr__ = __str__
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, ReasoningTrace):
+            return NotImplemented
+        return (self.error_code, self.conclusion, self.context) == (other.error_code, other.conclusion, other.context)
 
 class RecoveryAgent:
-    def __init__(self):
-        pass
+    def __init__(self, context_depth: int = 6):
+        # Route/execute steps summarised into each reasoning trace
+        self.context_depth = context_depth
         
     def analyze_failure(self, error_code: str, history: list) -> Dict[str, Any]:
         """
@@ -11,20 +57,8 @@ class RecoveryAgent:
         """
         
         # Simple heuristics for demo
-        # Simulated "LLM" reasoning
-        
-        reasoning_trace = f"""
-        ANALYSIS OF FAILURE: {error_code}
-        Observation: Gateway returned {error_code}.
-        Context: {history}
-        Knowledge:
-        - TIMEOUT implies network congestion or downstream issues.
-        - INSUFFICIENT_FUNDS is a user-side error.
-        - FRAUD_BLOCK indicates high risk.
-        - BANK_DECLINE is generic but sometimes retriable via premium routes.
-        
-        Reasoning:
-        """
+        # Simulated "LLM" reasoning; the trace text is only rendered when
+        # someone reads it (see ReasoningTrace).
         
         if not error_code:
              return {
@@ -35,42 +69,48 @@ class RecoveryAgent:
             }
 
         if error_code == "TIMEOUT":
-            reasoning_trace += "Error is transient. Immediate retry on a fresh connection is likely to succeed."
             return {
                 "action": "retry", 
-                "reason": reasoning_trace,
+                "reason": ReasoningTrace(error_code, "Error is transient. Immediate retry on a fresh connection is likely to succeed.", history, self.context_depth),
                 "summary": "Transient network timeout detected. Creating retry plan.",
                 "confidence": 0.9
             }
         elif error_code == "INSUFFICIENT_FUNDS":
-            reasoning_trace += "Error is permanent (user-side). Retry will waste resources and increase costs."
             return {
                 "action": "block",
-                "reason": reasoning_trace,
+                "reason": ReasoningTrace(error_code, "Error is permanent (user-side). Retry will waste resources and increase costs.", history, self.context_depth),
                 "summary": "User error (insufficient funds). Retrying will likely fail.",
                 "confidence": 0.95
             }
         elif error_code == "BANK_DECLINE":
-            reasoning_trace += "Error is generic. A different acquirer (Premium) might have better acceptance rates for this bin."
             return {
                 "action": "retry_alternate",
-                "reason": reasoning_trace,
+                "reason": ReasoningTrace(error_code, "Error is generic. A different acquirer (Premium) might have better acceptance rates for this bin.", history, self.context_depth),
                 "summary": "Generic bank decline. Attempting alternate premium route.",
                 "confidence": 0.6
             }
+        elif error_code == "GATEWAY_BUSY":
+            return {
+                "action": "none",
+                "reason": ReasoningTrace(error_code, "Every gateway is at its concurrency limit. Retrying now would only add to the overload; the client should back off.", history, self.context_depth),
+                "summary": "Load shed: all gateways saturated.",
+                "confidence": 0.9
+            }
         elif error_code == "FRAUD_BLOCK":
-            reasoning_trace += "Security risk active. Stopping transaction to prevent chargeback."
             return {
                 "action": "block",
-                "reason": reasoning_trace,
+                "reason": ReasoningTrace(error_code, "Security risk active. Stopping transaction to prevent chargeback.", history, self.context_depth),
                 "summary": "High fraud risk detected locally.",
                 "confidence": 0.99
             }
             
-        reasoning_trace += "Error code is unrecognized. Requires human analysis."
         return {
             "action": "escalate", 
-            "reason": reasoning_trace, 
+            "reason": ReasoningTrace(error_code, "Error code is unrecognized. Requires human analysis.", history, self.context_depth), 
             "summary": "Unknown Error. Escalated to Ops Team.", 
             "confidence": 0.5
         }
+
+    async def aanalyze_failure(self, error_code: str, history: list) -> Dict[str, Any]:
+        """Async form of analyze_failure, for agents that wait on a model."""
+        return self.analyze_failure(error_code, history)
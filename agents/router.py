@@ -1,33 +1,501 @@
 import numpy as np
 import logging
-from typing import Dict, List, Optional
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Sequence, Tuple
 
 logger = logging.getLogger("router")
 
 class ThompsonSamplingRouter:
-    def __init__(self, gateways: List[str]):
-        self.gateways = gateways
-        # Initialize Beta distribution parameters: alpha=1 (successes), beta=1 (failures)
-        self.counts = {gw: {"alpha": 1.0, "beta": 1.0} for gw in gateways}
-    
-    def select_gateway(self) -> str:
-        sampled_probs = {}
-        for gw in self.gateways:
-            # Sample from Beta(alpha, beta)
-            sampled_probs[gw] = np.random.beta(self.counts[gw]["alpha"], self.counts[gw]["beta"])
-        
-        selected = max(sampled_probs, key=sampled_probs.get)
-        logger.info(f"Router selected {selected} (probs: {sampled_probs})")
+    # Arrays holding all learned state, and the methods that mutate them;
+    # core.shared_state uses these to move a router into shared memory.
+    SHARED_ARRAYS = ("alpha", "beta", "latency_stats")
+    SHARED_LOCKED = ("update", "update_many", "observe_latency")
+
+    # Normal-Inverse-Gamma prior on each gateway's log latency: pseudo-count
+    # of the prior mean, and the Inverse-Gamma shape and scale of the variance
+    LATENCY_PRIOR = (1.0, 2.0, 0.5)
+
+    def __init__(self, gateways: List[str], seed: Optional[int] = None):
+        self.gateways = list(gateways)
+        self.index = {gw: i for i, gw in enumerate(self.gateways)}
+        self._names = np.array(self.gateways, dtype=object)
+        self._rng = np.random.default_rng(seed)
+        # Beta distribution parameters, one slot per gateway:
+        # alpha=1 (successes), beta=1 (failures)
+        self.alpha = np.ones(len(self.gateways), dtype=np.float64)
+        self.beta = np.ones(len(self.gateways), dtype=np.float64)
+        # Exponentially weighted evidence on log latency (seconds) per gateway:
+        # rows are weight, sum and sum of squares
+        self.latency_stats = np.zeros((3, len(self.gateways)), dtype=np.float64)
+        self.set_objective()
+
+    def set_objective(
+        self,
+        latency_weight: float = 0.0,
+        fees: Optional[Dict[str, float]] = None,
+        latency_memory: float = 2000.0,
+        latency_prior_s: float = 0.5,
+    ):
+        """
+        Selection maximises a sampled utility per gateway:
+
+            success probability - latency_weight * latency (s) - fee
+
+        with fees in the same units as the success probability (0.01 costs
+        as much as one point of success rate). With the defaults, utility is
+        the success probability alone. Latency is a log-normal per gateway,
+        learned by observe_latency() over roughly the last latency_memory
+        observations (of any gateway); its mean is sampled from the posterior like the
+        success probability, so a gateway with few observations is explored
+        on latency as well.
+        """
+        self.latency_weight = latency_weight
+        self.fees = np.array([(fees or {}).get(gw, 0.0) for gw in self.gateways], dtype=np.float64)
+        self._has_fees = bool(self.fees.any())
+        self.latency_memory = latency_memory
+        self.latency_prior_s = latency_prior_s
+        self._latency_cache = None
+
+    def observe_latency(self, gateway: str, latency_ms: float):
+        i = self.index.get(gateway)
+        if i is None or latency_ms <= 0:
+            return
+        x = math.log(latency_ms / 1000)
+        # All gateways' evidence fades with every observation, so a gateway
+        # that stopped getting traffic drifts back to the wide prior and is
+        # tried again, instead of being judged on a spike long gone
+        stats = self.latency_stats
+        stats *= 1.0 - 1.0 / self.latency_memory
+        stats[:, i] += (1.0, x, x * x)
+        self._latency_cache = None
+
+    def _latency_params(self, n: float, total: float, squares: float) -> Tuple[float, float]:
+        """
+        (center, spread) of one gateway's log mean latency, from its weighted
+        evidence by a Normal-Inverse-Gamma update of LATENCY_PRIOR. The
+        variance is taken at its posterior mean and only the location is
+        sampled: the mean latency is exp(center + spread * z), z ~ N(0, 1).
+        """
+        kappa0, shape0, scale0 = self.LATENCY_PRIOR
+        mu0 = math.log(self.latency_prior_s)
+        kappa = kappa0 + n
+        xbar = total / n if n > 0 else mu0
+        scale = scale0 + 0.5 * max(squares - total * xbar, 0.0) + kappa0 * n * (xbar - mu0) ** 2 / (2 * kappa)
+        var = scale / (shape0 + n / 2 - 1)
+        return (kappa0 * mu0 + total) / kappa + var / 2, math.sqrt(var / kappa)
+
+    def _latency_posterior(self) -> np.ndarray:
+        # Rows center and spread per gateway, cached until the next
+        # observation; with shared state, evidence from other workers is
+        # picked up at this worker's next observation.
+        if self._latency_cache is None:
+            self._latency_cache = np.array([self._latency_params(*col) for col in self.latency_stats.T.tolist()]).T.copy()
+        return self._latency_cache
+
+    def _sample_latency(self, size=None) -> np.ndarray:
+        """Draws of each gateway's mean latency in seconds."""
+        center, spread = self._latency_posterior()
+        return np.exp(center + spread * self._rng.standard_normal(size))
+
+    def expected_latency_ms(self) -> np.ndarray:
+        return np.exp(self._latency_posterior()[0]) * 1000
+
+    def _sample_utility(self, alpha: np.ndarray, beta: np.ndarray, size=None) -> np.ndarray:
+        # The Beta draw, less the latency and fee penalties when configured;
+        # every term is drawn for all gateways (and rows) at once
+        utility = self._rng.beta(alpha, beta, size)
+        if self.latency_weight:
+            utility -= self.latency_weight * self._sample_latency(utility.shape)
+        if self._has_fees:
+            utility -= self.fees
+        return utility
+
+    @property
+    def counts(self) -> Dict[str, Dict[str, float]]:
+        # Dict view kept for the API/dashboard; the arrays are authoritative.
+        return {
+            gw: {"alpha": float(self.alpha[i]), "beta": float(self.beta[i])}
+            for gw, i in self.index.items()
+        }
+
+    def _posterior(self, context: Optional[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        # The global router ignores context; subclasses resolve it to a bucket.
+        return self.alpha, self.beta
+
+    def select_gateway(self, context: Optional[Dict[str, Any]] = None) -> str:
+        # One vectorized utility draw (Beta, less penalties) across all gateways
+        alpha, beta = self._posterior(context)
+        sampled = self._sample_utility(alpha, beta)
+        selected = self.gateways[int(sampled.argmax())]
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Router selected %s (utilities: %s)", selected, dict(zip(self.gateways, sampled.tolist())))
         return selected
-    
-    def update(self, gateway: str, success: bool):
-        if gateway not in self.counts:
+
+    def select_batch(self, n: int) -> List[str]:
+        """
+        Selects gateways for n transactions with a single n x k Beta draw.
+        """
+        alpha, beta = self._posterior(None)
+        sampled = self._sample_utility(alpha, beta, size=(n, len(self.gateways)))
+        return self._names[sampled.argmax(axis=1)].tolist()
+
+    def update(self, gateway: str, success: bool, context: Optional[Dict[str, Any]] = None):
+        i = self.index.get(gateway)
+        if i is None:
             return
-        
+
         if success:
-            self.counts[gateway]["alpha"] += 1
+            self.alpha[i] += 1
         else:
-            self.counts[gateway]["beta"] += 1
+            self.beta[i] += 1
+
+    def update_many(self, gateways: Sequence[str], outcomes: Sequence[bool]):
+        """
+        Bulk update; unknown gateways are ignored, as in update().
+        """
+        idx = np.fromiter((self.index.get(gw, -1) for gw in gateways), dtype=np.intp, count=len(gateways))
+        outcomes = np.asarray(outcomes, dtype=bool)
+        known = idx >= 0
+        idx, outcomes = idx[known], outcomes[known]
+        # np.add.at accumulates repeated indices, unlike fancy-index +=
+        np.add.at(self.alpha, idx[outcomes], 1.0)
+        np.add.at(self.beta, idx[~outcomes], 1.0)
+
+    def rank(self, context: Optional[Dict[str, Any]] = None) -> List[str]:
+        """Gateways by expected utility (posterior means), best first."""
+        alpha, beta = self._posterior(context)
+        utility = alpha / (alpha + beta) - self.fees
+        if self.latency_weight:
+            utility = utility - self.latency_weight * self.expected_latency_ms() / 1000
+        return self._names[np.argsort(-utility, kind="stable")].tolist()
 
     def get_state(self) -> Dict[str, Dict[str, float]]:
-        return self.counts
+        state = self.counts
+        if self.latency_stats[0].any():
+            for gw, latency_ms in zip(self.gateways, self.expected_latency_ms().tolist()):
+                state[gw]["latency_ms"] = latency_ms
+        return state
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        """Copy of the learned state as flat arrays, for snapshots."""
+        return {
+            "gateways": np.array(self.gateways, dtype=str),
+            "alpha": self.alpha.copy(),
+            "beta": self.beta.copy(),
+            "latency_stats": self.latency_stats.copy(),
+        }
+
+    def load_state(self, state: Dict[str, np.ndarray], prior_decay: float = 1.0):
+        """
+        Restores exported state in place, matching gateways by name.
+        prior_decay scales the restored evidence (above the Beta(1, 1) prior),
+        so a warm start can be weaker than the state it was taken from.
+        """
+        dst, src = self._match_gateways(state["gateways"])
+        self.alpha[dst] = 1.0 + (state["alpha"][src] - 1.0) * prior_decay
+        self.beta[dst] = 1.0 + (state["beta"][src] - 1.0) * prior_decay
+        self._load_latency(state, dst, src, prior_decay)
+
+    def _load_latency(self, state: Dict[str, np.ndarray], dst: np.ndarray, src: np.ndarray, prior_decay: float):
+        # Older snapshots have no latency evidence; keep starting cold then
+        if "latency_stats" in state:
+            self.latency_stats[:, dst] = state["latency_stats"][:, src] * prior_decay
+            self._latency_cache = None
+
+    def _match_gateways(self, saved: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Index pairs (ours, saved) for gateways present in both
+        pairs = [(self.index[gw], j) for j, gw in enumerate(saved.tolist()) if gw in self.index]
+        dst = np.array([d for d, _ in pairs], dtype=np.intp)
+        src = np.array([j for _, j in pairs], dtype=np.intp)
+        return dst, src
+
+
+class ContextualThompsonRouter(ThompsonSamplingRouter):
+    """
+    Thompson sampling with a Beta posterior per (context bucket, gateway).
+
+    Buckets are built from payment context fields at increasing granularity
+    (see DEFAULT_LEVELS). Selection uses the finest bucket holding at least
+    min_observations outcomes and backs off to coarser ones, down to the
+    global posterior inherited from ThompsonSamplingRouter.
+
+    Bucket posteriors live in a fixed-capacity float32 slab; a bucket slot is
+    reclaimed when it has not been updated for ttl seconds or, once the slab
+    is full, in least-recently-used order.
+    """
+
+    # Bucket slots are indexed through a process-local dict
+    SHARED_ARRAYS = ()
+
+    DEFAULT_LEVELS = (
+        ("currency", "payment_method"),
+        ("currency", "payment_method", "bin"),
+        ("currency", "payment_method", "bin", "merchant_id"),
+    )
+
+    def __init__(
+        self,
+        gateways: List[str],
+        levels: Sequence[Tuple[str, ...]] = DEFAULT_LEVELS,
+        min_observations: int = 20,
+        capacity: int = 100_000,
+        ttl: float = 24 * 3600,
+        seed: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(gateways, seed=seed)
+        self.levels = [tuple(level) for level in levels]
+        self.min_observations = min_observations
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+
+        # _slab[slot, 0] holds alpha and _slab[slot, 1] beta for every gateway
+        self._slab = np.ones((capacity, 2, len(self.gateways)), dtype=np.float32)
+        self._observations = np.zeros(capacity, dtype=np.int64)
+        self._last_update = np.zeros(capacity, dtype=np.float64)
+        # bucket key -> slot, ordered from least to most recently used
+        self._slots: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._free = list(range(capacity - 1, -1, -1))
+
+    def _bucket_keys(self, context: Dict[str, Any]) -> Iterator[Tuple]:
+        # Yields keys from the finest level to the coarsest; levels whose
+        # fields are missing from the context are skipped.
+        for level in range(len(self.levels) - 1, -1, -1):
+            values = tuple(context.get(field) for field in self.levels[level])
+            if None not in values:
+                yield (level,) + values
+
+    def _lookup(self, key: Tuple, now: float) -> Optional[int]:
+        slot = self._slots.get(key)
+        if slot is None:
+            return None
+        if now - self._last_update[slot] > self.ttl:
+            del self._slots[key]
+            self._free.append(slot)
+            return None
+        self._slots.move_to_end(key)
+        return slot
+
+    def _acquire(self, key: Tuple, now: float) -> int:
+        slot = self._lookup(key, now)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                _, slot = self._slots.popitem(last=False)
+            self._slab[slot] = 1.0
+            self._observations[slot] = 0
+            self._slots[key] = slot
+        self._last_update[slot] = now
+        return slot
+
+    def _posterior(self, context: Optional[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        if context:
+            now = self.clock()
+            for key in self._bucket_keys(context):
+                slot = self._lookup(key, now)
+                if slot is not None and self._observations[slot] >= self.min_observations:
+                    return self._slab[slot, 0], self._slab[slot, 1]
+        return self.alpha, self.beta
+
+    def select_batch(self, n: int, contexts: Optional[Sequence[Dict[str, Any]]] = None) -> List[str]:
+        if contexts is None:
+            return super().select_batch(n)
+        posteriors = [self._posterior(context) for context in contexts[:n]]
+        alpha = np.stack([a for a, _ in posteriors])
+        beta = np.stack([b for _, b in posteriors])
+        return self._names[self._sample_utility(alpha, beta, alpha.shape).argmax(axis=1)].tolist()
+
+    def update(self, gateway: str, success: bool, context: Optional[Dict[str, Any]] = None):
+        i = self.index.get(gateway)
+        if i is None:
+            return
+        super().update(gateway, success)
+        if not context:
+            return
+
+        now = self.clock()
+        row = 0 if success else 1
+        for key in self._bucket_keys(context):
+            slot = self._acquire(key, now)
+            self._slab[slot, row, i] += 1
+            self._observations[slot] += 1
+
+    def update_many(
+        self,
+        gateways: Sequence[str],
+        outcomes: Sequence[bool],
+        contexts: Optional[Sequence[Dict[str, Any]]] = None,
+    ):
+        if contexts is None:
+            return super().update_many(gateways, outcomes)
+        for gateway, success, context in zip(gateways, outcomes, contexts):
+            self.update(gateway, bool(success), context)
+
+    def get_context_stats(self) -> Dict[str, int]:
+        return {"buckets": len(self._slots), "capacity": self.capacity}
+
+    # Bucket keys are stored as one UTF-8 string per bucket: level and field
+    # values joined by a separator that cannot occur in them.
+    _KEY_SEP = "\x1f"
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        state = super().export_state()
+        # One copy of the table (a single C-level pass under the GIL): the
+        # event loop inserts and reorders buckets while a snapshot thread
+        # exports, and separate keys()/values() passes could pair them up wrong
+        items = list(self._slots.items())
+        keys = [key for key, _ in items]
+        slots = np.fromiter((slot for _, slot in items), dtype=np.intp, count=len(items))
+        sep = self._KEY_SEP
+        state["bucket_keys"] = np.array([sep.join(map(str, key)).encode() for key in keys], dtype=bytes)
+        state["bucket_slab"] = self._slab[slots]
+        state["bucket_observations"] = self._observations[slots]
+        # Monotonic timestamps mean nothing in another process; keep ages
+        state["bucket_age"] = self.clock() - self._last_update[slots]
+        return state
+
+    def load_state(self, state: Dict[str, np.ndarray], prior_decay: float = 1.0):
+        super().load_state(state, prior_decay)
+        self._slots.clear()
+        self._free = list(range(self.capacity - 1, -1, -1))
+        if "bucket_keys" not in state:
+            return
+
+        dst, src = self._match_gateways(state["gateways"])
+        # Buckets are exported least recently used first; keep the newest
+        keep = slice(max(0, len(state["bucket_keys"]) - self.capacity), None)
+        keys = state["bucket_keys"][keep].tolist()
+        n = len(keys)
+        slots = np.arange(n, dtype=np.intp)
+
+        self._slab[:n] = 1.0
+        self._slab[slots[:, None], :, dst[None, :]] = 1.0 + (state["bucket_slab"][keep][:, :, src].transpose(0, 2, 1) - 1.0) * prior_decay
+        self._observations[:n] = state["bucket_observations"][keep] * prior_decay
+        self._last_update[:n] = self.clock() - state["bucket_age"][keep]
+
+        sep = self._KEY_SEP
+        parts = (key.decode().split(sep) for key in keys)
+        self._slots.update(zip(((int(p[0]), *p[1:]) for p in parts), range(n)))
+        self._free = list(range(self.capacity - 1, n - 1, -1))
+
+
+class DiscountedThompsonRouter(ThompsonSamplingRouter):
+    """
+    Thompson sampling whose evidence decays exponentially with wall time.
+
+    Counts above the Beta(1, 1) prior lose half their weight every half_life
+    seconds, so a gateway that degrades is abandoned after a bounded amount
+    of recent evidence rather than after outweighing its whole history.
+    Decay is applied lazily, on the next read or write, from the timestamp of
+    the previous one.
+    """
+
+    SHARED_ARRAYS = ("alpha", "beta", "_last_decay", "latency_stats")
+    # Reads decay the posterior in place, so they are serialised too
+    SHARED_LOCKED = ("update", "update_many", "_posterior", "observe_latency")
+
+    def __init__(
+        self,
+        gateways: List[str],
+        half_life: float = 300.0,
+        seed: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(gateways, seed=seed)
+        self.half_life = half_life
+        self.clock = clock
+        self._decay_rate = np.log(2.0) / half_life
+        self._last_decay = np.array([clock()])
+
+    def _decay(self):
+        now = self.clock()
+        elapsed = now - self._last_decay[0]
+        if elapsed <= 0:
+            return
+        factor = np.exp(-self._decay_rate * elapsed)
+        # Shrink towards the prior, not towards zero
+        self.alpha -= 1.0
+        self.alpha *= factor
+        self.alpha += 1.0
+        self.beta -= 1.0
+        self.beta *= factor
+        self.beta += 1.0
+        self._last_decay[0] = now
+
+    def _posterior(self, context: Optional[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+        self._decay()
+        return self.alpha, self.beta
+
+    def update(self, gateway: str, success: bool, context: Optional[Dict[str, Any]] = None):
+        self._decay()
+        super().update(gateway, success)
+
+    def update_many(self, gateways: Sequence[str], outcomes: Sequence[bool]):
+        self._decay()
+        super().update_many(gateways, outcomes)
+
+    def load_state(self, state: Dict[str, np.ndarray], prior_decay: float = 1.0):
+        super().load_state(state, prior_decay)
+        # Decay resumes from now rather than from a foreign clock
+        self._last_decay[0] = self.clock()
+
+
+class SlidingWindowThompsonRouter(ThompsonSamplingRouter):
+    """
+    Thompson sampling over each gateway's last `window` outcomes.
+
+    Outcomes are kept in a per-gateway ring buffer; recording one adds it to
+    the posterior and retracts the outcome it overwrites, so updates are O(1).
+    """
+
+    SHARED_ARRAYS = ("alpha", "beta", "_ring", "_cursor", "latency_stats")
+
+    def __init__(self, gateways: List[str], window: int = 500, seed: Optional[int] = None):
+        super().__init__(gateways, seed=seed)
+        self.window = window
+        self._ring = np.zeros((len(self.gateways), window), dtype=np.int8)
+        self._cursor = np.zeros(len(self.gateways), dtype=np.int64)
+
+    def update(self, gateway: str, success: bool, context: Optional[Dict[str, Any]] = None):
+        i = self.index.get(gateway)
+        if i is None:
+            return
+
+        cursor = self._cursor[i]
+        pos = cursor % self.window
+        if cursor >= self.window:
+            # Retract the outcome falling out of the window
+            if self._ring[i, pos]:
+                self.alpha[i] -= 1
+            else:
+                self.beta[i] -= 1
+        self._ring[i, pos] = 1 if success else 0
+        self._cursor[i] = cursor + 1
+        super().update(gateway, success)
+
+    def update_many(self, gateways: Sequence[str], outcomes: Sequence[bool]):
+        for gateway, success in zip(gateways, outcomes):
+            self.update(gateway, bool(success))
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        state = super().export_state()
+        state["ring"] = self._ring.copy()
+        state["cursor"] = self._cursor.copy()
+        return state
+
+    def load_state(self, state: Dict[str, np.ndarray], prior_decay: float = 1.0):
+        # The posterior must stay equal to the ring contents, so the window is
+        # restored as-is (prior_decay does not apply) and only when its size
+        # matches; otherwise start cold.
+        if "ring" not in state or state["ring"].shape[1] != self.window:
+            return
+        dst, src = self._match_gateways(state["gateways"])
+        self.alpha[dst] = state["alpha"][src]
+        self.beta[dst] = state["beta"][src]
+        self._ring[dst] = state["ring"][src]
+        self._cursor[dst] = state["cursor"][src]
+        self._load_latency(state, dst, src, prior_decay)
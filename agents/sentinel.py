@@ -1,60 +1,276 @@
+import struct
 import time
-from typing import Dict, List
+import numpy as np
+from typing import Callable, Dict, List, Any, Optional
+
+STATUSES = ("CLOSED", "OPEN", "HALF_OPEN")
+
+
+def local_alloc(fmt: str, n: int) -> memoryview:
+    """Process-local zeroed storage; see core.shared_state for the shared kind."""
+    return memoryview(bytearray(n * struct.calcsize(fmt))).cast(fmt)
+
+
+# Window and breaker state lives in flat memoryviews whose all-zero contents
+# are the initial state, so it can be placed in shared memory unchanged.
+
+class RingWindow:
+    """
+    Last `size` outcomes of a gateway in a fixed ring buffer, with running
+    totals so recording and checking are O(1).
+    """
+    __slots__ = ("size", "buf", "meta")
+    FIELDS = ("buf", "meta")
+
+    def __init__(self, size: int, alloc: Callable[[str, int], memoryview] = local_alloc):
+        self.size = size
+        self.buf = alloc("B", size)  # 1 = failure
+        self.meta = alloc("q", 3)    # [pos, total, failures]
+
+    def record(self, success: bool, now: float):
+        meta = self.meta
+        pos = meta[0]
+        failed = 0 if success else 1
+        if meta[1] == self.size:
+            meta[2] -= self.buf[pos]
+        else:
+            meta[1] += 1
+        self.buf[pos] = failed
+        meta[2] += failed
+        meta[0] = (pos + 1) % self.size
+
+    def counts(self, now: float):
+        return self.meta[1], self.meta[2]
+
+    def reset(self):
+        self.buf[:] = bytes(self.size)
+        self.meta[0] = self.meta[1] = self.meta[2] = 0
+
+    def to_list(self) -> List[bool]:
+        # Oldest first, True = success (the format the dashboard shows)
+        pos, total, _ = self.meta
+        start = (pos - total) % self.size
+        return [not self.buf[(start + i) % self.size] for i in range(total)]
+
+
+class TimeBucketWindow:
+    """
+    Outcomes from the last `seconds`, split into `num_buckets` time buckets.
+
+    Buckets that slide out of the window are cleared as time advances, each
+    at most once, so record and check are O(1) amortized at any request rate.
+    """
+    __slots__ = ("width", "num_buckets", "totals", "fails", "meta")
+    FIELDS = ("totals", "fails", "meta")
+
+    def __init__(self, seconds: float, num_buckets: int, alloc: Callable[[str, int], memoryview] = local_alloc):
+        self.width = seconds / num_buckets
+        self.num_buckets = num_buckets
+        self.totals = alloc("q", num_buckets)
+        self.fails = alloc("q", num_buckets)
+        # [started, epoch, total, failures]; epoch is the absolute number of
+        # the newest bucket, and bucket e lives in slot e % num_buckets
+        self.meta = alloc("q", 4)
+
+    def _advance(self, now: float) -> int:
+        meta = self.meta
+        epoch = int(now // self.width)
+        if not meta[0]:
+            meta[0] = 1
+            meta[1] = epoch
+        elif epoch > meta[1]:
+            for e in range(max(meta[1] + 1, epoch - self.num_buckets + 1), epoch + 1):
+                i = e % self.num_buckets
+                meta[2] -= self.totals[i]
+                meta[3] -= self.fails[i]
+                self.totals[i] = 0
+                self.fails[i] = 0
+            meta[1] = epoch
+        return meta[1]
+
+    def record(self, success: bool, now: float):
+        i = self._advance(now) % self.num_buckets
+        self.totals[i] += 1
+        self.meta[2] += 1
+        if not success:
+            self.fails[i] += 1
+            self.meta[3] += 1
+
+    def counts(self, now: float):
+        self._advance(now)
+        return self.meta[2], self.meta[3]
+
+    def reset(self):
+        for i in range(self.num_buckets):
+            self.totals[i] = 0
+            self.fails[i] = 0
+        for i in range(4):
+            self.meta[i] = 0
+
+    def to_list(self) -> List[Dict[str, int]]:
+        # Oldest bucket first
+        started, epoch, _, _ = self.meta
+        if not started:
+            return []
+        buckets = []
+        for e in range(epoch - self.num_buckets + 1, epoch + 1):
+            i = e % self.num_buckets
+            buckets.append({"total": self.totals[i], "failures": self.fails[i]})
+        return buckets
+
+
+class BreakerState:
+    """Status, last trip time and outcome window of one gateway's breaker."""
+    __slots__ = ("code", "ts", "window")
+
+    def __init__(self, window, alloc: Callable[[str, int], memoryview] = local_alloc):
+        self.code = alloc("q", 1)
+        self.ts = alloc("d", 1)
+        self.window = window
+
+    @property
+    def status(self) -> str:
+        return STATUSES[self.code[0]]
+
+    @status.setter
+    def status(self, value: str):
+        self.code[0] = STATUSES.index(value)
+
+    @property
+    def last_failure_ts(self) -> float:
+        return self.ts[0]
+
+    @last_failure_ts.setter
+    def last_failure_ts(self, value: float):
+        self.ts[0] = value
+
 
 class CircuitBreakerSentinel:
-    def __init__(self, failure_threshold: float = 0.5, recovery_timeout: int = 30, window_size: int = 10):
+    def __init__(
+        self,
+        failure_threshold: float = 0.5,
+        recovery_timeout: int = 30,
+        window_size: int = 10,
+        window_seconds: Optional[float] = None,
+        num_buckets: int = 10,
+        min_requests: Optional[int] = None,
+        gateways: Optional[List[str]] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        """
+        By default each gateway is judged on its last window_size outcomes.
+        With window_seconds set it is judged on outcomes from the last
+        window_seconds instead (in num_buckets buckets), which behaves the
+        same at 10 rps and 10k rps; the breaker then needs min_requests
+        outcomes in the window (default window_size) before it can trip.
+        """
         self.failure_threshold = failure_threshold
         self.recovery_timeout = recovery_timeout
         self.window_size = window_size
-        
-        # State: map gateway -> {state: "OPEN"|"CLOSED"|"HALF_OPEN", last_failure: ts, window: [bool]}
+        self.window_seconds = window_seconds
+        self.num_buckets = num_buckets
+        self.min_requests = min_requests if min_requests is not None else window_size
+        self.clock = clock
+        # Storage for breaker state; core.shared_state swaps in shared memory
+        self.alloc = local_alloc
+
+        # State: map gateway -> BreakerState(status, last_failure_ts, window)
         self.state = {}
-    
+        for gw in gateways or []:
+            self._gateway_state(gw)
+
+    def _new_window(self):
+        if self.window_seconds:
+            return TimeBucketWindow(self.window_seconds, self.num_buckets, self.alloc)
+        return RingWindow(self.window_size, self.alloc)
+
+    def _gateway_state(self, gateway: str) -> BreakerState:
+        gs = self.state.get(gateway)
+        if gs is None:
+            gs = self.state[gateway] = BreakerState(self._new_window(), self.alloc)
+        return gs
+
     def get_status(self, gateway: str) -> str:
-        if gateway not in self.state:
-            self.state[gateway] = {"status": "CLOSED", "last_failure_ts": 0, "window": []}
-        
-        state = self.state[gateway]
-        
-        if state["status"] == "OPEN":
-            if time.time() - state["last_failure_ts"] > self.recovery_timeout:
-                state["status"] = "HALF_OPEN"
+        state = self.state.get(gateway)
+        if state is None:
+            return "CLOSED"
+
+        status = state.status
+        if status == "OPEN":
+            if self.clock() - state.last_failure_ts > self.recovery_timeout:
+                state.status = "HALF_OPEN"
                 return "HALF_OPEN"
             return "OPEN"
-            
-        return state["status"]
-    
+
+        return status
+
     def record_result(self, gateway: str, success: bool):
-        if gateway not in self.state:
-            self.state[gateway] = {"status": "CLOSED", "last_failure_ts": 0, "window": []}
-            
-        gs = self.state[gateway]
-        
-        if gs["status"] == "HALF_OPEN":
+        gs = self._gateway_state(gateway)
+        now = self.clock()
+
+        if gs.status == "HALF_OPEN":
             if success:
-                gs["status"] = "CLOSED"
-                gs["window"] = [True]
+                gs.status = "CLOSED"
+                gs.window.reset()
+                gs.window.record(True, now)
             else:
-                gs["status"] = "OPEN"
-                gs["last_failure_ts"] = time.time()
+                gs.status = "OPEN"
+                gs.last_failure_ts = now
             return
 
         # Slide window
-        gs["window"].append(success)
-        if len(gs["window"]) > self.window_size:
-            gs["window"].pop(0)
-            
+        window = gs.window
+        window.record(success, now)
+
         # Check threshold
-        failures = len([x for x in gs["window"] if not x])
-        total = len(gs["window"])
-        
-        if total >= self.window_size and (failures / total) > self.failure_threshold:
-            gs["status"] = "OPEN"
-            gs["last_failure_ts"] = time.time()
+        total, failures = window.counts(now)
+
+        if total >= self.min_requests and (failures / total) > self.failure_threshold:
+            gs.status = "OPEN"
+            gs.last_failure_ts = now
 
     def get_all_statuses(self) -> Dict[str, Any]:
         """Returns the full state of all circuit breakers."""
         # Refresh statuses to catch timeouts
-        for gw in list(self.state.keys()):
-            self.get_status(gw)
-        return self.state
+        now = self.clock()
+        statuses = {}
+        for gw, gs in list(self.state.items()):
+            total, failures = gs.window.counts(now)
+            statuses[gw] = {
+                "status": self.get_status(gw),
+                "last_failure_ts": gs.last_failure_ts,
+                "window": gs.window.to_list(),
+                "total": total,
+                "failures": failures,
+            }
+        return statuses
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        """Copy of every breaker as flat arrays, for snapshots."""
+        gateways = list(self.state.keys())
+        state = {
+            "gateways": np.array(gateways, dtype=str),
+            "status": np.array([self.state[gw].code[0] for gw in gateways], dtype=np.int8),
+            "last_failure_ts": np.array([self.state[gw].last_failure_ts for gw in gateways], dtype=np.float64),
+        }
+        window_cls = TimeBucketWindow if self.window_seconds else RingWindow
+        for field in window_cls.FIELDS:
+            state[f"window_{field}"] = np.array([np.array(getattr(self.state[gw].window, field)) for gw in gateways])
+        return state
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        """
+        Restores exported breakers in place. Windows are restored only when
+        the snapshot was taken with the same window configuration.
+        """
+        for j, gw in enumerate(state["gateways"].tolist()):
+            gs = self._gateway_state(gw)
+            gs.code[0] = int(state["status"][j])
+            gs.last_failure_ts = float(state["last_failure_ts"][j])
+
+            window = gs.window
+            saved = [state.get(f"window_{field}") for field in window.FIELDS]
+            if any(arr is None or arr[j].shape != (len(getattr(window, field)),) for field, arr in zip(window.FIELDS, saved)):
+                continue
+            for field, arr in zip(window.FIELDS, saved):
+                np.asarray(getattr(window, field))[:] = arr[j]
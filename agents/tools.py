@@ -1,13 +1,26 @@
 from agents.mocks import GATEWAYS
 from typing import Dict, Any
 
+def _gateway_not_found(gateway_name: str) -> Dict[str, Any]:
+    return {
+        "status": "error",
+        "gateway": gateway_name,
+        "latency_ms": 0,
+        "error_code": "GATEWAY_NOT_FOUND"
+    }
+
 def execute_payment(gateway_name: str, amount: float, currency: str) -> Dict[str, Any]:
     if gateway_name not in GATEWAYS:
-        return {
-            "status": "error",
-            "gateway": gateway_name,
-            "latency_ms": 0,
-            "error_code": "GATEWAY_NOT_FOUND"
-        }
+        return _gateway_not_found(gateway_name)
     
     return GATEWAYS[gateway_name].process_payment(amount, currency)
+
+async def aexecute_payment(gateway_name: str, amount: float, currency: str) -> Dict[str, Any]:
+    """
+    Async counterpart of execute_payment, used by the ainvoke path so an
+    in-flight gateway call does not pin a worker thread.
+    """
+    if gateway_name not in GATEWAYS:
+        return _gateway_not_found(gateway_name)
+    
+    return await GATEWAYS[gateway_name].aprocess_payment(amount, currency)
@@ -0,0 +1,90 @@
+"""
+Sync vs async throughput of the payment graph at a fixed gateway latency.
+
+The sync path mirrors a sync FastAPI handler: payment_graph.invoke runs on a
+bounded threadpool (anyio's default is 40 threads). The async path mirrors the
+async handler: payment_graph.ainvoke on a single event loop.
+
+    python -m benchmarks.async_throughput --requests 2000 --latency 0.2
+"""
+import argparse
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from agents.mocks import GATEWAYS
+from core.graph import payment_graph
+from core.state import AgentState
+
+
+def make_state(i: int) -> AgentState:
+    tx_id = f"bench-{i}"
+    return AgentState(
+        transaction_id=tx_id,
+        payment_context={
+            "transaction_id": tx_id,
+            "amount": 100.0,
+            "currency": "USD",
+            "payment_method": "credit_card",
+            "merchant_id": "bench_merchant",
+        },
+        route_decision=None,
+        intervention_plan=None,
+        attempt_count=0,
+        last_error=None,
+        success=False,
+        history=[]
+    )
+
+
+def pin_gateways(latency: float):
+    # Deterministic gateways: fixed latency, always succeed, so every
+    # request is exactly one gateway round trip.
+    for gw in GATEWAYS.values():
+        gw.success_rate = 1.0
+        gw.latency_mean = latency
+        gw.latency_std = 0.0
+
+
+def run_sync(n: int, threads: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda i: payment_graph.invoke(make_state(i)), range(n)))
+    return n / (time.perf_counter() - start)
+
+
+async def run_async(n: int, concurrency: int) -> float:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with sem:
+            return await payment_graph.ainvoke(make_state(i))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return n / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.2, help="Gateway latency in seconds")
+    parser.add_argument("--threads", type=int, default=40, help="Threadpool size for the sync path")
+    parser.add_argument("--concurrency", type=int, default=2000, help="In-flight payments for the async path")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    pin_gateways(args.latency)
+
+    sync_rps = run_sync(args.requests, args.threads)
+    async_rps = asyncio.run(run_async(args.requests, args.concurrency))
+
+    print(f"gateway latency: {args.latency * 1000:.0f} ms, requests: {args.requests}")
+    print(f"sync  (invoke, {args.threads} threads):          {sync_rps:10.1f} req/s")
+    print(f"async (ainvoke, {args.concurrency} in flight):  {async_rps:10.1f} req/s")
+    print(f"speedup: {async_rps / sync_rps:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
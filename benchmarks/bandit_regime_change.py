@@ -0,0 +1,101 @@
+"""
+Regime-change benchmark for the stationary, discounted and sliding-window routers.
+
+Traffic arrives at a fixed rate on a virtual clock. After a warm-up period the
+best gateway degrades; we measure how long each router keeps sending it
+traffic (time-to-adapt) and how many attempts fail on it meanwhile (wasted
+attempts).
+
+    python -m benchmarks.bandit_regime_change --warmup 100000 --after 20000
+"""
+import argparse
+import logging
+from collections import deque
+
+import numpy as np
+
+from agents.router import (
+    ThompsonSamplingRouter,
+    DiscountedThompsonRouter,
+    SlidingWindowThompsonRouter,
+)
+
+GATEWAYS = ["Issuer_Alpha", "Issuer_Beta", "Issuer_Gamma"]
+BEFORE = {"Issuer_Alpha": 0.95, "Issuer_Beta": 0.90, "Issuer_Gamma": 0.85}
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def run(router, clock: VirtualClock, args, seed: int):
+    rng = np.random.default_rng(seed)
+    after = dict(BEFORE, Issuer_Alpha=args.degraded_rate)
+    recent = deque(maxlen=args.share_window)
+    adapted_at = None
+    wasted = 0
+    failures_after = 0
+
+    for step in range(args.warmup + args.after):
+        clock.now = step / args.rps
+        changed = step >= args.warmup
+        rates = after if changed else BEFORE
+
+        gw = router.select_gateway()
+        success = rng.random() < rates[gw]
+        router.update(gw, success)
+
+        if not changed:
+            continue
+        failures_after += not success
+        if gw == "Issuer_Alpha" and not success:
+            wasted += 1
+        recent.append(gw == "Issuer_Alpha")
+        if adapted_at is None and len(recent) == recent.maxlen and sum(recent) / len(recent) < args.share_threshold:
+            adapted_at = step - args.warmup
+
+    return adapted_at, wasted, failures_after
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--warmup", type=int, default=100_000, help="Transactions before the regime change")
+    parser.add_argument("--after", type=int, default=20_000, help="Transactions after the regime change")
+    parser.add_argument("--rps", type=float, default=100.0, help="Virtual arrival rate")
+    parser.add_argument("--degraded-rate", type=float, default=0.5, help="Issuer_Alpha success rate after the change")
+    parser.add_argument("--half-life", type=float, default=60.0)
+    parser.add_argument("--window", type=int, default=500)
+    parser.add_argument("--share-window", type=int, default=200)
+    parser.add_argument("--share-threshold", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    variants = {
+        "stationary": lambda clock: ThompsonSamplingRouter(GATEWAYS, seed=args.seed),
+        f"discounted (half-life {args.half_life:g}s)": lambda clock: DiscountedThompsonRouter(
+            GATEWAYS, half_life=args.half_life, seed=args.seed, clock=clock
+        ),
+        f"window ({args.window})": lambda clock: SlidingWindowThompsonRouter(GATEWAYS, window=args.window, seed=args.seed),
+    }
+
+    print(f"warmup={args.warmup} after={args.after} rps={args.rps:g} "
+          f"Issuer_Alpha {BEFORE['Issuer_Alpha']} -> {args.degraded_rate}")
+    print(f"{'router':32} {'adapt (tx)':>11} {'adapt (s)':>10} {'wasted':>8} {'fail rate':>10}")
+    for name, build in variants.items():
+        clock = VirtualClock()
+        adapted_at, wasted, failures = run(build(clock), clock, args, args.seed)
+        if adapted_at is None:
+            adapt_tx, adapt_s = "never", "-"
+        else:
+            adapt_tx, adapt_s = str(adapted_at), f"{adapted_at / args.rps:.1f}"
+        print(f"{name:32} {adapt_tx:>11} {adapt_s:>10} {wasted:>8} {failures / args.after:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+End-to-end throughput of the in-process mock broker: producer threads
+append messages in batches while several consumer groups each read the
+whole topic, with the ring small enough that producers are held back by
+the slowest group.
+
+    python -m benchmarks.broker_throughput --messages 2000000 --groups 3
+"""
+import argparse
+import threading
+import time
+
+from core.kafka import LocalBroker, MockKafkaConsumer, MockKafkaProducer
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=2_000_000)
+    parser.add_argument("--producers", type=int, default=2)
+    parser.add_argument("--groups", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=500, help="messages per producer call (1 = send())")
+    parser.add_argument("--fetch", type=int, default=500, help="max messages per consumer delivery")
+    parser.add_argument("--capacity", type=int, default=65_536)
+    args = parser.parse_args()
+
+    broker = LocalBroker(capacity=args.capacity)
+    per_producer = args.messages // args.producers
+    total = per_producer * args.producers
+    done = threading.Event()
+    counts = [0] * args.groups
+
+    def counter(g):
+        def on_batch(messages):
+            counts[g] += len(messages)
+            if all(c >= total for c in counts):
+                done.set()
+        return on_batch
+
+    consumers = [
+        MockKafkaConsumer("bench", counter(g), broker, group_id=f"group-{g}", batch=True, max_records=args.fetch)
+        for g in range(args.groups)
+    ]
+    for consumer in consumers:
+        consumer.start()
+
+    message = {"transaction_id": "tx", "merchant_id": "m", "amount": 10.0, "currency": "USD"}
+
+    def produce():
+        producer = MockKafkaProducer("bench", broker)
+        if args.batch == 1:
+            for _ in range(per_producer):
+                producer.send(message)
+            return
+        batch = [message] * args.batch
+        for _ in range(per_producer // args.batch):
+            producer.send_many(batch)
+        producer.send_many([message] * (per_producer % args.batch))
+
+    start = time.perf_counter()
+    producers = [threading.Thread(target=produce) for _ in range(args.producers)]
+    for t in producers:
+        t.start()
+    for t in producers:
+        t.join()
+    produced = time.perf_counter() - start
+    done.wait()
+    elapsed = time.perf_counter() - start
+    for consumer in consumers:
+        consumer.stop()
+
+    print(f"messages: {total}, producers: {args.producers}, groups: {args.groups}, batch: {args.batch}, fetch: {args.fetch}, ring: {args.capacity}")
+    print(f"produce throughput:    {total / produced:12,.0f} msg/s")
+    print(f"end-to-end throughput: {total / elapsed:12,.0f} msg/s (per group)")
+    print(f"deliveries:            {total * args.groups / elapsed:12,.0f} msg/s (all groups)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Latency and acceptance under overload, with and without per-gateway
+adaptive concurrency limits (core.bulkhead), through the real async payment
+graph and the mock gateways.
+
+The mock gateways answer any number of concurrent calls at the same
+latency, which no real gateway does. Here each one serves at most
+--capacity calls at a time (NAME=N, comma-separated) and queues the rest;
+a call queued past --gateway-timeout seconds fails with TIMEOUT, as an
+overloaded processor would. Payments arrive open-loop (Poisson, --rate per
+second) for --duration seconds per mode, from --merchants merchants;
+--tiers gives some of them a higher priority (NAME=TIER). The first
+--warmup seconds, while the limits settle, are left out of the results.
+
+Modes are "off" or LIMIT[:OVERFLOW], LIMIT aimd or gradient and OVERFLOW
+queue (the default) or reroute. Each starts from a fresh router, sentinel
+and set of bulkheads.
+
+    python -m benchmarks.bulkhead --rate 150 --duration 30 --modes off,aimd,gradient,gradient:reroute
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import core.graph as graph
+from agents.mocks import GATEWAYS, MockGateway
+from agents.router import ThompsonSamplingRouter
+from agents.sentinel import CircuitBreakerSentinel
+from core.bulkhead import Bulkheads
+from core.state import AgentState
+from ui.traffic import generate_mock_transaction
+
+QUANTILES = [50, 99]
+
+
+class SaturatingGateway(MockGateway):
+    """A mock gateway that serves a fixed number of calls at a time."""
+
+    def __init__(self, base: MockGateway, capacity: int, timeout: float):
+        super().__init__(base.name, base.success_rate, base.latency_mean, base.latency_std)
+        self.capacity = capacity
+        self.timeout = timeout
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def reset(self):
+        # A semaphore belongs to the event loop it is first used on
+        self._slots = asyncio.Semaphore(self.capacity)
+
+    async def aprocess_payment(self, amount: float, currency: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        async with self._slots:
+            waited = time.perf_counter() - started
+            if waited > self.timeout:
+                return {"status": "failure", "gateway": self.name, "latency_ms": waited * 1000, "error_code": "TIMEOUT"}
+            latency = self._sample_latency()
+            await asyncio.sleep(latency)
+        result = self._outcome(latency)
+        result["latency_ms"] = (time.perf_counter() - started) * 1000
+        return result
+
+
+def make_state(merchants: int) -> AgentState:
+    tx = generate_mock_transaction()
+    tx["merchant_id"] = f"merchant_{random.randint(1, merchants):03d}"
+    return AgentState(
+        transaction_id=tx["transaction_id"],
+        payment_context=tx,
+        route_decision=None,
+        intervention_plan=None,
+        attempt_count=0,
+        last_error=None,
+        success=False,
+        history=[]
+    )
+
+
+async def run_mode(mode: str, tiers: Dict[str, int], args) -> Dict[str, Any]:
+    graph.router = ThompsonSamplingRouter(graph.gateways)
+    graph.sentinel = CircuitBreakerSentinel(gateways=graph.gateways)
+    graph.bulkheads = None
+    if mode != "off":
+        limit, _, overflow = mode.partition(":")
+        graph.bulkheads = Bulkheads(
+            graph.gateways, mode=limit, overflow=overflow or "queue",
+            max_queue=args.queue, queue_timeout=args.queue_timeout, tiers=tiers,
+        )
+    for gw in GATEWAYS.values():
+        gw.reset()
+    random.seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    send_times = np.cumsum(rng.exponential(1.0 / args.rate, int(args.rate * args.duration * 1.2)))
+    send_times = send_times[send_times < args.duration]
+
+    rows: List[tuple] = []
+
+    async def one(offset: float):
+        started = time.perf_counter()
+        state = await graph.payment_graph.ainvoke(make_state(args.merchants))
+        tier = tiers.get(state["payment_context"]["merchant_id"], 0)
+        served = state["route_decision"] if state["last_error"] != "GATEWAY_BUSY" else "shed"
+        rows.append((offset, (time.perf_counter() - started) * 1000, state["success"], tier, served))
+
+    tasks = []
+    start = time.perf_counter()
+    for offset in send_times.tolist():
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(offset)))
+    await asyncio.gather(*tasks)
+
+    measured = [r for r in rows if r[0] >= args.warmup]
+    latency = np.array([r[1] for r in measured])
+    by_tier = {}
+    for tier in sorted({r[3] for r in measured}):
+        tier_latency = [r[1] for r in measured if r[3] == tier]
+        by_tier[tier] = dict(zip(QUANTILES, np.percentile(tier_latency, QUANTILES).tolist()))
+    share = Counter(r[4] for r in measured)
+    stats = graph.bulkheads.get_stats() if graph.bulkheads else None
+    return {
+        "payments": len(measured),
+        "acceptance": float(np.mean([r[2] for r in measured])),
+        "latency_ms": dict(zip(QUANTILES, np.percentile(latency, QUANTILES).tolist())),
+        "latency_ms_by_tier": by_tier,
+        "share": {k: v / len(measured) for k, v in share.items()},
+        "limits": {gw: s["limit"] for gw, s in stats["gateways"].items()} if stats else None,
+        "rerouted": stats["rerouted"] if stats else 0,
+        "shed": stats["shed"] if stats else 0,
+    }
+
+
+def parse_pairs(spec: str) -> Dict[str, int]:
+    return {name: int(value) for name, _, value in (item.partition("=") for item in spec.split(",") if item)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=150.0, help="payments/s")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per mode")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds left out of the results")
+    parser.add_argument("--modes", default="off,aimd,gradient,gradient:reroute")
+    parser.add_argument("--capacity", default="Issuer_Alpha=20,Issuer_Beta=30,Issuer_Gamma=30",
+                        help="concurrent calls each gateway serves")
+    parser.add_argument("--gateway-timeout", type=float, default=2.0, help="seconds a call may queue at the gateway")
+    parser.add_argument("--queue", type=int, default=100, help="bulkhead queue depth per gateway")
+    parser.add_argument("--queue-timeout", type=float, default=1.0, help="seconds a payment may wait in a bulkhead queue")
+    parser.add_argument("--merchants", type=int, default=4)
+    parser.add_argument("--tiers", default="merchant_001=1", help="merchant priority tiers, NAME=TIER")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    capacity = parse_pairs(args.capacity)
+    tiers = parse_pairs(args.tiers)
+    for name, gw in list(GATEWAYS.items()):
+        GATEWAYS[name] = SaturatingGateway(gw, capacity[name], args.gateway_timeout)
+
+    for mode in args.modes.split(","):
+        r = asyncio.run(run_mode(mode, tiers, args))
+        print(f"{mode}: {r['payments']} payments, acceptance {r['acceptance']:.4f}, "
+              f"p50 {r['latency_ms'][50]:.0f} ms, p99 {r['latency_ms'][99]:.0f} ms")
+        print("  share   " + ", ".join(f"{gw} {s:.1%}" for gw, s in sorted(r["share"].items())))
+        print("  by tier " + ", ".join(f"{tier}: p50 {q[50]:.0f} / p99 {q[99]:.0f} ms" for tier, q in r["latency_ms_by_tier"].items()))
+        if r["limits"]:
+            print("  limits  " + ", ".join(f"{gw} {limit:.1f}" for gw, limit in r["limits"].items())
+                  + f"; rerouted {r['rerouted']}, shed {r['shed']}")
+
+
+if __name__ == "__main__":
+    main()
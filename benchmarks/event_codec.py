@@ -0,0 +1,76 @@
+"""
+Encode/decode throughput and size of the event schemas: pydantic JSON vs
+the binary codec in data.schemas.codec, with validated and trusted decode.
+
+"json" decodes with model_validate_json, which needs the model up front;
+"json (bus)" is what an EventBus consumer does without it: json.loads,
+then model_validate. Rates are the best of three runs.
+
+    python -m benchmarks.event_codec --messages 100000
+"""
+import argparse
+import json
+import time
+
+from data.schemas import codec
+from data.schemas.events import Intervention, PaymentResult, TransactionEvent
+
+
+def sample_events(n: int):
+    return {
+        "TransactionEvent": [TransactionEvent(
+            transaction_id=f"6f1c2a9e-0b7d-4c1e-9a55-{i:012d}", merchant_id="merchant_001", amount=250.0,
+            currency="EUR", payment_method="credit_card", bin="424242",
+        ) for i in range(n)],
+        "PaymentResult": [PaymentResult(
+            transaction_id=f"6f1c2a9e-0b7d-4c1e-9a55-{i:012d}", gateway="Issuer_Beta", status="failure",
+            error_code="BANK_DECLINE", latency_ms=287.4,
+        ) for i in range(n)],
+        "Intervention": [Intervention(
+            transaction_id=f"6f1c2a9e-0b7d-4c1e-9a55-{i:012d}", action="retry_alternate",
+            reason="Generic bank decline. Attempting alternate premium route.",
+            parameters={"confidence": 0.6, "error_code": "BANK_DECLINE"},
+        ) for i in range(n)],
+    }
+
+
+def rate(fn, items) -> float:
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return len(items) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=100_000)
+    args = parser.parse_args()
+
+    print(f"messages per schema: {args.messages} (rates in thousands of msg/s)")
+    print(f"{'schema':18} {'format':12} {'bytes':>6} {'encode':>8} {'decode':>8} {'trusted':>8}")
+    for name, events in sample_events(args.messages).items():
+        model = type(events[0])
+        as_json = [e.model_dump_json().encode() for e in events]
+        as_binary = [codec.encode(e) for e in events]
+        json_decode = rate(model.model_validate_json, as_json)
+        json_encode = rate(model.model_dump_json, events)
+        print(
+            f"{name:18} {'json':12} {sum(map(len, as_json)) / len(events):6.0f} "
+            f"{json_encode / 1e3:8.0f} {json_decode / 1e3:8.0f} {'-':>8}"
+        )
+        print(
+            f"{'':18} {'json (bus)':12} {sum(map(len, as_json)) / len(events):6.0f} "
+            f"{json_encode / 1e3:8.0f} {rate(lambda raw: model.model_validate(json.loads(raw)), as_json) / 1e3:8.0f} {'-':>8}"
+        )
+        print(
+            f"{'':18} {'binary':12} {sum(map(len, as_binary)) / len(events):6.0f} "
+            f"{rate(codec.encode, events) / 1e3:8.0f} {rate(codec.decode, as_binary) / 1e3:8.0f} "
+            f"{rate(lambda raw: codec.decode(raw, trusted=True), as_binary) / 1e3:8.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Per-transaction orchestration overhead: LangGraph payment_graph vs the
+native executor, with zero-latency gateways so only framework and agent
+work is measured.
+
+    python -m benchmarks.executor_overhead --transactions 5000
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from agents.mocks import GATEWAYS, MockGateway
+from core.executor import native_payment_graph
+from core.graph import payment_graph
+from core.state import AgentState
+
+
+class ZeroLatencyGateway(MockGateway):
+    def _sample_latency(self) -> float:
+        return 0.0
+
+
+def make_state(i: int) -> AgentState:
+    tx_id = f"bench-{i}"
+    return AgentState(
+        transaction_id=tx_id,
+        payment_context={
+            "transaction_id": tx_id,
+            "amount": 100.0,
+            "currency": "USD",
+            "payment_method": "credit_card",
+            "merchant_id": "bench_merchant",
+        },
+        route_decision=None,
+        intervention_plan=None,
+        attempt_count=0,
+        last_error=None,
+        success=False,
+        history=[]
+    )
+
+
+def per_tx_us(invoke, n: int) -> float:
+    start = time.perf_counter()
+    for i in range(n):
+        invoke(make_state(i))
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def per_tx_us_async(ainvoke, n: int) -> float:
+    async def run():
+        start = time.perf_counter()
+        for i in range(n):
+            await ainvoke(make_state(i))
+        return (time.perf_counter() - start) / n * 1e6
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transactions", type=int, default=5000)
+    parser.add_argument("--success-rate", type=float, default=0.9)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    for name, gw in list(GATEWAYS.items()):
+        GATEWAYS[name] = ZeroLatencyGateway(name, args.success_rate, 0.0, 0.0, seed=0)
+
+    n = args.transactions
+    rows = [
+        ("payment_graph.invoke", per_tx_us(payment_graph.invoke, n)),
+        ("native.invoke", per_tx_us(native_payment_graph.invoke, n)),
+        ("payment_graph.ainvoke", per_tx_us_async(payment_graph.ainvoke, n)),
+        ("native.ainvoke", per_tx_us_async(native_payment_graph.ainvoke, n)),
+    ]
+    print(f"transactions: {n}, gateway success rate: {args.success_rate}")
+    for name, us in rows:
+        print(f"{name:24} {us:9.1f} us/tx")
+    print(f"invoke speedup:  {rows[0][1] / rows[1][1]:.1f}x")
+    print(f"ainvoke speedup: {rows[2][1] / rows[3][1]:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Tail latency against extra gateway load, with and without hedged attempts
+(core.hedging), through the real async payment graph and the mock gateways.
+
+Payments arrive open-loop (Poisson, --rate per second) for --duration
+seconds per mode; the first --warmup seconds, while the latency quantiles
+are learned, are left out of the results. Each mode starts from a fresh
+router, sentinel and hedger. "calls/payment" counts every gateway call
+started, including hedges that were later cancelled, so "extra load" is
+the cost of hedging relative to the first mode.
+
+The mock gateways' latencies are Gaussian, a tail hedging can do little
+about: past its p95 the primary is rarely slower than a fresh attempt
+elsewhere. --stall-rate makes that fraction of calls stall for one to three
+times --stall-seconds instead (a stuck connection, a slow issuer), the
+tail that hedging and deadlines are for. --scale multiplies every latency
+to shorten the run; results are reported at the scaled latencies.
+
+    python -m benchmarks.hedging --rate 100 --duration 30 --stall-rate 0.02 --deadline 2
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import core.graph as graph
+from agents.mocks import GATEWAYS, MockGateway
+from agents.router import ThompsonSamplingRouter
+from agents.sentinel import CircuitBreakerSentinel
+from core.hedging import Hedger
+from core.state import AgentState
+from ui.traffic import generate_mock_transaction
+
+QUANTILES = [50, 95, 99, 99.9]
+
+
+class StallingGateway(MockGateway):
+    """A mock gateway whose calls occasionally stall."""
+
+    def __init__(self, base: MockGateway, stall_rate: float, stall_seconds: float):
+        super().__init__(base.name, base.success_rate, base.latency_mean, base.latency_std)
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+
+    def _sample_latency(self) -> float:
+        if self.rng.random() < self.stall_rate:
+            return self.stall_seconds * self.rng.uniform(1.0, 3.0)
+        return super()._sample_latency()
+
+
+def make_state() -> AgentState:
+    tx = generate_mock_transaction()
+    return AgentState(
+        transaction_id=tx["transaction_id"],
+        payment_context=tx,
+        route_decision=None,
+        intervention_plan=None,
+        attempt_count=0,
+        last_error=None,
+        success=False,
+        history=[]
+    )
+
+
+async def run_mode(quantile: Optional[float], args) -> Dict[str, Any]:
+    graph.router = ThompsonSamplingRouter(graph.gateways)
+    graph.sentinel = CircuitBreakerSentinel(gateways=graph.gateways)
+    graph.hedger = Hedger(quantile=quantile, deadline=args.deadline, max_ratio=args.max_ratio)
+    random.seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    send_times = np.cumsum(rng.exponential(1.0 / args.rate, int(args.rate * args.duration * 1.2)))
+    send_times = send_times[send_times < args.duration]
+
+    rows: List[tuple] = []
+
+    async def one(offset: float):
+        started = time.perf_counter()
+        state = await graph.payment_graph.ainvoke(make_state())
+        calls = sum(1 for e in state["history"] if e["step"] in ("execute", "cancel", "void"))
+        rows.append((offset, (time.perf_counter() - started) * 1000, state["success"], calls))
+
+    tasks = []
+    start = time.perf_counter()
+    for offset in send_times.tolist():
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(offset)))
+    await asyncio.gather(*tasks)
+
+    measured = [r for r in rows if r[0] >= args.warmup]
+    latency = np.array([r[1] for r in measured])
+    stats = graph.hedger.get_stats()
+    return {
+        "payments": len(measured),
+        "acceptance": float(np.mean([r[2] for r in measured])),
+        "latency_ms": dict(zip(QUANTILES, np.percentile(latency, QUANTILES).tolist())),
+        "calls_per_payment": float(np.mean([r[3] for r in measured])),
+        "hedge_rate": stats["hedge_rate"],
+        "hedge_wins": stats["hedge_wins"],
+        "cancelled": stats["cancelled"],
+        "voided": stats["voided"],
+        "timeouts": stats["timeouts"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=100.0, help="payments/s")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per mode")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds left out of the results")
+    parser.add_argument("--modes", default="off,0.95,0.9", help="'off' or a hedge quantile, comma-separated")
+    parser.add_argument("--deadline", type=float, help="per-attempt deadline in seconds (scaled latencies)")
+    parser.add_argument("--max-ratio", type=float, default=0.1, help="hedges per attempt, at most")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="fraction of gateway calls that stall")
+    parser.add_argument("--stall-seconds", type=float, default=1.0)
+    parser.add_argument("--scale", type=float, default=1.0, help="gateway latency multiplier")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    for name, gw in list(GATEWAYS.items()):
+        gw.update_config(latency_mean=gw.latency_mean * args.scale, latency_std=gw.latency_std * args.scale)
+        if args.stall_rate:
+            GATEWAYS[name] = StallingGateway(gw, args.stall_rate, args.stall_seconds * args.scale)
+
+    print(f"{'mode':>6} {'payments':>9} {'accept':>7} " + " ".join(f"{f'p{q:g} ms':>9}" for q in QUANTILES)
+          + f" {'calls/pay':>9} {'extra':>6} {'hedged':>7} {'won':>5} {'timeouts':>8}")
+    baseline = None
+    for mode in args.modes.split(","):
+        quantile = None if mode == "off" else float(mode)
+        r = asyncio.run(run_mode(quantile, args))
+        baseline = baseline or r["calls_per_payment"]
+        print(f"{mode:>6} {r['payments']:9d} {r['acceptance']:7.4f} "
+              + " ".join(f"{v:9.0f}" for v in r["latency_ms"].values())
+              + f" {r['calls_per_payment']:9.3f} {r['calls_per_payment'] / baseline - 1:6.1%} "
+              f"{r['hedge_rate']:7.1%} {r['hedge_wins']:5d} {r['timeouts']:8d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Gateway calls and bandit updates saved by the idempotency cache
+(core.idempotency) on traffic with client retries and redelivered events,
+through the API's payment path (main.run_payment) and the mock gateways.
+
+Payments arrive open-loop (Poisson, --rate per second) for --duration
+seconds. A --dup-rate fraction of them is sent again: half as concurrent
+retries (within --retry-window seconds, while the first attempt is still in
+flight) and half as late redeliveries (up to --redelivery-window seconds
+later). "attempts" counts gateway calls, "router updates" outcomes the
+bandit learned from; without the cache both grow with the duplicates.
+--backend puts the cache records in a shared store (sqlite:///path).
+
+    python -m benchmarks.idempotency --rate 100 --duration 20 --dup-rate 0.3
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import main as api
+import core.graph as graph
+from agents.router import ThompsonSamplingRouter
+from agents.sentinel import CircuitBreakerSentinel
+from core.idempotency import IdempotencyCache, open_backend
+from core.metrics import MetricsAggregator
+from ui.traffic import generate_mock_transaction
+
+QUANTILES = [50, 99]
+
+
+async def run_mode(mode: str, args) -> Dict[str, Any]:
+    graph.router = ThompsonSamplingRouter(graph.gateways)
+    graph.sentinel = CircuitBreakerSentinel(gateways=graph.gateways)
+    graph.metrics = MetricsAggregator()
+    api.idempotency = None
+    if mode != "off":
+        backend: Optional[Any] = None
+        if mode == "shared":
+            if args.backend.startswith("sqlite://"):
+                # Start from an empty store
+                path = args.backend[len("sqlite://"):]
+                for suffix in ("", "-wal", "-shm"):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+            backend = open_backend(args.backend)
+        api.idempotency = IdempotencyCache(backend=backend)
+    prior = float(graph.router.alpha.sum() + graph.router.beta.sum())
+
+    rng = np.random.default_rng(args.seed)
+    random.seed(args.seed)
+    send_times = np.cumsum(rng.exponential(1.0 / args.rate, int(args.rate * args.duration * 1.2)))
+    send_times = send_times[send_times < args.duration]
+    sends = []
+    for offset in send_times.tolist():
+        tx = api.TransactionRequest(**generate_mock_transaction())
+        sends.append((offset, tx, False))
+        if rng.random() < args.dup_rate:
+            window = args.retry_window if rng.random() < 0.5 else args.redelivery_window
+            sends.append((offset + rng.uniform(0, window), tx, True))
+    sends.sort(key=lambda s: s[0])
+
+    rows: List[tuple] = []
+
+    async def one(tx, duplicate: bool):
+        started = time.perf_counter()
+        await api.run_payment(tx, compact=True)
+        rows.append(((time.perf_counter() - started) * 1000, duplicate))
+
+    tasks = []
+    start = time.perf_counter()
+    for offset, tx, duplicate in sends:
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(tx, duplicate)))
+    await asyncio.gather(*tasks)
+
+    latency = {kind: np.percentile([r[0] for r in rows if r[1] == kind], QUANTILES).tolist() for kind in (False, True)}
+    return {
+        "payments": len(send_times),
+        "requests": len(rows),
+        "attempts": graph.metrics.snapshot(args.duration * 2 + args.redelivery_window)["total"]["attempts"],
+        "router_updates": float(graph.router.alpha.sum() + graph.router.beta.sum()) - prior,
+        "first_ms": dict(zip(QUANTILES, latency[False])),
+        "duplicate_ms": dict(zip(QUANTILES, latency[True])),
+        "cache": api.idempotency.get_stats() if api.idempotency else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=100.0, help="unique payments/s")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--dup-rate", type=float, default=0.3, help="fraction of payments sent twice")
+    parser.add_argument("--retry-window", type=float, default=0.2, help="seconds; concurrent retries")
+    parser.add_argument("--redelivery-window", type=float, default=5.0, help="seconds; late redeliveries")
+    parser.add_argument("--modes", default="off,local,shared", help="off, local (in-process) or shared (--backend)")
+    parser.add_argument("--backend", default="sqlite:///tmp/idempotency-bench.db")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    print(f"{'mode':>6} {'payments':>9} {'requests':>9} {'attempts':>9} {'router upd':>10} "
+          f"{'first p50/p99 ms':>17} {'dup p50/p99 ms':>15} {'hits':>6} {'coalesced':>9}")
+    for mode in args.modes.split(","):
+        r = asyncio.run(run_mode(mode, args))
+        cache = r["cache"] or {"hits": 0, "coalesced": 0}
+        print(f"{mode:>6} {r['payments']:9d} {r['requests']:9d} {r['attempts']:9d} {r['router_updates']:10.0f} "
+              f"{r['first_ms'][50]:8.0f}/{r['first_ms'][99]:<8.0f} {r['duplicate_ms'][50]:6.0f}/{r['duplicate_ms'][99]:<8.0f} "
+              f"{cache['hits']:6d} {cache['coalesced']:9d}")
+
+
+if __name__ == "__main__":
+    main()
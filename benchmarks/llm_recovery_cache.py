@@ -0,0 +1,80 @@
+"""
+Latency added per failure by LLM-mode recovery, with and without the
+decision cache and micro-batching, against the offline stand-in model.
+
+Failures arrive from `--concurrency` concurrent payments, with error codes
+drawn like MockGateway's and up to two earlier errors per payment.
+
+    python -m benchmarks.llm_recovery_cache --failures 5000 --model-latency 0.3
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+
+import numpy as np
+
+from agents.llm_recovery import LLMRecoveryAgent, LocalStandInModel
+
+ERRORS = ["TIMEOUT", "INSUFFICIENT_FUNDS", "BANK_DECLINE", "FRAUD_BLOCK"]
+GATEWAYS = ["Issuer_Alpha", "Issuer_Beta", "Issuer_Gamma"]
+
+
+def make_failure(rng: random.Random):
+    history = []
+    for _ in range(rng.randint(1, 3)):
+        history.append({"step": "route", "gateway": rng.choice(GATEWAYS), "status": "CLOSED"})
+        history.append({"step": "execute", "result": "failed", "error": rng.choice(ERRORS)})
+    return history[-1]["error"], history
+
+
+async def run(agent: LLMRecoveryAgent, failures, concurrency: int):
+    latencies = []
+    queue = list(reversed(failures))
+
+    async def payment_loop():
+        while queue:
+            error_code, history = queue.pop()
+            start = time.perf_counter()
+            await agent.aanalyze_failure(error_code, history)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(payment_loop() for _ in range(concurrency)))
+    return np.array(latencies) * 1000, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--failures", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--model-latency", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    rng = random.Random(args.seed)
+    failures = [make_failure(rng) for _ in range(args.failures)]
+    model = LocalStandInModel(latency=args.model_latency)
+
+    configs = [
+        # One model call per distinct in-flight failure, nothing remembered
+        ("per-failure call", dict(cache_ttl=0, batch_window=0, max_batch=1, max_inflight=args.concurrency)),
+        ("batched, no cache", dict(cache_ttl=0)),
+        ("cached + batched", dict()),
+    ]
+    print(f"failures: {args.failures}, concurrency: {args.concurrency}, model latency: {args.model_latency * 1000:.0f} ms")
+    print(f"{'mode':20} {'hit rate':>9} {'calls':>7} {'batch':>6} {'mean ms':>9} {'p99 ms':>9} {'failures/s':>11}")
+    for name, kwargs in configs:
+        agent = LLMRecoveryAgent(model, **kwargs)
+        latencies, elapsed = asyncio.run(run(agent, failures, args.concurrency))
+        stats = agent.get_stats()
+        print(
+            f"{name:20} {stats['hit_rate']:9.1%} {stats['model_calls']:7d} {stats['avg_batch_size']:6.1f} "
+            f"{latencies.mean():9.2f} {np.percentile(latencies, 99):9.1f} {len(failures) / elapsed:11.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
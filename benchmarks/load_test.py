@@ -0,0 +1,291 @@
+"""
+Open-loop load generator for the payment API, with a JSON latency report.
+
+Requests are issued on a precomputed schedule (Poisson or evenly spaced
+arrivals), whatever the state of earlier requests, over --connections
+reused keep-alive connections. Latency is measured from each request's
+scheduled send time, not from when it was actually sent, so time spent
+waiting for a free connection behind a slow server, or behind a generator
+that fell behind, is counted instead of omitted. "service_ms" is the
+uncorrected time from actual send to response, for comparison.
+
+A connection idle for more than --idle-timeout seconds is reopened before
+its next request, and a request the server closed a reused connection on
+before answering (its keep-alive timeout ran out) is sent again once on a
+fresh one; only a failure on a fresh connection counts as an error.
+"reconnects" counts those resends.
+
+Profiles, at --rate requests/s over --duration seconds:
+  constant  --rate throughout
+  ramp      linear from --start-rate to --rate
+  spike     --rate, times --spike-factor for --spike-seconds starting at --spike-at
+
+    python -m benchmarks.load_test --url http://localhost:8000 --rate 200 --duration 60 --profile spike
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from ui.traffic import generate_mock_transaction
+
+QUANTILES = {"p50": 50, "p90": 90, "p99": 99, "p999": 99.9}
+
+
+def rate_at(t: np.ndarray, args) -> np.ndarray:
+    """Target arrival rate (requests/s) at times t."""
+    if args.profile == "ramp":
+        return args.start_rate + (args.rate - args.start_rate) * t / args.duration
+    rate = np.full_like(t, float(args.rate))
+    if args.profile == "spike":
+        during = (t >= args.spike_at) & (t < args.spike_at + args.spike_seconds)
+        rate[during] *= args.spike_factor
+    return rate
+
+
+def schedule(args, rng: np.random.Generator) -> np.ndarray:
+    """
+    Send times in seconds from the start. Arrivals are generated at unit
+    rate in "operational time" (the integral of the target rate) and mapped
+    back, which gives a Poisson process with a time-varying rate.
+    """
+    grid = np.linspace(0.0, args.duration, int(args.duration * 1000) + 1)
+    rates = rate_at(grid, args)
+    cumulative = np.concatenate(([0.0], np.cumsum((rates[1:] + rates[:-1]) / 2 * np.diff(grid))))
+    if args.arrivals == "poisson":
+        # Expected count plus slack; arrivals past the end are cut off
+        n = int(cumulative[-1] + 10 * np.sqrt(cumulative[-1]) + 10)
+        points = np.cumsum(rng.exponential(1.0, n))
+    else:
+        points = np.arange(1, int(cumulative[-1]) + 1, dtype=float)
+    points = points[points < cumulative[-1]]
+    return np.interp(points, cumulative, grid)
+
+
+def summarize(values: np.ndarray) -> Dict[str, Optional[float]]:
+    if not len(values):
+        return {"mean": None, **{name: None for name in QUANTILES}, "max": None}
+    percentiles = np.percentile(values, list(QUANTILES.values()))
+    return {
+        "mean": round(float(values.mean()), 3),
+        **{name: round(float(v), 3) for name, v in zip(QUANTILES, percentiles)},
+        "max": round(float(values.max()), 3),
+    }
+
+
+class Connection:
+    """
+    One keep-alive HTTP/1.1 connection, with just enough HTTP for the API's
+    JSON responses. Much cheaper per request than a pooled general-purpose
+    client, so the generator is not the bottleneck.
+    """
+
+    def __init__(self, url: str, idle_timeout: float = 4.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.ssl = parts.scheme == "https"
+        self.port = parts.port or (443 if self.ssl else 80)
+        self.idle_timeout = idle_timeout
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.last_used = 0.0
+        self.reconnects = 0
+
+    async def _send(self, path: str, body: bytes) -> bytes:
+        """Writes the request, opening the connection if needed; returns the status line."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+        self.writer.write(
+            f"POST {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        return await self.reader.readline()
+
+    async def post(self, path: str, body: bytes) -> int:
+        if self.writer is not None and time.monotonic() - self.last_used > self.idle_timeout:
+            # The server may be closing it (uvicorn's keep-alive timeout is 5 s)
+            self.close()
+        reused = self.writer is not None
+        try:
+            status_line = await self._send(path, body)
+        except (ConnectionResetError, BrokenPipeError):
+            if not reused:
+                raise
+            status_line = b""
+        if not status_line and reused:
+            # Closed while idle, before the server read the request: safe to
+            # send again, once, on a fresh connection
+            self.close()
+            self.reconnects += 1
+            status_line = await self._send(path, body)
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+        length, chunked, close = 0, False, False
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == "content-length":
+                length = int(value)
+            elif name == "transfer-encoding":
+                chunked = "chunked" in value
+            elif name == "connection":
+                close = value == "close"
+        if chunked:
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await self.reader.readexactly(length)
+        if close:
+            self.close()
+        self.last_used = time.monotonic()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def run(args) -> Dict[str, Any]:
+    rng = np.random.default_rng(args.seed)
+    send_times = schedule(args, rng)
+    n = len(send_times)
+    bodies = [json.dumps(generate_mock_transaction()).encode() for _ in range(n)]
+
+    latency = np.full(n, np.nan)
+    service = np.full(n, np.nan)
+    status: List[Optional[str]] = [None] * n
+    max_lag = 0.0
+
+    # One worker per connection takes scheduled requests from a queue; a
+    # request waiting for a free connection is still timed from its
+    # scheduled send time
+    pending: asyncio.Queue = asyncio.Queue()
+    reconnects = 0
+
+    async def worker():
+        nonlocal reconnects
+        conn = Connection(args.url, args.idle_timeout)
+        while True:
+            item = await pending.get()
+            if item is None:
+                conn.close()
+                reconnects += conn.reconnects
+                return
+            i, intended = item
+            sent = time.perf_counter()
+            try:
+                status[i] = str(await asyncio.wait_for(conn.post(args.path, bodies[i]), args.timeout))
+            except asyncio.TimeoutError:
+                status[i] = "timeout"
+                conn.close()
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError) as e:
+                status[i] = type(e).__name__
+                conn.close()
+            done = time.perf_counter()
+            latency[i] = (done - intended) * 1000
+            service[i] = (done - sent) * 1000
+
+    workers = [asyncio.create_task(worker()) for _ in range(args.connections)]
+    start = time.perf_counter()
+    for i, offset in enumerate(send_times.tolist()):
+        intended = start + offset
+        delay = intended - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            max_lag = max(max_lag, -delay)
+        pending.put_nowait((i, intended))
+    for _ in workers:
+        pending.put_nowait(None)
+    await asyncio.gather(*workers)
+    elapsed = time.perf_counter() - start
+
+    ok = np.array([s == "200" for s in status], dtype=bool)
+    # Timeouts are kept in the latency distribution: they are the slowest
+    # requests, and dropping them would flatter the tail
+    counted = ok | np.array([s == "timeout" for s in status], dtype=bool)
+    codes: Dict[str, int] = {}
+    for s in status:
+        codes[s] = codes.get(s, 0) + 1
+
+    seconds = int(np.ceil(args.duration))
+    timeline = []
+    for second in range(seconds):
+        in_second = (send_times >= second) & (send_times < second + 1)
+        values = latency[in_second & counted]
+        timeline.append({
+            "t": second,
+            "offered": int(in_second.sum()),
+            "ok": int((in_second & ok).sum()),
+            "p99_ms": round(float(np.percentile(values, 99)), 3) if len(values) else None,
+        })
+
+    return {
+        "config": {
+            "url": args.url + args.path,
+            "profile": args.profile,
+            "arrivals": args.arrivals,
+            "rate": args.rate,
+            "duration": args.duration,
+            "connections": args.connections,
+        },
+        "requests": n,
+        "elapsed_s": round(elapsed, 3),
+        "offered_rps": round(n / args.duration, 2),
+        "throughput_rps": round(int(ok.sum()) / elapsed, 2),
+        "status": codes,
+        "error_rate": round(1 - ok.mean(), 6) if n else None,
+        "reconnects": reconnects,
+        "latency_ms": summarize(latency[counted]),
+        "service_ms": summarize(service[counted]),
+        # How late the generator itself sent its most delayed request; if
+        # this is large, the client, not the server, was the bottleneck
+        "max_send_lag_ms": round(max_lag * 1000, 3),
+        "timeline": timeline,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", default="/process?compact=true")
+    parser.add_argument("--rate", type=float, default=100.0, help="requests/s (peak rate for ramp)")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--profile", choices=["constant", "ramp", "spike"], default="constant")
+    parser.add_argument("--arrivals", choices=["poisson", "constant"], default="poisson")
+    parser.add_argument("--start-rate", type=float, default=0.0, help="ramp: rate at the start")
+    parser.add_argument("--spike-at", type=float, default=10.0, help="spike: start, in seconds")
+    parser.add_argument("--spike-seconds", type=float, default=5.0)
+    parser.add_argument("--spike-factor", type=float, default=5.0)
+    parser.add_argument("--connections", type=int, default=256, help="connection pool size")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--idle-timeout", type=float, default=4.0,
+                        help="reopen connections idle longer than this (below the server's keep-alive timeout)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Cost of the rolling metrics on /metrics: time per MetricsAggregator.record
+call from one or several writer threads, snapshot latency with a full
+window, and histogram percentiles against exact numpy percentiles of the
+same latencies.
+
+    python -m benchmarks.metrics_overhead --records 1000000 --threads 4
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from core.metrics import MetricsAggregator
+
+GATEWAYS = ["Issuer_Alpha", "Issuer_Beta", "Issuer_Gamma"]
+ERRORS = ["BANK_DECLINE", "INSUFFICIENT_FUNDS", "TIMEOUT"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    latencies = rng.lognormal(np.log(150), 0.5, args.records).tolist()
+    outcomes = (rng.random(args.records) < 0.9).tolist()
+    gateways = [GATEWAYS[i] for i in rng.integers(0, len(GATEWAYS), args.records)]
+    errors = [ERRORS[i] for i in rng.integers(0, len(ERRORS), args.records)]
+
+    # A clock that walks through the whole ring, so every slot gets filled
+    metrics = MetricsAggregator()
+    span = metrics.slot_seconds * metrics.num_slots
+    ticks = iter(np.linspace(0, span - 1e-6, args.records).tolist())
+    metrics.clock = lambda: next(ticks, span - 1e-6)
+
+    def write(aggregator: MetricsAggregator, lo: int, hi: int):
+        record = aggregator.record
+        for i in range(lo, hi):
+            record(gateways[i], outcomes[i], latencies[i], None if outcomes[i] else errors[i])
+
+    start = time.perf_counter()
+    write(metrics, 0, args.records)
+    single = (time.perf_counter() - start) / args.records
+
+    threaded = MetricsAggregator()
+    chunk = args.records // args.threads
+    workers = [threading.Thread(target=write, args=(threaded, i * chunk, (i + 1) * chunk)) for i in range(args.threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    multi = (time.perf_counter() - start) / (chunk * args.threads)
+
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        snap = metrics.snapshot(span)
+        best = min(best, time.perf_counter() - start)
+
+    print(f"records: {args.records}, slots: {metrics.num_slots} x {metrics.slot_seconds:g} s")
+    print(f"record, 1 thread:        {single * 1e9:8.0f} ns")
+    print(f"record, {args.threads} threads:       {multi * 1e9:8.0f} ns (wall time per record)")
+    print(f"snapshot, full window:   {best * 1000:8.2f} ms")
+    print(f"{'quantile':>9} {'histogram':>10} {'exact':>10} {'error':>7}")
+    exact = np.percentile(latencies, [50, 95, 99])
+    for name, value in zip(("p50", "p95", "p99"), exact):
+        approx = snap["total"]["latency_ms"][name]
+        print(f"{name:>9} {approx:10.2f} {value:10.2f} {abs(approx - value) / value:7.2%}")
+
+
+if __name__ == "__main__":
+    main()
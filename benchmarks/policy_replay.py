@@ -0,0 +1,139 @@
+"""
+Counterfactual evaluation of router and breaker policies on logged traffic
+(core.replay), without shipping them.
+
+Logs are JSONL (optionally .gz): API responses with their history, or event
+bus dumps of TransactionEvent / PaymentResult lines. They are streamed in
+chunks, so memory stays flat however large they are. Every policy, logging
+and target, is replayed over the logged outcomes; each target's success
+rate per attempt is then estimated by inverse propensity weighting (IPS,
+SNIPS) and doubly robust (DR) estimation against the logging policy's
+Thompson sampling propensities.
+
+Policies are ROUTER[:ARG][@SENTINEL[:ARG]]:
+  global | contextual | discounted[:HALF_LIFE_S] | window[:N]
+  sentinel ring[:N] (last N outcomes) or time[:SECONDS]
+--logging is the policy that produced the logs (the default deployment:
+global@ring:10). --latency-weight and --fees set every policy's routing
+objective (ROUTER_LATENCY_WEIGHT and ROUTER_FEES); the logging policy's
+must match the deployment's, or its propensities are wrong.
+
+    python -m benchmarks.policy_replay logs/*.jsonl.gz --target discounted:300@time:30 --target window:500
+"""
+import argparse
+import json
+import logging
+import time
+
+from agents.mocks import GATEWAYS
+from agents.router import (
+    ContextualThompsonRouter,
+    DiscountedThompsonRouter,
+    SlidingWindowThompsonRouter,
+    ThompsonSamplingRouter,
+)
+from agents.sentinel import CircuitBreakerSentinel
+from core.replay import OffPolicyEvaluator, ReplayPolicy, read_decisions
+from core.simulation import VirtualClock
+
+
+def build_policy(spec: str, gateways, args) -> ReplayPolicy:
+    router_spec, _, sentinel_spec = spec.partition("@")
+    kind, _, arg = router_spec.partition(":")
+    clock = VirtualClock()
+    if kind == "contextual":
+        router = ContextualThompsonRouter(gateways, clock=clock)
+    elif kind == "discounted":
+        router = DiscountedThompsonRouter(gateways, half_life=float(arg or 300), clock=clock)
+    elif kind == "window":
+        router = SlidingWindowThompsonRouter(gateways, window=int(arg or 500))
+    elif kind == "global":
+        router = ThompsonSamplingRouter(gateways)
+    else:
+        raise ValueError(f"Unknown router in policy {spec!r}")
+    router.set_objective(
+        latency_weight=args.latency_weight,
+        fees={gw: float(fee) for gw, _, fee in (item.partition("=") for item in args.fees.split(","))} if args.fees else None,
+    )
+
+    sentinel = None
+    if sentinel_spec:
+        kind, _, arg = sentinel_spec.partition(":")
+        if kind == "ring":
+            sentinel = CircuitBreakerSentinel(
+                recovery_timeout=args.recovery_timeout, window_size=int(arg or 10), gateways=gateways, clock=clock,
+            )
+        elif kind == "time":
+            sentinel = CircuitBreakerSentinel(
+                recovery_timeout=args.recovery_timeout, window_seconds=float(arg or 30), gateways=gateways, clock=clock,
+            )
+        else:
+            raise ValueError(f"Unknown sentinel in policy {spec!r}")
+    return ReplayPolicy(spec, router, sentinel, clock)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("logs", nargs="+", help="JSONL log files (.gz allowed)")
+    parser.add_argument("--target", action="append", help="policy to evaluate (repeatable)")
+    parser.add_argument("--logging", default="global@ring:10", help="policy that produced the logs")
+    parser.add_argument("--gateways", default=",".join(GATEWAYS))
+    parser.add_argument("--recovery-timeout", type=float, default=30.0)
+    parser.add_argument("--latency-weight", type=float, default=0.0, help="router utility lost per second of latency")
+    parser.add_argument("--fees", help="per-gateway fees in success-rate units, e.g. Issuer_Alpha=0.002,Issuer_Beta=0.001")
+    parser.add_argument("--samples", type=int, default=2000, help="Monte Carlo draws per propensity estimate")
+    parser.add_argument("--tolerance", type=float, default=0.01, help="posterior change (log scale) that triggers a new estimate")
+    parser.add_argument("--max-weight", type=float, help="clip importance weights at this value")
+    parser.add_argument("--min-ess", type=float, default=0.1, help="warn below this fraction of decisions")
+    parser.add_argument("--weight-tolerance", type=float, default=0.1, help="warn when the mean weight is further from 1")
+    parser.add_argument("--chunk", type=int, default=8192, help="decisions per vectorized chunk")
+    parser.add_argument("--rate", type=float, default=100.0, help="assumed decisions/s for logs without timestamps")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the full report here")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    gateways = args.gateways.split(",")
+    targets = args.target or [args.logging, "discounted:300@time:30", "window:500@ring:10"]
+    evaluator = OffPolicyEvaluator(
+        gateways,
+        build_policy(args.logging, gateways, args),
+        [build_policy(spec, gateways, args) for spec in targets],
+        samples=args.samples,
+        tolerance=args.tolerance,
+        max_weight=args.max_weight,
+        min_ess=args.min_ess,
+        weight_tolerance=args.weight_tolerance,
+        chunk_size=args.chunk,
+        seed=args.seed,
+    )
+    start = time.perf_counter()
+    report = evaluator.run(read_decisions(args.logs), default_rate=args.rate)
+    wall = time.perf_counter() - start
+
+    print(f"logging policy: {args.logging}")
+    print(f"replayed {report['decisions']} decisions in {wall:.1f} s ({report['decisions'] / wall:.0f}/s), "
+          f"{report['skipped']} skipped, {report['unsupported']} not possible under the logging policy, {report['propensity_evaluations']} propensity estimates")
+    if not report["decisions"]:
+        return
+    print(f"logged success rate {report['logged_success_rate']:.4f}\n")
+    print(f"{'policy':28} {'IPS':>15} {'SNIPS':>7} {'DR':>15} {'DM':>7} {'ESS':>9} {'mean w':>7}")
+    for name, p in report["policies"].items():
+        print(f"{name:28} {p['ips']:7.4f}±{p['ips_stderr']:.4f} {p['snips']:7.4f} {p['dr']:7.4f}±{p['dr_stderr']:.4f} "
+              f"{p['dm']:7.4f} {p['ess']:9.0f} {p['mean_weight']:7.3f}")
+    for name, p in report["policies"].items():
+        if p["clipped"]:
+            print(f"{name}: {p['clipped']} weights clipped at {args.max_weight:g}")
+        for warning in p["warnings"]:
+            print(f"WARNING {name}: {warning}")
+
+    print("\nESS: effective sample size of the importance weights. A mean weight well below 1 means the target\n"
+          "often picks gateways the logging policy never tried there; only DR/DM can say anything about those.")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Routing, breaker and recovery policies against scripted gateway behaviour,
+on a virtual clock (core.simulation): hours of traffic in seconds.
+
+Scenarios are built in (steady, outage, brownout, slow_leader,
+latency_spike, flapping; see core/simulation.py) or a JSON file with the same layout. Prints acceptance,
+attempts per payment, payment latency and per-gateway results, then a
+per-interval timeline; --json writes the full report.
+
+    python -m benchmarks.policy_simulation --scenario outage --router discounted --sentinel-window 30
+"""
+import argparse
+import json
+import logging
+import time
+
+from agents.recovery import RecoveryAgent
+from agents.router import (
+    ContextualThompsonRouter,
+    DiscountedThompsonRouter,
+    SlidingWindowThompsonRouter,
+    ThompsonSamplingRouter,
+)
+from agents.sentinel import CircuitBreakerSentinel
+from core.retry import RetryBudget, RetryScheduler
+from core.simulation import Simulation, VirtualClock, load_scenario
+
+
+def build_router(kind: str, gateways, clock, args):
+    if kind == "contextual":
+        return ContextualThompsonRouter(gateways, seed=args.seed, clock=clock)
+    if kind == "discounted":
+        return DiscountedThompsonRouter(gateways, half_life=args.half_life, seed=args.seed, clock=clock)
+    if kind == "window":
+        return SlidingWindowThompsonRouter(gateways, window=args.window, seed=args.seed)
+    return ThompsonSamplingRouter(gateways, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", default="outage", help="built-in scenario name or JSON file")
+    parser.add_argument("--rate", type=float, help="override the scenario's arrival rate (payments/s)")
+    parser.add_argument("--duration", type=float, help="override the scenario's duration (virtual seconds)")
+    parser.add_argument("--router", choices=["global", "contextual", "discounted", "window"], default="global")
+    parser.add_argument("--half-life", type=float, default=300.0)
+    parser.add_argument("--window", type=int, default=500)
+    parser.add_argument("--latency-weight", type=float, default=0.0, help="router utility lost per second of latency")
+    parser.add_argument("--fees", help="per-gateway fees in success-rate units, e.g. Issuer_Alpha=0.002,Issuer_Beta=0.001")
+    parser.add_argument("--sentinel-window", type=float, help="time-bucketed breaker window in seconds (default: last 10 outcomes)")
+    parser.add_argument("--recovery-timeout", type=float, default=30.0)
+    parser.add_argument("--retry-backoff", type=float, default=0.0, help="retry backoff base in seconds (RETRY_BACKOFF_BASE)")
+    parser.add_argument("--retry-budget", type=float, default=0.0, help="per-gateway retry budget ratio (RETRY_BUDGET_RATIO)")
+    parser.add_argument("--interval", type=float, default=300.0, help="timeline interval in virtual seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the full report here")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    scenario = dict(load_scenario(args.scenario))
+    if args.rate is not None:
+        scenario["rate"] = args.rate
+    if args.duration is not None:
+        scenario["duration"] = args.duration
+
+    clock = VirtualClock()
+    gateways = list(scenario["gateways"])
+    sentinel = CircuitBreakerSentinel(
+        recovery_timeout=args.recovery_timeout, window_seconds=args.sentinel_window, gateways=gateways, clock=clock,
+    )
+    router = build_router(args.router, gateways, clock, args)
+    router.set_objective(
+        latency_weight=args.latency_weight,
+        fees={gw: float(fee) for gw, _, fee in (item.partition("=") for item in args.fees.split(","))} if args.fees else None,
+    )
+    retry_scheduler = None
+    if args.retry_backoff or args.retry_budget:
+        retry_scheduler = RetryScheduler(
+            base=args.retry_backoff,
+            budget=RetryBudget(ratio=args.retry_budget, clock=clock) if args.retry_budget else None,
+            seed=args.seed,
+        )
+    sim = Simulation(
+        scenario, router, sentinel, RecoveryAgent(), clock,
+        seed=args.seed, timeline_seconds=args.interval, retry_scheduler=retry_scheduler,
+    )
+    start = time.perf_counter()
+    report = sim.run()
+    wall = time.perf_counter() - start
+
+    print(f"scenario: {args.scenario}, {scenario['duration']:g} s at {scenario['rate']:g}/s, router: {args.router}, "
+          f"breaker window: {f'{args.sentinel_window:g} s' if args.sentinel_window else 'last 10'}, "
+          f"latency weight: {args.latency_weight:g}/s")
+    print(f"simulated {report['payments']} payments in {wall:.1f} s ({report['payments'] / wall * 60 / 1e6:.2f}M payments/min)")
+    latency = report["payment_latency_ms"]
+    print(f"acceptance {report['acceptance']:.4f}, attempts/payment {report['attempts_per_payment']:.3f} {report['attempts']}")
+    print("payment latency ms: " + ", ".join(f"{q} {v:.0f}" for q, v in latency.items()))
+    print(f"{'gateway':14} {'attempts':>9} {'share':>6} {'success':>8} {'trips':>6} {'p50 ms':>7} {'p99 ms':>7}")
+    for gw, g in report["gateways"].items():
+        print(f"{gw:14} {g['attempts']:9d} {g['share']:6.3f} {g['success_rate']:8.3f} {g['breaker_trips']:6d} "
+              f"{g['latency_ms']['p50']:7.0f} {g['latency_ms']['p99']:7.0f}")
+    print(f"\n{'t (s)':>7} {'payments':>9} {'accept':>7} {'p99 ms':>7}  share / breakers")
+    for row in report["timeline"]:
+        share = " ".join(f"{gw}={row['share'].get(gw, 0):.2f}/{row['breakers'][gw][0]}" for gw in gateways)
+        print(f"{row['t']:7.0f} {row['payments']:9d} {row['acceptance'] or 0:7.3f} {row['p99_ms'] or 0:7.0f}  {share}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Cost of parked retries and retry amplification in an outage (core.retry).
+
+Parking: --pending retries are scheduled at once with backoffs uniform in
+[0, --max-delay] seconds, then awaited. "wheel" parks them on the
+TimerWheel, "asyncio" on one asyncio.sleep each (the loop's timer heap),
+"thread" on a threading.Timer each, the thread-per-retry design. Reported:
+threads alive at the peak, CPU time, and how late the timers fired.
+
+Outage: --rate payments/s for --duration seconds through the async graph.
+After --warmup seconds every gateway's success rate drops to
+--outage-success (an upstream brownout: rerouting cannot help, retries
+only add load). Each run starts from a fresh router and sentinel; only
+payments sent during the outage are reported. "attempts/payment" counts
+gateway calls, so it shows how much the retries add to the load.
+
+    python -m benchmarks.retry_scheduler --pending 5000 --rate 100 --min-per-second 1
+"""
+import argparse
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+import core.graph as graph
+from agents.mocks import GATEWAYS
+from agents.router import ThompsonSamplingRouter
+from agents.sentinel import CircuitBreakerSentinel
+from core.retry import RetryBudget, RetryScheduler, TimerWheel
+from core.state import AgentState
+from ui.traffic import generate_mock_transaction
+
+
+async def park(mode: str, pending: int, max_delay: float, seed: int) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    delays = np.random.default_rng(seed).uniform(0, max_delay, pending).tolist()
+    wheel = TimerWheel()
+    lateness: List[float] = []
+    peak_threads = threading.active_count()
+
+    async def one(delay: float):
+        due = loop.time() + delay
+        if mode == "wheel":
+            await wheel.sleep(delay)
+        elif mode == "asyncio":
+            await asyncio.sleep(delay)
+        else:
+            future = loop.create_future()
+            threading.Timer(delay, loop.call_soon_threadsafe, (future.set_result, None)).start()
+            await future
+        lateness.append((loop.time() - due) * 1000)
+
+    cpu = time.process_time()
+    tasks = [asyncio.create_task(one(d)) for d in delays]
+    while not all(t.done() for t in tasks):
+        peak_threads = max(peak_threads, threading.active_count())
+        await asyncio.sleep(0.05)
+    return {
+        "peak_threads": peak_threads,
+        "cpu_s": time.process_time() - cpu,
+        "late_ms": np.percentile(lateness, [50, 99, 100]).tolist(),
+    }
+
+
+def make_state() -> AgentState:
+    tx = generate_mock_transaction()
+    return AgentState(
+        transaction_id=tx["transaction_id"],
+        payment_context=tx,
+        route_decision=None,
+        intervention_plan=None,
+        attempt_count=0,
+        last_error=None,
+        success=False,
+        history=[]
+    )
+
+
+async def outage(base: float, ratio: float, args) -> Dict[str, Any]:
+    graph.router = ThompsonSamplingRouter(graph.gateways)
+    graph.sentinel = CircuitBreakerSentinel(gateways=graph.gateways)
+    graph.retry_scheduler = RetryScheduler(
+        base=base, cap=2.0, budget=RetryBudget(ratio=ratio, min_per_second=args.min_per_second) if ratio > 0 else None,
+        seed=args.seed,
+    )
+    send_times = np.cumsum(np.random.default_rng(args.seed).exponential(1.0 / args.rate, int(args.rate * args.duration * 1.2)))
+    send_times = send_times[send_times < args.duration]
+    rates = {name: gw.success_rate for name, gw in GATEWAYS.items()}
+    rows: List[tuple] = []
+
+    async def one(offset: float):
+        started = time.perf_counter()
+        state = await graph.payment_graph.ainvoke(make_state())
+        attempts = sum(1 for e in state["history"] if e["step"] == "execute")
+        rows.append((offset, state["success"], attempts, (time.perf_counter() - started) * 1000))
+
+    tasks = []
+    start = time.perf_counter()
+    outage_started = False
+    for offset in send_times.tolist():
+        if offset >= args.warmup and not outage_started:
+            outage_started = True
+            for gw in GATEWAYS.values():
+                gw.update_config(success_rate=args.outage_success)
+        delay = start + offset - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one(offset)))
+    await asyncio.gather(*tasks)
+    for name, rate in rates.items():
+        GATEWAYS[name].update_config(success_rate=rate)
+
+    measured = [r for r in rows if r[0] >= args.warmup]
+    budget = graph.retry_scheduler.budget
+    return {
+        "acceptance": float(np.mean([r[1] for r in measured])),
+        "attempts_per_payment": float(np.mean([r[2] for r in measured])),
+        "p99_ms": float(np.percentile([r[3] for r in measured], 99)),
+        "denied": sum(budget.denied.values()) if budget else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pending", type=int, default=5000, help="retries parked at once")
+    parser.add_argument("--max-delay", type=float, default=2.0)
+    parser.add_argument("--park-modes", default="wheel,asyncio,thread")
+    parser.add_argument("--rate", type=float, default=100.0, help="payments/s in the outage")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds before the outage")
+    parser.add_argument("--outage-success", type=float, default=0.3, help="every gateway's success rate in the outage")
+    parser.add_argument("--min-per-second", type=float, default=10.0, help="retry budget floor")
+    parser.add_argument("--scale", type=float, default=0.2, help="gateway latency multiplier")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    print(f"{'parking':>8} {'threads':>8} {'cpu s':>6} {'late p50/p99/max ms':>20}")
+    for mode in args.park_modes.split(","):
+        r = asyncio.run(park(mode, args.pending, args.max_delay, args.seed))
+        print(f"{mode:>8} {r['peak_threads']:8d} {r['cpu_s']:6.2f} " + "/".join(f"{v:.1f}" for v in r["late_ms"]))
+
+    for gw in GATEWAYS.values():
+        gw.update_config(latency_mean=gw.latency_mean * args.scale, latency_std=gw.latency_std * args.scale)
+    print(f"\n{'outage':>24} {'accept':>7} {'attempts/pay':>12} {'p99 ms':>7} {'denied':>7}")
+    for label, base, ratio in [("immediate, no budget", 0.0, 0.0), ("backoff, no budget", 0.1, 0.0), ("backoff, budget 0.2", 0.1, 0.2)]:
+        r = asyncio.run(outage(base, ratio, args))
+        print(f"{label:>24} {r['acceptance']:7.4f} {r['attempts_per_payment']:12.3f} {r['p99_ms']:7.0f} {r['denied']:7d}")
+
+
+if __name__ == "__main__":
+    main()
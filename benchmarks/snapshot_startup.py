@@ -0,0 +1,81 @@
+"""
+Snapshot write and warm-start load times for a large contextual router.
+
+Builds a ContextualThompsonRouter holding --buckets context buckets, snapshots
+it (the periodic, off-request-path cost), then measures how long a fresh
+process-sized router takes to load it at startup.
+
+    python -m benchmarks.snapshot_startup --buckets 1000000
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from agents.router import ContextualThompsonRouter
+from agents.sentinel import CircuitBreakerSentinel
+from core.snapshot import load_snapshot, save_snapshot
+
+GATEWAYS = ["Issuer_Alpha", "Issuer_Beta", "Issuer_Gamma"]
+
+
+def synthetic_state(n: int, seed: int):
+    # Shaped like ContextualThompsonRouter.export_state() after heavy traffic:
+    # finest-level (currency, method, BIN, merchant) buckets with real counts.
+    rng = np.random.default_rng(seed)
+    sep = ContextualThompsonRouter._KEY_SEP
+    currencies = ["USD", "EUR", "GBP", "INR"]
+    keys = [
+        sep.join(("2", currencies[i % 4], "credit_card", f"{400000 + i // 4:06d}", f"merchant_{i % 997:03d}")).encode()
+        for i in range(n)
+    ]
+    slab = 1.0 + rng.integers(0, 200, size=(n, 2, len(GATEWAYS))).astype(np.float32)
+    return {
+        "gateways": np.array(GATEWAYS, dtype=str),
+        "alpha": np.ones(len(GATEWAYS)),
+        "beta": np.ones(len(GATEWAYS)),
+        "bucket_keys": np.array(keys, dtype=bytes),
+        "bucket_slab": slab,
+        "bucket_observations": (slab.sum(axis=(1, 2)) - 2 * len(GATEWAYS)).astype(np.int64),
+        "bucket_age": rng.uniform(0, 3600, size=n),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--buckets", type=int, default=1_000_000)
+    parser.add_argument("--prior-decay", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+
+    router = ContextualThompsonRouter(GATEWAYS, capacity=args.buckets)
+    router.load_state(synthetic_state(args.buckets, args.seed))
+    sentinel = CircuitBreakerSentinel(gateways=GATEWAYS)
+
+    path = os.path.join(tempfile.mkdtemp(), "routing_state.npz")
+    start = time.perf_counter()
+    size = save_snapshot(path, router, sentinel)
+    save_s = time.perf_counter() - start
+
+    fresh_router = ContextualThompsonRouter(GATEWAYS, capacity=args.buckets)
+    fresh_sentinel = CircuitBreakerSentinel(gateways=GATEWAYS)
+    start = time.perf_counter()
+    load_snapshot(path, fresh_router, fresh_sentinel, prior_decay=args.prior_decay)
+    load_s = time.perf_counter() - start
+
+    assert fresh_router.get_context_stats()["buckets"] == args.buckets
+    os.remove(path)
+
+    print(f"buckets:        {args.buckets}")
+    print(f"snapshot size:  {size / 1e6:.1f} MB ({size / args.buckets:.0f} B/bucket)")
+    print(f"snapshot write: {save_s * 1000:.0f} ms (background thread)")
+    print(f"startup load:   {load_s * 1000:.0f} ms (prior decay {args.prior_decay})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Throughput and consumer lag of the streaming PaymentWorker on the
+in-process event bus: a burst of TransactionEvents is published to the
+payment request topic and drained by the worker, while a separate
+consumer group reads the results.
+
+Reports drain throughput, peak and sampled lag, time from publish to
+result, and checks that each merchant's payments completed in order.
+
+    python -m benchmarks.stream_worker --events 20000 --merchants 200 --latency 0.02
+"""
+import argparse
+import logging
+import threading
+import time
+
+import numpy as np
+
+from agents.mocks import GATEWAYS, MockGateway
+from core.kafka import TOPIC_PAYMENT_REQUESTS, TOPIC_RESULTS, EventBus
+from core.worker import PaymentWorker
+from data.schemas.events import TransactionEvent
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20_000)
+    parser.add_argument("--merchants", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02, help="mean gateway latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--native", action="store_true", help="use the native executor instead of LangGraph")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    for name, gw in list(GATEWAYS.items()):
+        GATEWAYS[name] = MockGateway(name, gw.success_rate, args.latency, args.latency / 4, seed=0)
+
+    bus = EventBus()
+    graph = None
+    if args.native:
+        from core.executor import native_payment_graph as graph
+    worker = PaymentWorker(bus, graph, concurrency=args.concurrency)
+
+    published_at = {}
+    merchant_of = {}
+    seq_of = {}
+    finished_at = {}
+    order = {}
+    all_done = threading.Event()
+
+    def on_results(results):
+        now = time.perf_counter()
+        for result in results:
+            tx_id = result.transaction_id
+            if tx_id in finished_at:
+                continue
+            finished_at[tx_id] = now
+            order.setdefault(merchant_of[tx_id], []).append(seq_of[tx_id])
+        if len(finished_at) == args.events:
+            all_done.set()
+
+    bus.start_consumer(TOPIC_RESULTS, on_results, batch=True, group_id="bench-results")
+    worker.start()
+
+    producer = bus.get_producer(TOPIC_PAYMENT_REQUESTS, "merchant_id")
+    events = []
+    for i in range(args.events):
+        merchant = f"merchant_{i % args.merchants:04d}"
+        tx_id = f"tx-{i}"
+        merchant_of[tx_id] = merchant
+        seq_of[tx_id] = i
+        events.append(TransactionEvent(
+            transaction_id=tx_id, merchant_id=merchant, amount=100.0, currency="USD", payment_method="credit_card",
+        ))
+
+    lags = []
+    sampling = threading.Event()
+
+    def sample_lag():
+        while not sampling.wait(0.05):
+            lags.append(worker.lag() or 0)
+
+    sampler = threading.Thread(target=sample_lag)
+    sampler.start()
+    start = time.perf_counter()
+    for event in events:
+        published_at[event.transaction_id] = time.perf_counter()
+        producer.send(event)
+    all_done.wait()
+    elapsed = time.perf_counter() - start
+    sampling.set()
+    sampler.join()
+    worker.stop()
+    bus.close()
+
+    e2e = np.array([finished_at[tx] - published_at[tx] for tx in finished_at]) * 1000
+    in_order = all(seqs == sorted(seqs) for seqs in order.values())
+    print(f"events: {args.events}, merchants: {args.merchants}, gateway latency: {args.latency * 1000:.0f} ms, concurrency: {args.concurrency}, executor: {'native' if args.native else 'langgraph'}")
+    print(f"drain throughput:  {args.events / elapsed:10.0f} payments/s")
+    print(f"lag peak / mean:   {max(lags, default=0):10d} / {np.mean(lags) if lags else 0:.0f} messages")
+    print(f"publish->result:   p50 {np.percentile(e2e, 50):.0f} ms, p99 {np.percentile(e2e, 99):.0f} ms")
+    print(f"per-merchant order preserved: {in_order}")
+
+
+if __name__ == "__main__":
+    main()
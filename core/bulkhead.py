@@ -0,0 +1,287 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from core.hedging import DEADLINE_EXCEEDED
+
+logger = logging.getLogger("bulkhead")
+
+
+class AdaptiveLimit:
+    """
+    Concurrency limit for one gateway, adjusted from each completed call.
+
+    Both modes compare a short-term latency average with a long-term one
+    (the gateway's normal latency):
+
+    - aimd: +1/limit per call while the short-term latency is within
+      `tolerance` times the normal one (about +1 per limit's worth of
+      calls), times `backoff` while it is not or on a timeout, at most once
+      per limit's worth of calls.
+    - gradient: the limit moves towards limit * (long / short) plus a
+      sqrt(limit) allowance for queueing, smoothed; latency rising with
+      concurrency pulls it down in proportion.
+
+    The limit only grows while at least half of it is in use, so a quiet
+    period does not leave it inflated.
+    """
+
+    def __init__(
+        self,
+        mode: str = "gradient",
+        initial: float = 20.0,
+        min_limit: float = 1.0,
+        max_limit: float = 500.0,
+        tolerance: float = 1.5,
+        backoff: float = 0.9,
+        smoothing: float = 0.2,
+        short_window: int = 10,
+        long_window: int = 500,
+    ):
+        if mode not in ("aimd", "gradient"):
+            raise ValueError(f"Unknown limit mode {mode!r}")
+        self.mode = mode
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self._short_alpha = 2.0 / (short_window + 1)
+        self._long_alpha = 2.0 / (long_window + 1)
+        self.short_rtt: Optional[float] = None
+        self.long_rtt: Optional[float] = None
+        self._cooldown = 0.0
+
+    def on_sample(self, rtt: float, inflight: int, dropped: bool = False):
+        if self.short_rtt is None:
+            self.short_rtt = self.long_rtt = rtt
+        else:
+            self.short_rtt += self._short_alpha * (rtt - self.short_rtt)
+            self.long_rtt += self._long_alpha * (rtt - self.long_rtt)
+            # Latency coming back down must not stay anchored to a spike
+            if self.long_rtt > self.short_rtt:
+                self.long_rtt = self.short_rtt
+        busy = inflight >= self.limit / 2
+
+        if self.mode == "aimd":
+            self._cooldown -= 1
+            if dropped or self.short_rtt > self.tolerance * self.long_rtt:
+                # At most once per limit's worth of calls: the ones already
+                # in flight were admitted before the last cut
+                if self._cooldown > 0:
+                    return
+                self._cooldown = self.limit
+                limit = self.limit * self.backoff
+            elif busy:
+                limit = self.limit + 1.0 / self.limit
+            else:
+                return
+        else:
+            gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / self.short_rtt))
+            target = self.limit * gradient + math.sqrt(self.limit)
+            if target > self.limit and not busy:
+                return
+            limit = self.limit * (1 - self.smoothing) + target * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, limit))
+
+
+class Bulkhead:
+    """
+    Admission to one gateway: at most `limit` calls in flight, then a
+    bounded queue served by priority (highest first, FIFO among equals).
+    A full queue turns away the lowest-priority waiter, which may be the
+    newcomer; turned-away and timed-out waiters are told so, and the
+    caller reroutes or sheds them.
+    """
+
+    def __init__(self, limit: AdaptiveLimit, max_queue: int = 100, queue_timeout: float = 1.0):
+        self.limiter = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self._queue: List[Tuple[Tuple, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.queue_timeouts = 0
+
+    def try_acquire(self) -> bool:
+        if self.inflight < self.limiter.limit and not self._queue:
+            self.inflight += 1
+            self.admitted += 1
+            return True
+        return False
+
+    async def acquire(self, priority: Tuple) -> bool:
+        """Waits for a slot; False if turned away or not served in time."""
+        if self.try_acquire():
+            return True
+        if self.max_queue <= 0:
+            self.rejected += 1
+            return False
+        # Min-heap on the negated priority: the root is served first, the
+        # lowest priority (and newest) entry is the one to evict
+        future = asyncio.get_running_loop().create_future()
+        entry = (tuple(-p for p in priority), next(self._seq), future)
+        if len(self._queue) >= self.max_queue:
+            worst = max(self._queue)
+            if entry > worst:
+                self.rejected += 1
+                return False
+            self._queue.remove(worst)
+            heapq.heapify(self._queue)
+            worst[2].set_result(False)
+            self.rejected += 1
+        heapq.heappush(self._queue, entry)
+        self.queued += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done():
+                # Granted (or turned away) just as the wait ran out
+                return future.result()
+            self._abandon(entry)
+            self.queue_timeouts += 1
+            return False
+        except asyncio.CancelledError:
+            # The payment itself was cancelled while waiting
+            if future.done() and future.result():
+                self.release(None)
+            else:
+                self._abandon(entry)
+            raise
+
+    def _abandon(self, entry: Tuple):
+        entry[2].cancel()
+        if entry in self._queue:
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+
+    def release(self, rtt: Optional[float], dropped: bool = False):
+        """
+        Frees a slot. rtt (seconds) feeds the limit; None for calls that
+        were cancelled or never made.
+        """
+        self.inflight -= 1
+        if rtt is not None:
+            self.limiter.on_sample(rtt, self.inflight + 1, dropped)
+        while self._queue and self.inflight < self.limiter.limit:
+            _, _, future = heapq.heappop(self._queue)
+            if future.cancelled():
+                continue
+            self.inflight += 1
+            self.admitted += 1
+            future.set_result(True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limiter.limit, 2),
+            "inflight": self.inflight,
+            "queue_depth": len(self._queue),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "queue_timeouts": self.queue_timeouts,
+            "latency_ms": {
+                "short": self.limiter.short_rtt * 1000 if self.limiter.short_rtt is not None else None,
+                "long": self.limiter.long_rtt * 1000 if self.limiter.long_rtt is not None else None,
+            },
+        }
+
+
+class Bulkheads:
+    """
+    One Bulkhead per gateway. When the routed gateway is at its limit,
+    overflow="queue" waits in its queue and reroutes only if turned away;
+    overflow="reroute" first tries the alternates for a free slot and
+    queues only if none has one. A payment neither admitted nor rerouted
+    is shed.
+
+    Priority is (merchant tier, amount): tiers come from `tiers`
+    (merchant_id -> tier, default 0), larger amounts break ties.
+    """
+
+    def __init__(
+        self,
+        gateways: Iterable[str],
+        mode: str = "gradient",
+        overflow: str = "queue",
+        max_queue: int = 100,
+        queue_timeout: float = 1.0,
+        tiers: Optional[Dict[str, int]] = None,
+        **limit_options,
+    ):
+        if overflow not in ("queue", "reroute"):
+            raise ValueError(f"Unknown overflow policy {overflow!r}")
+        self.overflow = overflow
+        self.tiers = tiers or {}
+        self.shed = 0
+        self.rerouted = 0
+        self.bulkheads = {
+            gw: Bulkhead(AdaptiveLimit(mode, **limit_options), max_queue, queue_timeout) for gw in gateways
+        }
+
+    def __getitem__(self, gateway: str) -> Bulkhead:
+        return self.bulkheads[gateway]
+
+    def priority(self, context: Dict[str, Any]) -> Tuple:
+        return (self.tiers.get(context.get("merchant_id"), 0), float(context.get("amount") or 0.0))
+
+    async def admit(self, gateway: str, context: Dict[str, Any], alternates: Callable[[], Iterable[str]]) -> Optional[str]:
+        """The gateway to use, with a slot held on it; None to shed."""
+        bulkhead = self.bulkheads[gateway]
+        if bulkhead.try_acquire():
+            return gateway
+        if self.overflow == "reroute":
+            other = self._free_alternate(alternates)
+            if other is not None:
+                return other
+        if await bulkhead.acquire(self.priority(context)):
+            return gateway
+        other = self._free_alternate(alternates)
+        if other is not None:
+            return other
+        self.shed += 1
+        return None
+
+    def try_acquire(self, gateway: str) -> bool:
+        return self.bulkheads[gateway].try_acquire()
+
+    def _free_alternate(self, alternates: Callable[[], Iterable[str]]) -> Optional[str]:
+        for gw in alternates():
+            if self.bulkheads[gw].try_acquire():
+                self.rerouted += 1
+                return gw
+        return None
+
+    async def run(self, gateway: str, call: Awaitable[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Awaits a gateway call holding one of its slots, then frees it. Calls
+        the Hedger cancels at their deadline count as dropped; a TIMEOUT
+        decline is the gateway's answer, not a drop.
+        """
+        started = time.perf_counter()
+        dropped = False
+        try:
+            return await call
+        except asyncio.CancelledError as e:
+            dropped = e.args[:1] == (DEADLINE_EXCEEDED,)
+            raise
+        finally:
+            # A call cancelled as a hedge loser still counts, at its elapsed
+            # time: it was slow
+            self.bulkheads[gateway].release(time.perf_counter() - started, dropped)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "overflow": self.overflow,
+            "rerouted": self.rerouted,
+            "shed": self.shed,
+            "gateways": {gw: b.get_stats() for gw, b in self.bulkheads.items()},
+        }
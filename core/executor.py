@@ -0,0 +1,74 @@
+from typing import Any, Dict, Optional
+
+from langgraph.errors import GraphRecursionError
+
+from core.graph import (
+    abackoff_step,
+    aexecute_step,
+    arecovery_step,
+    backoff_step,
+    execute_step,
+    recovery_step,
+    route_step,
+    should_retry,
+)
+from core.state import AgentState
+
+
+class NativePaymentExecutor:
+    """
+    Runs the payment workflow (route_step -> execute_step -> recovery_step,
+    then backoff_step and round again while should_retry says so) by
+    calling the node functions directly, without LangGraph's per-step
+    channel and task machinery.
+
+    Drop-in for payment_graph: invoke/ainvoke take and return an AgentState
+    with the same semantics, including the recursion limit.
+    """
+
+    def __init__(self, recursion_limit: int = 25):
+        self.recursion_limit = recursion_limit
+
+    def _limit(self, config: Optional[Dict[str, Any]]) -> int:
+        return (config or {}).get("recursion_limit", self.recursion_limit)
+
+    def invoke(self, state: AgentState, config: Optional[Dict[str, Any]] = None) -> AgentState:
+        limit = self._limit(config)
+        # Like LangGraph, work on a new top-level dict; nested values are shared
+        state = dict(state)
+        steps = 0
+        while True:
+            if steps + 3 > limit:
+                raise GraphRecursionError(f"Recursion limit of {limit} reached without hitting a stop condition.")
+            state = route_step(state)
+            state = execute_step(state)
+            state = recovery_step(state)
+            steps += 3
+            if should_retry(state) == "end":
+                return state
+            if steps + 1 > limit:
+                raise GraphRecursionError(f"Recursion limit of {limit} reached without hitting a stop condition.")
+            state = backoff_step(state)
+            steps += 1
+
+    async def ainvoke(self, state: AgentState, config: Optional[Dict[str, Any]] = None) -> AgentState:
+        limit = self._limit(config)
+        state = dict(state)
+        steps = 0
+        while True:
+            if steps + 3 > limit:
+                raise GraphRecursionError(f"Recursion limit of {limit} reached without hitting a stop condition.")
+            # routing is CPU-only; gateway calls and recovery may wait
+            state = route_step(state)
+            state = await aexecute_step(state)
+            state = await arecovery_step(state)
+            steps += 3
+            if should_retry(state) == "end":
+                return state
+            if steps + 1 > limit:
+                raise GraphRecursionError(f"Recursion limit of {limit} reached without hitting a stop condition.")
+            state = await abackoff_step(state)
+            steps += 1
+
+
+native_payment_graph = NativePaymentExecutor()
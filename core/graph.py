@@ -1,20 +1,170 @@
 from langgraph.graph import StateGraph, END
-from typing import TypedDict, Literal
+from langchain_core.runnables import RunnableLambda
+from typing import TypedDict, Literal, Dict, Any, Iterator, Optional
 from core.state import AgentState, PaymentContext
-from agents.router import ThompsonSamplingRouter
+from agents.router import (
+    ThompsonSamplingRouter,
+    ContextualThompsonRouter,
+    DiscountedThompsonRouter,
+    SlidingWindowThompsonRouter,
+)
 from agents.sentinel import CircuitBreakerSentinel
 from agents.recovery import RecoveryAgent
-from agents.tools import execute_payment
+from agents.tools import execute_payment, aexecute_payment
+from core.metrics import MetricsAggregator
+from core.hedging import Hedger
+from core.bulkhead import Bulkheads
+from core.idempotency import IdempotencyCache, open_backend
+from core.retry import RetryBudget, RetryScheduler
 import logging
+import os
 
 logger = logging.getLogger("orchestrator")
 
 # Initialize Agents
 # In a real app, these might be singletons or injected
 gateways = ["Issuer_Alpha", "Issuer_Beta", "Issuer_Gamma"]
-router = ThompsonSamplingRouter(gateways)
-sentinel = CircuitBreakerSentinel()
-recovery = RecoveryAgent()
+
+# ROUTER_MODE selects the posterior the router learns:
+#   global      - one stationary posterior per gateway (default)
+#   contextual  - one per (currency, method, BIN, merchant) bucket
+#   discounted  - evidence halves every ROUTER_HALF_LIFE seconds
+#   window      - only the last ROUTER_WINDOW outcomes per gateway
+ROUTER_MODE = os.getenv("ROUTER_MODE", "global")
+if ROUTER_MODE == "contextual":
+    router = ContextualThompsonRouter(gateways)
+elif ROUTER_MODE == "discounted":
+    router = DiscountedThompsonRouter(gateways, half_life=float(os.getenv("ROUTER_HALF_LIFE", "300")))
+elif ROUTER_MODE == "window":
+    router = SlidingWindowThompsonRouter(gateways, window=int(os.getenv("ROUTER_WINDOW", "500")))
+else:
+    router = ThompsonSamplingRouter(gateways)
+
+# The router maximises success probability by default. ROUTER_LATENCY_WEIGHT
+# (utility per second of expected latency) and ROUTER_FEES
+# ("Issuer_Alpha=0.002,Issuer_Beta=0.001", in success-rate units) make it
+# trade success against latency and cost; see ThompsonSamplingRouter.set_objective.
+router_fees = os.getenv("ROUTER_FEES")
+router.set_objective(
+    latency_weight=float(os.getenv("ROUTER_LATENCY_WEIGHT", "0")),
+    fees={gw: float(fee) for gw, _, fee in (item.partition("=") for item in router_fees.split(","))} if router_fees else None,
+)
+
+# SENTINEL_WINDOW_SECONDS switches the breakers from a last-N-outcomes window
+# to a time-bucketed one, so they trip consistently at any request rate.
+window_seconds = os.getenv("SENTINEL_WINDOW_SECONDS")
+sentinel = CircuitBreakerSentinel(
+    window_seconds=float(window_seconds) if window_seconds else None,
+    gateways=gateways,
+)
+
+# RECOVERY_MODE=llm asks a model for recovery decisions (cached and batched,
+# see agents.llm_recovery); RECOVERY_MODEL=openai uses RECOVERY_LLM_MODEL via
+# langchain-openai, anything else an offline stand-in. Payments wait at most
+# RECOVERY_MODEL_TIMEOUT seconds for it before falling back to heuristics.
+RECOVERY_MODE = os.getenv("RECOVERY_MODE", "heuristic")
+if RECOVERY_MODE == "llm":
+    from agents.llm_recovery import LLMRecoveryAgent, LocalStandInModel, OpenAIRecoveryModel
+    if os.getenv("RECOVERY_MODEL") == "openai":
+        recovery_model = OpenAIRecoveryModel(os.getenv("RECOVERY_LLM_MODEL", "gpt-4o-mini"))
+    else:
+        recovery_model = LocalStandInModel(latency=float(os.getenv("RECOVERY_MODEL_LATENCY", "0.3")))
+    recovery = LLMRecoveryAgent(
+        recovery_model,
+        cache_ttl=float(os.getenv("RECOVERY_CACHE_TTL", "300")),
+        batch_window=float(os.getenv("RECOVERY_BATCH_WINDOW", "0.01")),
+        timeout=float(os.getenv("RECOVERY_MODEL_TIMEOUT", "5")),
+    )
+else:
+    recovery = RecoveryAgent()
+
+# SHARED_STATE_NAME puts router posteriors and breaker state in a named
+# shared-memory segment, so all workers on a host (uvicorn --workers N) learn
+# and trip together. Every worker must run the same ROUTER_MODE/SENTINEL_*.
+SHARED_STATE_NAME = os.getenv("SHARED_STATE_NAME")
+if SHARED_STATE_NAME:
+    from core.shared_state import SharedArena, share_router, share_sentinel
+    shared_arena = SharedArena(SHARED_STATE_NAME)
+    share_router(router, shared_arena)
+    share_sentinel(sentinel, shared_arena)
+
+# Rolling outcome counters and latency histograms, served on /metrics
+metrics = MetricsAggregator()
+
+# ATTEMPT_DEADLINE (seconds) cancels a gateway call that has not answered in
+# time and counts it as a TIMEOUT. HEDGE_QUANTILE (e.g. 0.95) sends a duplicate
+# attempt to the next-best non-OPEN gateway once the primary is slower than
+# that rolling quantile, for at most HEDGE_MAX_RATIO of attempts. Both apply
+# to the async path (ainvoke), which the API uses.
+attempt_deadline = os.getenv("ATTEMPT_DEADLINE")
+hedge_quantile = os.getenv("HEDGE_QUANTILE")
+hedger = Hedger(
+    quantile=float(hedge_quantile) if hedge_quantile else None,
+    deadline=float(attempt_deadline) if attempt_deadline else None,
+    max_ratio=float(os.getenv("HEDGE_MAX_RATIO", "0.1")),
+)
+
+# BULKHEAD_MODE (aimd or gradient) caps concurrent calls per gateway with a
+# limit adapted from observed latency. A payment over the limit waits in the
+# gateway's queue (BULKHEAD_QUEUE deep, BULKHEAD_QUEUE_TIMEOUT seconds, highest
+# MERCHANT_TIERS tier and then amount first) or, with BULKHEAD_OVERFLOW=reroute,
+# goes straight to another gateway with room; if neither works it fails as
+# GATEWAY_BUSY. Async path (ainvoke) only.
+BULKHEAD_MODE = os.getenv("BULKHEAD_MODE")
+bulkheads = None
+if BULKHEAD_MODE:
+    merchant_tiers = os.getenv("MERCHANT_TIERS")
+    bulkheads = Bulkheads(
+        gateways,
+        mode=BULKHEAD_MODE,
+        overflow=os.getenv("BULKHEAD_OVERFLOW", "queue"),
+        max_queue=int(os.getenv("BULKHEAD_QUEUE", "100")),
+        queue_timeout=float(os.getenv("BULKHEAD_QUEUE_TIMEOUT", "1.0")),
+        tiers={m: int(t) for m, _, t in (item.partition("=") for item in merchant_tiers.split(","))} if merchant_tiers else None,
+    )
+
+# IDEMPOTENCY_TTL (seconds, 0 to disable) is how long a transaction_id's
+# response is replayed to repeats instead of paying again; concurrent repeats
+# wait for the first run. IDEMPOTENCY_CAPACITY bounds the responses kept in
+# memory; IDEMPOTENCY_BACKEND (sqlite:///path or redis://host:port/db) shares
+# them between workers. Used by the API and the event-bus worker.
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+idempotency = None
+if IDEMPOTENCY_TTL > 0:
+    idempotency_backend = os.getenv("IDEMPOTENCY_BACKEND")
+    idempotency = IdempotencyCache(
+        ttl=IDEMPOTENCY_TTL,
+        capacity=int(os.getenv("IDEMPOTENCY_CAPACITY", "10000")),
+        backend=open_backend(idempotency_backend) if idempotency_backend else None,
+    )
+
+# RETRY_BACKOFF_BASE (seconds, e.g. 0.1) makes retries wait a jittered
+# exponential backoff, doubling per attempt up to RETRY_BACKOFF_MAX, parked on
+# a timer wheel so they hold no thread. RETRY_BUDGET_RATIO (e.g. 0.2) caps
+# retries after failures on a gateway at that share of its traffic plus
+# RETRY_BUDGET_MIN_PER_S. Both are off by default: retries go at once.
+MAX_ATTEMPTS = 3
+retry_budget_ratio = float(os.getenv("RETRY_BUDGET_RATIO", "0"))
+retry_scheduler = RetryScheduler(
+    base=float(os.getenv("RETRY_BACKOFF_BASE", "0")),
+    cap=float(os.getenv("RETRY_BACKOFF_MAX", "2.0")),
+    budget=RetryBudget(
+        ratio=retry_budget_ratio,
+        min_per_second=float(os.getenv("RETRY_BUDGET_MIN_PER_S", "10")),
+    ) if retry_budget_ratio > 0 else None,
+)
+
+# HISTORY_DEPTH caps the entries kept in state["history"] (oldest dropped), so
+# per-payment memory and response size stay bounded however many retries run.
+# Published events are built from it (core.kafka.payment_events), so a depth
+# below 8 * MAX_ATTEMPTS can drop the events of a payment's first attempts.
+HISTORY_DEPTH = int(os.getenv("HISTORY_DEPTH", "30"))
+
+def _record(state: AgentState, entry: Dict[str, Any]):
+    history = state["history"]
+    history.append(entry)
+    if len(history) > HISTORY_DEPTH:
+        del history[:-HISTORY_DEPTH]
 
 def route_step(state: AgentState) -> AgentState:
     """
@@ -28,7 +178,7 @@ def route_step(state: AgentState) -> AgentState:
         # or we could explicitly exclude the failing one.
         pass
     
-    selected_gateway = router.select_gateway()
+    selected_gateway = router.select_gateway(state["payment_context"])
     
     # Check circuit breaker
     status = sentinel.get_status(selected_gateway)
@@ -44,7 +194,10 @@ def route_step(state: AgentState) -> AgentState:
                 break
     
     state["route_decision"] = selected_gateway
-    state["history"].append({"step": "route", "gateway": selected_gateway, "status": sentinel.get_status(selected_gateway)})
+    if state["attempt_count"] == 0:
+        # First attempts fund the gateway's retry budget
+        retry_scheduler.deposit(selected_gateway)
+    _record(state, {"step": "route", "gateway": selected_gateway, "status": sentinel.get_status(selected_gateway)})
     return state
 
 def execute_step(state: AgentState) -> AgentState:
@@ -57,19 +210,86 @@ def execute_step(state: AgentState) -> AgentState:
     logger.info(f"Executing payment {context['transaction_id']} via {gateway}")
     
     result = execute_payment(gateway, context["amount"], context["currency"])
+    return _apply_result(state, gateway, result)
+
+async def aexecute_step(state: AgentState) -> AgentState:
+    """
+    Async variant of execute_step: awaits the gateway instead of blocking.
+    """
+    gateway = state["route_decision"]
+    context = state["payment_context"]
+    
+    logger.info(f"Executing payment {context['transaction_id']} via {gateway}")
     
+    if bulkheads is not None:
+        admitted = await bulkheads.admit(gateway, context, lambda: _alternates(gateway, context))
+        if admitted is None:
+            return _shed(state, gateway)
+        if admitted != gateway:
+            _record(state, {"step": "reroute", "gateway": admitted, "from": gateway, "reason": "bulkhead"})
+            gateway = state["route_decision"] = admitted
+
+    async def call(gw: str) -> Dict[str, Any]:
+        payment = aexecute_payment(gw, context["amount"], context["currency"])
+        if bulkheads is None:
+            return await payment
+        return await bulkheads.run(gw, payment)
+
+    if not (hedger.enabled or hedger.deadline):
+        return _apply_result(state, gateway, await call(gateway))
+
+    def alternate() -> Optional[str]:
+        for gw in _alternates(gateway, context):
+            if bulkheads is None or bulkheads.try_acquire(gw):
+                return gw
+        return None
+
+    for kind, item in await hedger.execute(call, gateway, alternate):
+        if kind == "event":
+            _record(state, item)
+            continue
+        _apply_result(state, item["gateway"], item)
+        if item["status"] == "success":
+            # The gateway that took the payment, for the response and live feed
+            state["route_decision"] = item["gateway"]
+    return state
+
+def _alternates(gateway: str, context: Dict[str, Any]) -> Iterator[str]:
+    """Gateways other than `gateway` whose breaker is not OPEN, best first."""
+    for gw in router.rank(context):
+        if gw != gateway and sentinel.get_status(gw) != "OPEN":
+            yield gw
+
+def _shed(state: AgentState, gateway: str) -> AgentState:
+    """
+    Fails a payment no gateway had room for. The gateways are not at fault,
+    so the router and sentinel learn nothing from it.
+    """
+    state["success"] = False
+    state["attempt_count"] += 1
+    state["last_error"] = "GATEWAY_BUSY"
+    _record(state, {"step": "shed", "gateway": gateway, "error": "GATEWAY_BUSY"})
+    return state
+
+def _apply_result(state: AgentState, gateway: str, result: Dict[str, Any]) -> AgentState:
+    """
+    Records a gateway result on the state and feeds it back to the agents.
+    """
     success = result["status"] == "success"
     state["success"] = success
+    state["attempt_count"] += 1
+    metrics.record(gateway, success, result["latency_ms"], result["error_code"])
+    router.observe_latency(gateway, result["latency_ms"])
     
     if not success:
         state["last_error"] = result["error_code"]
-        state["history"].append({"step": "execute", "result": "failure", "error": result["error_code"]})
+        _record(state, {"step": "execute", "result": "failure", "error": result["error_code"], "gateway": gateway, "latency_ms": result["latency_ms"]})
         # Update components
-        router.update(gateway, success=False)
+        router.update(gateway, success=False, context=state["payment_context"])
         sentinel.record_result(gateway, success=False)
     else:
-        state["history"].append({"step": "execute", "result": "success"})
-        router.update(gateway, success=True)
+        _record(state, {"step": "execute", "result": "success", "gateway": gateway, "latency_ms": result["latency_ms"]})
+        router.update(gateway, success=True, context=state["payment_context"])
         sentinel.record_result(gateway, success=True)
         
     return state
@@ -78,13 +298,21 @@ def recovery_step(state: AgentState) -> AgentState:
     """
     Analyzes failure and decides on intervention.
     """
-    error = state["last_error"]
-    analysis = recovery.analyze_failure(error, state["history"])
-    
+    analysis = recovery.analyze_failure(state["last_error"], state["history"])
+    return _apply_analysis(state, analysis)
+
+def _apply_analysis(state: AgentState, analysis: Dict[str, Any]) -> AgentState:
     state["intervention_plan"] = analysis["action"]
-    state["history"].append({"step": "recovery", "analysis": analysis})
+    _record(state, {"step": "recovery", "analysis": analysis})
+    
+    logger.info("Recovery analysis: %s (%s)", analysis["action"], analysis["summary"])
     
-    logger.info(f"Recovery analysis: {analysis}")
+    if (analysis["action"] in ("retry", "retry_alternate") and not state["success"]
+            and state["attempt_count"] < MAX_ATTEMPTS and not retry_scheduler.allow(state["route_decision"])):
+        # The gateway's retry budget is spent: most likely an outage, which
+        # retries would only add to
+        state["intervention_plan"] = "none"
+        _record(state, {"step": "retry_denied", "gateway": state["route_decision"], "reason": "retry_budget"})
     
     return state
 
@@ -97,30 +325,58 @@ def should_retry(state: AgentState) -> Literal["route_step", "end"]:
     if state["success"]:
         return "end"
         
-    if state["attempt_count"] >= 3:
+    if state["attempt_count"] >= MAX_ATTEMPTS:
         logger.info("Max retries reached.")
         return "end"
         
     if plan in ["retry", "retry_alternate"]:
-        state["attempt_count"] += 1
         return "route_step"
         
     return "end"
 
+def backoff_step(state: AgentState) -> AgentState:
+    """
+    Waits out the backoff before a retry.
+    """
+    delay = retry_scheduler.backoff(state["attempt_count"])
+    _record(state, {"step": "backoff", "delay_ms": delay * 1000})
+    retry_scheduler.sleep(delay)
+    return state
+
+async def abackoff_step(state: AgentState) -> AgentState:
+    # Parks the payment on the timer wheel; the event loop carries on
+    delay = retry_scheduler.backoff(state["attempt_count"])
+    _record(state, {"step": "backoff", "delay_ms": delay * 1000})
+    await retry_scheduler.asleep(delay)
+    return state
+
+async def aroute_step(state: AgentState) -> AgentState:
+    # Pure CPU work; defined so ainvoke runs it on the event loop instead of
+    # handing it to a thread executor.
+    return route_step(state)
+
+async def arecovery_step(state: AgentState) -> AgentState:
+    analysis = await recovery.aanalyze_failure(state["last_error"], state["history"])
+    return _apply_analysis(state, analysis)
+
 # Build Graph
+# Each node carries a sync and an async implementation so the same compiled
+# graph serves both payment_graph.invoke and payment_graph.ainvoke.
 graph_builder = StateGraph(AgentState)
 
-graph_builder.add_node("route_step", route_step)
-graph_builder.add_node("execute_step", execute_step)
-graph_builder.add_node("recovery_step", recovery_step)
+graph_builder.add_node("route_step", RunnableLambda(route_step, afunc=aroute_step))
+graph_builder.add_node("execute_step", RunnableLambda(execute_step, afunc=aexecute_step))
+graph_builder.add_node("recovery_step", RunnableLambda(recovery_step, afunc=arecovery_step))
+graph_builder.add_node("backoff_step", RunnableLambda(backoff_step, afunc=abackoff_step))
 
 graph_builder.set_entry_point("route_step")
 
 graph_builder.add_edge("route_step", "execute_step")
 graph_builder.add_edge("execute_step", "recovery_step")
 graph_builder.add_conditional_edges("recovery_step", should_retry, {
-    "route_step": "route_step",
+    "route_step": "backoff_step",
     "end": END
 })
+graph_builder.add_edge("backoff_step", "route_step")
 
 payment_graph = graph_builder.compile()
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("hedging")
+
+
+class LatencyTracker:
+    """
+    Rolling latency quantile per gateway, over its last `window` attempts.
+    The quantile is recomputed every `refresh` records rather than on each
+    one, and is None until a gateway has min_samples attempts.
+    """
+
+    def __init__(self, quantile: float = 0.95, window: int = 500, min_samples: int = 50, refresh: int = 20):
+        self.quantile = quantile
+        self.window = window
+        self.min_samples = min_samples
+        self.refresh = refresh
+        self._samples: Dict[str, np.ndarray] = {}
+        self._count: Dict[str, int] = {}
+        self._threshold: Dict[str, Optional[float]] = {}
+
+    def record(self, gateway: str, seconds: float):
+        samples = self._samples.get(gateway)
+        if samples is None:
+            samples = self._samples[gateway] = np.zeros(self.window)
+            self._count[gateway] = 0
+            self._threshold[gateway] = None
+        count = self._count[gateway]
+        samples[count % self.window] = seconds
+        count = self._count[gateway] = count + 1
+        if count >= self.min_samples and count % self.refresh == 0:
+            self._threshold[gateway] = float(np.quantile(samples[:min(count, self.window)], self.quantile))
+
+    def threshold(self, gateway: str) -> Optional[float]:
+        return self._threshold.get(gateway)
+
+    def get_state(self) -> Dict[str, Optional[float]]:
+        return {gw: (t * 1000 if t is not None else None) for gw, t in self._threshold.items()}
+
+
+# Cancellation message of attempts past their deadline, so that what they
+# were awaiting can tell them from cancelled hedge losers
+DEADLINE_EXCEEDED = "attempt deadline exceeded"
+
+
+def _timeout_result(gateway: str, deadline: float) -> Dict[str, Any]:
+    return {"status": "failure", "gateway": gateway, "latency_ms": deadline * 1000, "error_code": "TIMEOUT"}
+
+
+class Hedger:
+    """
+    Per-attempt deadlines and hedged gateway calls.
+
+    An attempt not answered within `deadline` seconds is cancelled and
+    counted as a TIMEOUT failure. With hedging on (quantile set), a primary
+    attempt still pending at that gateway's rolling latency quantile gets a
+    duplicate on an alternate gateway; the first success wins, and the
+    other attempt is cancelled if still in flight or voided if it also
+    succeeded. A failure does not end the race while the other attempt can
+    still succeed.
+
+    Hedges are capped at max_ratio of attempts (a token bucket refilled by
+    every attempt), so a gateway that slows down across the board cannot
+    double the load on the others. Attempts cancelled as losers are still
+    recorded at their elapsed time, which keeps the slow tail in the
+    quantile instead of letting hedging hide it.
+    """
+
+    def __init__(
+        self,
+        quantile: Optional[float] = None,
+        deadline: Optional[float] = None,
+        max_ratio: float = 0.1,
+        window: int = 500,
+        min_samples: int = 50,
+    ):
+        self.deadline = deadline
+        self.max_ratio = max_ratio
+        self.tracker = LatencyTracker(quantile or 0.95, window=window, min_samples=min_samples)
+        self.enabled = quantile is not None
+        self._tokens = 1.0
+        self.attempts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.cancelled = 0
+        self.voided = 0
+        self.timeouts = 0
+
+    async def execute(
+        self,
+        call: Callable[[str], Awaitable[Dict[str, Any]]],
+        primary: str,
+        alternate: Callable[[], Optional[str]],
+    ) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Runs call(primary), hedged to alternate() if it is slow. Returns, in
+        order, ("result", gateway result) for every answered or timed-out
+        attempt and ("event", history entry) for hedges, cancellations and
+        voids.
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        self.attempts += 1
+        self._tokens = min(self._tokens + self.max_ratio, 10.0)
+        tasks = {asyncio.ensure_future(call(primary)): (primary, start)}
+        delay = self.tracker.threshold(primary) if self.enabled else None
+        hedge_at = start + delay if delay is not None else None
+        outcome: List[Tuple[str, Dict[str, Any]]] = []
+        winner = None
+
+        while tasks:
+            wake = [started + self.deadline for _, started in tasks.values()] if self.deadline else []
+            if hedge_at is not None:
+                wake.append(hedge_at)
+            timeout = max(0.0, min(wake) - loop.time()) if wake else None
+            done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            now = loop.time()
+
+            # Failures first, so a winning result is always the last one
+            for task in sorted(done, key=lambda t: t.result()["status"] == "success"):
+                gateway, started = tasks.pop(task)
+                result = task.result()
+                self.tracker.record(gateway, now - started)
+                if result["status"] == "success" and winner is not None:
+                    # Both attempts went through before either could be cancelled
+                    self.voided += 1
+                    outcome.append(("event", {"step": "void", "gateway": gateway}))
+                    continue
+                outcome.append(("result", result))
+                if result["status"] == "success":
+                    winner = gateway
+                    if gateway != primary:
+                        self.hedge_wins += 1
+            if winner is not None:
+                for task, (gateway, started) in tasks.items():
+                    task.cancel()
+                    self.tracker.record(gateway, now - started)
+                    self.cancelled += 1
+                    outcome.append(("event", {"step": "cancel", "gateway": gateway}))
+                return outcome
+
+            if self.deadline:
+                for task, (gateway, started) in list(tasks.items()):
+                    if now - started >= self.deadline:
+                        task.cancel(DEADLINE_EXCEEDED)
+                        del tasks[task]
+                        self.tracker.record(gateway, now - started)
+                        self.timeouts += 1
+                        outcome.append(("result", _timeout_result(gateway, self.deadline)))
+
+            if hedge_at is not None and now >= hedge_at:
+                hedge_at = None
+                if tasks and self._tokens >= 1.0:
+                    gateway = alternate()
+                    if gateway is not None:
+                        self._tokens -= 1.0
+                        self.hedges += 1
+                        logger.debug("Hedging %s to %s after %.0f ms", primary, gateway, (now - start) * 1000)
+                        tasks[asyncio.ensure_future(call(gateway))] = (gateway, now)
+                        outcome.append(("event", {"step": "hedge", "gateway": gateway, "after_ms": (now - start) * 1000}))
+        return outcome
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "deadline_s": self.deadline,
+            "attempts": self.attempts,
+            "hedges": self.hedges,
+            "hedge_rate": self.hedges / self.attempts if self.attempts else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "cancelled": self.cancelled,
+            "voided": self.voided,
+            "timeouts": self.timeouts,
+            "thresholds_ms": self.tracker.get_state(),
+        }
@@ -0,0 +1,266 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger("idempotency")
+
+
+class IdempotencyConflict(ValueError):
+    """A transaction_id reused for a payment with different details."""
+
+
+class _LeaderGone(Exception):
+    # The run duplicates were waiting on was cancelled; one of them takes over
+    pass
+
+
+def payment_fingerprint(context: Dict[str, Any]) -> str:
+    """Digest of a payment's details, transaction_id aside."""
+    fields = {k: v for k, v in context.items() if k != "transaction_id"}
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class SQLiteBackend:
+    """
+    Idempotency records in a SQLite file, shared by the worker processes of
+    one host. A record is a claim (no response yet) until its lease lapses,
+    or a completed response until its TTL does. Expired rows are purged
+    every `purge_every` writes.
+    """
+
+    def __init__(self, path: str, purge_every: int = 1000):
+        self.path = path
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS idempotency "
+            "(key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, response TEXT, expires REAL NOT NULL)"
+        )
+
+    def claim(self, key: str, fingerprint: str, lease: float) -> Optional[Tuple[str, Optional[Any]]]:
+        """
+        None if this process now holds `key` for `lease` seconds; otherwise
+        the live record's (fingerprint, response), response None while
+        another process holds it.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT fingerprint, response, expires FROM idempotency WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[2] > now:
+                    return row[0], json.loads(row[1]) if row[1] is not None else None
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO idempotency VALUES (?, ?, NULL, ?)", (key, fingerprint, now + lease)
+                )
+                return None
+            finally:
+                self._conn.execute("COMMIT")
+
+    def put(self, key: str, fingerprint: str, response: Any, ttl: float):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO idempotency VALUES (?, ?, ?, ?)", (key, fingerprint, json.dumps(response), now + ttl)
+            )
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                self._conn.execute("DELETE FROM idempotency WHERE expires <= ?", (now,))
+
+    def release(self, key: str):
+        """Drops this process's claim on a run that did not complete."""
+        with self._lock:
+            self._conn.execute("DELETE FROM idempotency WHERE key = ? AND response IS NULL", (key,))
+
+
+class RedisBackend:
+    """
+    Idempotency records in Redis, shared across hosts; records expire with
+    Redis key TTLs. Needs the redis package, which is not in
+    requirements.txt.
+    """
+
+    def __init__(self, url: str, prefix: str = "idempotency:"):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def claim(self, key: str, fingerprint: str, lease: float) -> Optional[Tuple[str, Optional[Any]]]:
+        name = self.prefix + key
+        claim = json.dumps({"fingerprint": fingerprint, "response": None})
+        while True:
+            if self._client.set(name, claim, nx=True, px=int(lease * 1000)):
+                return None
+            existing = self._client.get(name)
+            if existing is not None:
+                record = json.loads(existing)
+                return record["fingerprint"], record["response"]
+            # Expired between the two calls: try to claim it again
+
+    def put(self, key: str, fingerprint: str, response: Any, ttl: float):
+        record = json.dumps({"fingerprint": fingerprint, "response": response})
+        self._client.set(self.prefix + key, record, px=int(ttl * 1000))
+
+    def release(self, key: str):
+        existing = self._client.get(self.prefix + key)
+        if existing is not None and json.loads(existing)["response"] is None:
+            self._client.delete(self.prefix + key)
+
+
+def open_backend(url: str):
+    """sqlite:///path/to/file.db or redis://host:port/db."""
+    if url.startswith("sqlite://"):
+        return SQLiteBackend(url[len("sqlite://"):])
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unknown idempotency backend {url!r}")
+
+
+class IdempotencyCache:
+    """
+    Runs each transaction_id once and answers repeats with the first run's
+    response for `ttl` seconds.
+
+    Duplicates that arrive while the first run is in flight wait for it
+    instead of starting their own. Completed responses are kept in an LRU
+    of at most `capacity` entries; with a `backend`, they are also shared
+    with other workers, and a worker that finds another one's claim polls
+    for the result every `poll_interval` seconds (taking over if the claim's
+    `lease` lapses first). Runs that raise are not cached. A repeat whose
+    payment details differ from the first raises IdempotencyConflict.
+
+    Responses are shared between callers and must not be mutated, and must
+    be JSON-serializable when a backend is set.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 86400.0,
+        capacity: int = 10_000,
+        backend=None,
+        lease: float = 30.0,
+        poll_interval: float = 0.05,
+    ):
+        self.ttl = ttl
+        self.capacity = capacity
+        self.backend = backend
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._entries: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.conflicts = 0
+
+    async def execute(self, key: str, fingerprint: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            entry = self._lookup(key)
+            if entry is not None:
+                self._check(key, entry[0], fingerprint)
+                self.hits += 1
+                return entry[1]
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            self._check(key, inflight[0], fingerprint)
+            self.coalesced += 1
+            try:
+                # Shielded: a duplicate giving up must not cancel the run
+                return await asyncio.shield(inflight[1])
+            except _LeaderGone:
+                self.coalesced -= 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = (fingerprint, future)
+        try:
+            response = await self._run(key, fingerprint, compute)
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else _LeaderGone())
+            # Marks it retrieved, so it is not logged when nobody was waiting
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+        future.set_result(response)
+        return response
+
+    async def _run(self, key: str, fingerprint: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        if self.backend is not None:
+            while True:
+                record = await asyncio.to_thread(self.backend.claim, key, fingerprint, self.lease)
+                if record is None:
+                    break
+                self._check(key, record[0], fingerprint)
+                if record[1] is not None:
+                    # Completed by another worker
+                    self.hits += 1
+                    self._store(key, fingerprint, record[1])
+                    return record[1]
+                await asyncio.sleep(self.poll_interval)
+
+        self.misses += 1
+        try:
+            response = await compute()
+        except BaseException:
+            if self.backend is not None:
+                try:
+                    await asyncio.to_thread(self.backend.release, key)
+                except Exception as e:
+                    # Raise the run's error, not this one; the claim lapses with its lease
+                    logger.error(f"Releasing idempotency claim for {key} failed: {e}")
+            raise
+        self._store(key, fingerprint, response)
+        if self.backend is not None:
+            try:
+                await asyncio.to_thread(self.backend.put, key, fingerprint, response, self.ttl)
+            except Exception as e:
+                # The payment went through; other workers see the claim lapse
+                logger.error(f"Storing idempotency record for {key} failed: {e}")
+        return response
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires, fingerprint, response = entry
+        if time.monotonic() > expires:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return fingerprint, response
+
+    def _store(self, key: str, fingerprint: str, response: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, fingerprint, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def _check(self, key: str, stored: str, fingerprint: str):
+        if stored != fingerprint:
+            self.conflicts += 1
+            raise IdempotencyConflict(f"transaction_id {key} was already used for a different payment")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "ttl_s": self.ttl,
+            "size": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "conflicts": self.conflicts,
+            "backend": type(self.backend).__name__ if self.backend is not None else None,
+        }
@@ -1,78 +1,608 @@
 import json
 import logging
-from typing import Callable, Any, Dict
+import os
+from collections import namedtuple
+from datetime import datetime
+from typing import Callable, Any, Dict, List, Optional, Tuple
 import queue
 import threading
 import time
 
+from pydantic import BaseModel
+
+from data.schemas import codec
+
 logger = logging.getLogger("kafka_mock")
 
+TOPIC_TRANSACTIONS = "transactions"
+# TransactionEvents waiting to be processed by core.worker.PaymentWorker
+TOPIC_PAYMENT_REQUESTS = "payment_requests"
+# payment_requests messages that are not valid TransactionEvents, with the
+# validation error, so they do not block the topic
+TOPIC_DEAD_LETTERS = "payment_requests.dead_letters"
+TOPIC_RESULTS = "payment_results"
+TOPIC_INTERVENTIONS = "interventions"
+
+
+# Event models go on the wire in the binary format of data.schemas.codec
+# unless EVENT_CODEC=json. Consumers accept both, and decode binary events
+# without re-validating them unless EVENT_TRUSTED_DECODE=0.
+EVENT_CODEC = os.getenv("EVENT_CODEC", "binary")
+EVENT_TRUSTED_DECODE = os.getenv("EVENT_TRUSTED_DECODE", "1") == "1"
+
+
+def serialize(message: Any) -> bytes:
+    if EVENT_CODEC == "binary" and codec.encodable(message):
+        return codec.encode(message)
+    if isinstance(message, BaseModel):
+        return message.model_dump_json().encode("utf-8")
+    return json.dumps(message, default=str).encode("utf-8")
+
+
+def deserialize(raw: bytes) -> Any:
+    if codec.is_encoded(raw):
+        return codec.decode(raw, trusted=EVENT_TRUSTED_DECODE)
+    return json.loads(raw)
+
+
+# In-process broker used by the mock event bus, and (through the
+# LocalKafka* clients below) as a stand-in for a Kafka cluster in tests.
+
+TopicPartition = namedtuple("TopicPartition", ["topic", "partition"])
+LocalRecord = namedtuple("LocalRecord", ["topic", "partition", "offset", "key", "value"])
+
+
+class TopicLog:
+    """
+    Bounded log of one single-partition topic: the last `capacity` messages
+    in a ring, plus the committed offset of every consumer group.
+    """
+    __slots__ = ("capacity", "values", "keys", "end", "committed", "active")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.values: List[Any] = [None] * capacity
+        self.keys: List[Any] = [None] * capacity
+        self.end = 0  # offset of the next message
+        self.committed: Dict[str, int] = {}
+        self.active: Dict[str, int] = {}  # group -> attached consumers
+
+    @property
+    def start(self) -> int:
+        return max(0, self.end - self.capacity)
+
+    def free(self) -> int:
+        """Messages that can be appended without overwriting any active group's unconsumed ones."""
+        if not self.active:
+            return self.capacity
+        return self.capacity - (self.end - min(self.committed[g] for g in self.active))
+
+
+class LocalBroker:
+    """
+    In-process broker: per-topic ring-buffer logs and independent offsets
+    per consumer group, with no serialisation.
+
+    Messages are appended and fetched in batches under one lock acquisition.
+    A producer that would overwrite messages an attached group has not yet
+    committed blocks until that group catches up (for at most max_block
+    seconds, then TimeoutError); with no group attached the oldest
+    messages are overwritten.
+    """
+
+    def __init__(self, capacity: int = 65_536, max_block: float = 60.0):
+        self.capacity = capacity
+        self.max_block = max_block
+        self.logs: Dict[str, TopicLog] = {}
+        self._lock = threading.Lock()
+        self._data = threading.Condition(self._lock)
+        self._space = threading.Condition(self._lock)
+
+    def _log(self, topic: str) -> TopicLog:
+        log = self.logs.get(topic)
+        if log is None:
+            log = self.logs[topic] = TopicLog(self.capacity)
+        return log
+
+    def append(self, topic: str, key: Any, value: Any):
+        with self._lock:
+            log = self._log(topic)
+            if not log.free() and not self._space.wait_for(log.free, self.max_block):
+                raise TimeoutError(f"Topic {topic} is full: message not appended after {self.max_block}s")
+            slot = log.end % log.capacity
+            log.values[slot] = value
+            log.keys[slot] = key
+            log.end += 1
+            self._data.notify_all()
+
+    def append_many(self, topic: str, values: List[Any], keys: Optional[List[Any]] = None):
+        with self._lock:
+            log = self._log(topic)
+            written = 0
+            while written < len(values):
+                if not log.free() and not self._space.wait_for(log.free, self.max_block):
+                    raise TimeoutError(f"Topic {topic} is full: {len(values) - written} messages not appended after {self.max_block}s")
+                n = min(log.free(), len(values) - written)
+                chunk = values[written:written + n]
+                chunk_keys = keys[written:written + n] if keys else [None] * n
+                # Copy in at most two slices, wrapping at the end of the ring
+                slot = log.end % log.capacity
+                head = min(n, log.capacity - slot)
+                log.values[slot:slot + head] = chunk[:head]
+                log.keys[slot:slot + head] = chunk_keys[:head]
+                log.values[:n - head] = chunk[head:]
+                log.keys[:n - head] = chunk_keys[head:]
+                log.end += n
+                written += n
+                self._data.notify_all()
+
+    def subscribe(self, topic: str, group: str) -> int:
+        """Attaches a consumer of `group`; returns the offset to resume from."""
+        with self._lock:
+            log = self._log(topic)
+            # New groups start at the oldest retained message
+            offset = max(log.committed.setdefault(group, log.start), log.start)
+            log.committed[group] = offset
+            log.active[group] = log.active.get(group, 0) + 1
+            return offset
+
+    def unsubscribe(self, topic: str, group: str):
+        """Detaches a consumer; the group keeps its offset but no longer holds producers back."""
+        with self._lock:
+            log = self._log(topic)
+            log.active[group] -= 1
+            if not log.active[group]:
+                del log.active[group]
+            self._space.notify_all()
+
+    def fetch(self, topic: str, offset: int, max_records: int, timeout: float) -> Tuple[int, List[Any], List[Any]]:
+        """
+        Up to max_records messages from `offset` (or the oldest retained one,
+        if it was overwritten), waiting up to timeout for any to arrive.
+        Returns (first offset, values, keys).
+        """
+        with self._lock:
+            log = self._log(topic)
+            if log.end <= offset:
+                self._data.wait_for(lambda: log.end > offset, timeout)
+            first = max(offset, log.start)
+            last = min(log.end, first + max_records)
+            if first >= last:
+                return first, [], []
+            i, j = first % log.capacity, last % log.capacity
+            if i < j:
+                return first, log.values[i:j], log.keys[i:j]
+            return first, log.values[i:] + log.values[:j], log.keys[i:] + log.keys[:j]
+
+    def commit(self, topic: str, group: str, offset: int):
+        with self._lock:
+            log = self._log(topic)
+            log.committed[group] = offset
+            self._space.notify_all()
+
+
 # Mock Kafka for standalone execution without docker-compose dependencies running
 class MockKafkaProducer:
-    def __init__(self, topic: str):
+    def __init__(self, topic: str, broker: LocalBroker, key_field: Optional[str] = None):
         self.topic = topic
-    
-    def send(self, message: Dict[str, Any]):
-        logger.info(f"MOCK PRODUCER [{self.topic}]: {json.dumps(message)}")
-        # In a real mock, we might push to a shared queue if we had consumers in the same process
+        self.broker = broker
+        self.key_field = key_field
+
+    def send(self, message: Any, key: Optional[str] = None):
+        if key is None and self.key_field:
+            key = getattr(message, self.key_field, None) if isinstance(message, BaseModel) else message.get(self.key_field)
+        self.broker.append(self.topic, key, message)
+
+    def send_many(self, messages: List[Any]):
+        self.broker.append_many(self.topic, messages)
+
+    def flush(self, timeout: Optional[float] = None):
         pass
-    
+
     def close(self):
         pass
 
 class MockKafkaConsumer:
-    def __init__(self, topic: str, callback: Callable[[Dict[str, Any]], None]):
+    """
+    Consumer of one topic for one group on a LocalBroker. Messages are
+    delivered as sent, one at a time to callback (or as a list, with
+    batch=True), and committed after each delivered batch.
+    """
+
+    def __init__(
+        self,
+        topic: str,
+        callback: Callable[[Any], None],
+        broker: Optional[LocalBroker] = None,
+        group_id: str = "payment-agent",
+        batch: bool = False,
+        max_records: int = 500,
+    ):
         self.topic = topic
         self.callback = callback
+        self.broker = broker or LocalBroker()
+        self.group_id = group_id
+        self.batch = batch
+        self.max_records = max_records
         self.running = False
         self.thread = None
-        self._queue = queue.Queue()
+        self.processed = 0
+        self.position = self.broker.subscribe(topic, group_id)
 
     def start(self):
         self.running = True
-        self.thread = threading.Thread(target=self._consume_loop)
+        self.thread = threading.Thread(target=self._consume_loop, name=f"consumer-{self.topic}", daemon=True)
         self.thread.start()
-    
+
     def stop(self):
         self.running = False
         if self.thread:
             self.thread.join()
+        self.broker.unsubscribe(self.topic, self.group_id)
 
     def _consume_loop(self):
         while self.running:
+            first, messages, _ = self.broker.fetch(self.topic, self.position, self.max_records, 0.1)
+            if not messages:
+                continue
             try:
-                msg = self._queue.get(timeout=1.0)
-                self.callback(msg)
-            except queue.Empty:
+                if self.batch:
+                    self.callback(messages)
+                else:
+                    for msg in messages:
+                        self.callback(msg)
+            except Exception as e:
+                logger.error(f"Processing {len(messages)} messages from {self.topic} failed, will retry: {e}")
+                time.sleep(0.1)
                 continue
+            self.position = first + len(messages)
+            self.broker.commit(self.topic, self.group_id, self.position)
+            self.processed += len(messages)
 
     # Method to simulate receiving a message from external source
-    def inject_message(self, message: Dict[str, Any]):
-        self._queue.put(message)
+    def inject_message(self, message: Any):
+        self.broker.append(self.topic, None, message)
+
+
+class _Delivered:
+    """Already-completed send future."""
+
+    def add_errback(self, fn, *args, **kwargs):
+        return self
+
+
+class LocalKafkaProducer:
+    """The part of kafka.KafkaProducer that TopicProducer uses, on a LocalBroker."""
+
+    def __init__(self, broker: LocalBroker):
+        self.broker = broker
+
+    def send(self, topic: str, value: bytes, key: Optional[bytes] = None):
+        self.broker.append(topic, key, value)
+        return _Delivered()
+
+    def flush(self, timeout: Optional[float] = None):
+        pass
+
+    def close(self, timeout: Optional[float] = None):
+        pass
+
+
+class LocalKafkaConsumer:
+    """The part of kafka.KafkaConsumer that BatchConsumer uses, on a LocalBroker."""
+
+    def __init__(self, broker: LocalBroker, topic: str, group_id: str):
+        self.broker = broker
+        self.tp = TopicPartition(topic, 0)
+        self.group_id = group_id
+        self.position = broker.subscribe(topic, group_id)
+
+    def poll(self, timeout_ms: int = 0, max_records: Optional[int] = None) -> Dict[TopicPartition, List[LocalRecord]]:
+        first, values, keys = self.broker.fetch(self.tp.topic, self.position, max_records or 500, timeout_ms / 1000)
+        if not values:
+            return {}
+        self.position = first + len(values)
+        return {self.tp: [LocalRecord(self.tp.topic, 0, first + i, k, v) for i, (k, v) in enumerate(zip(keys, values))]}
+
+    def seek(self, partition: TopicPartition, offset: int):
+        self.position = offset
+
+    def commit(self):
+        self.broker.commit(self.tp.topic, self.group_id, self.position)
+
+    def close(self):
+        self.broker.unsubscribe(self.tp.topic, self.group_id)
+
+
+def _default_compression() -> str:
+    try:
+        import zstandard  # noqa: F401
+        return "zstd"
+    except ImportError:
+        return "gzip"
+
+
+# Producers favour throughput: records wait up to linger_ms to fill large
+# compressed batches. Nothing on the request path waits for a send.
+PRODUCER_CONFIG = {
+    "linger_ms": int(os.getenv("KAFKA_LINGER_MS", "20")),
+    "batch_size": int(os.getenv("KAFKA_BATCH_SIZE", str(256 * 1024))),
+    "compression_type": os.getenv("KAFKA_COMPRESSION") or _default_compression(),
+    "acks": 1,
+    "buffer_memory": 64 * 1024 * 1024,
+}
+
+CONSUMER_CONFIG = {
+    "enable_auto_commit": False,
+    "auto_offset_reset": "earliest",
+    "max_poll_records": int(os.getenv("KAFKA_MAX_POLL_RECORDS", "500")),
+    "fetch_min_bytes": 1,
+    "fetch_max_wait_ms": 100,
+}
+
+
+class TopicProducer:
+    """
+    Sends messages to one topic through a shared, batching producer client.
+    send() only serialises and appends to the client's batch buffer.
+    """
+
+    def __init__(self, client, topic: str, key_field: Optional[str] = None):
+        self.client = client
+        self.topic = topic
+        self.key_field = key_field
+        self.sent = 0
+        self.errors = 0
+
+    def send(self, message: Any, key: Optional[str] = None):
+        if key is None and self.key_field:
+            key = getattr(message, self.key_field, None) if isinstance(message, BaseModel) else message.get(self.key_field)
+        future = self.client.send(self.topic, value=serialize(message), key=key.encode("utf-8") if key else None)
+        future.add_errback(self._on_error)
+        self.sent += 1
+
+    def _on_error(self, exc: Exception):
+        self.errors += 1
+        logger.error(f"Send to {self.topic} failed: {exc}")
+
+    def flush(self, timeout: Optional[float] = None):
+        self.client.flush(timeout)
+
+    def close(self):
+        self.flush()
+
+
+class BatchConsumer:
+    """
+    Consumes a topic in batches of up to max_records: every message of a
+    batch is handed to callback (or the whole list to it, with batch=True),
+    then the batch's offsets are committed.
+
+    The next batch is only fetched once the previous one has been processed
+    and committed, so a slow callback slows consumption instead of piling up
+    messages in memory. If processing raises, the batch is not committed and
+    is fetched again (at-least-once delivery).
+    """
+
+    def __init__(
+        self,
+        client,
+        topic: str,
+        callback: Callable[[Any], None],
+        batch: bool = False,
+        max_records: int = 500,
+        poll_timeout_ms: int = 1000,
+        retry_backoff: float = 1.0,
+    ):
+        self.client = client
+        self.topic = topic
+        self.callback = callback
+        self.batch = batch
+        self.max_records = max_records
+        self.poll_timeout_ms = poll_timeout_ms
+        self.retry_backoff = retry_backoff
+        self.running = False
+        self.thread = None
+        self.processed = 0
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._consume_loop, name=f"consumer-{self.topic}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+        self.client.close()
+
+    def _consume_loop(self):
+        while self.running:
+            records = self.client.poll(timeout_ms=self.poll_timeout_ms, max_records=self.max_records)
+            if not records:
+                continue
+            messages = [deserialize(r.value) for part in records.values() for r in part]
+            try:
+                if self.batch:
+                    self.callback(messages)
+                else:
+                    for message in messages:
+                        self.callback(message)
+            except Exception as e:
+                logger.error(f"Processing {len(messages)} messages from {self.topic} failed, will retry: {e}")
+                for tp, part in records.items():
+                    self.client.seek(tp, part[0].offset)
+                time.sleep(self.retry_backoff)
+                continue
+            self.client.commit()
+            self.processed += len(messages)
+
 
 # Interface to switch between Real and Mock
 class EventBus:
-    def __init__(self, use_mock: bool = True):
+    def __init__(
+        self,
+        use_mock: bool = True,
+        bootstrap_servers: Optional[str] = None,
+        broker: Optional[LocalBroker] = None,
+        group_id: str = "payment-agent",
+    ):
+        """
+        With use_mock=True (the default) messages are passed as objects
+        through an in-process LocalBroker (`broker`, or a new one). With
+        use_mock=False they are serialised and go to the Kafka cluster at
+        bootstrap_servers (default $KAFKA_BOOTSTRAP_SERVERS), or to `broker`
+        when a LocalBroker is given.
+        """
         self.use_mock = use_mock
+        self.bootstrap_servers = bootstrap_servers or os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+        if use_mock and broker is None:
+            broker = LocalBroker()
+        self.broker = broker
+        self.group_id = group_id
         self.producers = {}
         self.consumers = []
+        self._client = None
 
-    def get_producer(self, topic: str):
-        if self.use_mock:
-            if topic not in self.producers:
-                self.producers[topic] = MockKafkaProducer(topic)
-            return self.producers[topic]
-        else:
-            # Placeholder for real KafkaProducer
-            from kafka import KafkaProducer
-            return KafkaProducer(value_serializer=lambda v: json.dumps(v).encode('utf-8'))
+    def _producer_client(self):
+        if self._client is None:
+            if self.broker is not None:
+                self._client = LocalKafkaProducer(self.broker)
+            else:
+                from kafka import KafkaProducer
+                self._client = KafkaProducer(bootstrap_servers=self.bootstrap_servers, **PRODUCER_CONFIG)
+        return self._client
+
+    def get_producer(self, topic: str, key_field: Optional[str] = None):
+        if topic not in self.producers:
+            if self.use_mock:
+                self.producers[topic] = MockKafkaProducer(topic, self.broker, key_field)
+            else:
+                self.producers[topic] = TopicProducer(self._producer_client(), topic, key_field)
+        return self.producers[topic]
 
-    def start_consumer(self, topic: str, callback: Callable[[Dict[str, Any]], None]):
+    def start_consumer(self, topic: str, callback: Callable[[Dict[str, Any]], None], batch: bool = False, group_id: Optional[str] = None):
+        group_id = group_id or self.group_id
         if self.use_mock:
-            consumer = MockKafkaConsumer(topic, callback)
-            consumer.start()
-            self.consumers.append(consumer)
-            return consumer
+            consumer = MockKafkaConsumer(topic, callback, self.broker, group_id, batch=batch)
         else:
-            # Placeholder for real KafkaConsumer logic
-            pass
+            if self.broker is not None:
+                client = LocalKafkaConsumer(self.broker, topic, group_id)
+            else:
+                from kafka import KafkaConsumer
+                client = KafkaConsumer(topic, bootstrap_servers=self.bootstrap_servers, group_id=group_id, **CONSUMER_CONFIG)
+            consumer = BatchConsumer(client, topic, callback, batch=batch, max_records=CONSUMER_CONFIG["max_poll_records"])
+        consumer.start()
+        self.consumers.append(consumer)
+        return consumer
+
+    def close(self):
+        for consumer in self.consumers:
+            consumer.stop()
+        for producer in self.producers.values():
+            producer.close()
+        if self._client is not None:
+            self._client.close()
+
+
+def payment_events(final_state: Dict[str, Any], timestamp: Optional[datetime] = None) -> List[Tuple[str, BaseModel]]:
+    """
+    The TransactionEvent, PaymentResults (one per gateway attempt) and
+    Interventions (one per recovery action) of a finished payment, with
+    their topics. `timestamp` is the TransactionEvent's (when the payment
+    came in; now if not given).
+
+    They are read from final_state["history"], which core.graph caps at the
+    last HISTORY_DEPTH entries: results and interventions of entries dropped
+    from it are not published. The default depth (30) holds MAX_ATTEMPTS
+    attempts even with hedging, rerouting and backoff (at most 8 entries
+    each); lower it and long payments lose their earliest events.
+    """
+    from data.schemas.events import Intervention, PaymentResult, TransactionEvent
+
+    context = final_state["payment_context"]
+    events: List[Tuple[str, BaseModel]] = [(TOPIC_TRANSACTIONS, TransactionEvent(
+        transaction_id=context["transaction_id"],
+        timestamp=timestamp or datetime.utcnow(),
+        merchant_id=context["merchant_id"],
+        amount=context["amount"],
+        currency=context["currency"],
+        payment_method=context["payment_method"],
+        bin=context.get("bin"),
+    ))]
+    # The failure each recovery answered: the latest failed execute (or
+    # bulkhead shed) before it
+    last_error = None
+    for entry in final_state["history"]:
+        step = entry.get("step")
+        if step == "shed":
+            last_error = entry.get("error")
+        elif step == "execute":
+            if entry["result"] != "success":
+                last_error = entry.get("error")
+            events.append((TOPIC_RESULTS, PaymentResult(
+                transaction_id=context["transaction_id"],
+                gateway=entry.get("gateway") or "",
+                status=entry["result"],
+                error_code=entry.get("error"),
+                latency_ms=entry.get("latency_ms", 0.0),
+            )))
+        elif step == "recovery" and entry["analysis"]["action"] != "none":
+            analysis = entry["analysis"]
+            events.append((TOPIC_INTERVENTIONS, Intervention(
+                transaction_id=context["transaction_id"],
+                action=analysis["action"],
+                reason=analysis["summary"],
+                parameters={"confidence": analysis["confidence"], "error_code": last_error},
+            )))
+    return events
+
+
+class EventPublisher:
+    """
+    Publishes the events of finished payments from a background thread.
+
+    The request path only enqueues the final state. When the queue is full
+    (the bus is down or too slow) events are dropped and counted rather than
+    slowing payments down.
+    """
+
+    KEY_FIELDS = {
+        TOPIC_TRANSACTIONS: "merchant_id",
+        TOPIC_PAYMENT_REQUESTS: "merchant_id",
+        TOPIC_RESULTS: "transaction_id",
+        TOPIC_INTERVENTIONS: "transaction_id",
+        TOPIC_DEAD_LETTERS: None,
+    }
+
+    def __init__(self, bus: EventBus, maxsize: int = 10_000):
+        self.bus = bus
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self.thread = threading.Thread(target=self._run, name="event-publisher", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def publish(self, final_state: Dict[str, Any]):
+        try:
+            self._queue.put_nowait((datetime.utcnow(), final_state))
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        self._queue.put(None)
+        self.thread.join()
+        self.bus.close()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            enqueued_at, final_state = item
+            try:
+                for topic, event in payment_events(final_state, enqueued_at):
+                    self.bus.get_producer(topic, self.KEY_FIELDS[topic]).send(event)
+            except Exception as e:
+                logger.error(f"Publishing events for {final_state.get('transaction_id')} failed: {e}")
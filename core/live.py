@@ -0,0 +1,189 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("live")
+
+
+def _sse(event: str, payload: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, default=str)}\n\n"
+
+
+class LiveFeed:
+    """
+    Server-push feed of processed payments and router/sentinel state,
+    served as Server-Sent Events on /events/stream.
+
+    publish() runs on the request path for every payment. It always bumps
+    a few counters, so totals are cumulative since startup whether or not
+    anyone watched; with subscribers it also keeps the payment if it wins
+    a reservoir sample. Once per interval a single frame is built and
+    serialised for all subscribers: the totals plus at most max_samples
+    payments of that interval. The cost of
+    watching therefore depends neither on the payment rate nor on the
+    number of subscribers.
+
+    State frames are sent when a circuit changes status, and otherwise at
+    most every status_interval seconds when something changed. A subscriber
+    more than `backlog` frames behind has its backlog replaced by the
+    latest state and tick; totals are cumulative, so it only loses samples.
+
+    All methods run on the event loop.
+    """
+
+    def __init__(
+        self,
+        router,
+        sentinel,
+        render: Callable[[Dict[str, Any]], Dict[str, Any]],
+        interval: float = 0.5,
+        max_samples: int = 20,
+        status_interval: float = 2.0,
+        backlog: int = 8,
+        keepalive: float = 15.0,
+    ):
+        self.router = router
+        self.sentinel = sentinel
+        self.render = render
+        self.interval = interval
+        self.max_samples = max_samples
+        self.status_interval = status_interval
+        self.backlog = backlog
+        self.keepalive = keepalive
+        self.totals: Dict[str, Any] = {"processed": 0, "successes": 0, "interventions": 0, "latency_ms": 0.0, "routes": {}}
+        self.frames = 0
+        self.coalesced = 0
+        self._seen = 0
+        self._samples: List[Tuple[Dict[str, Any], float, float]] = []
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._status: Optional[str] = None
+        self._status_frame: Optional[str] = None
+        self._circuits: Optional[Dict[str, str]] = None
+        self._status_at = 0.0
+        self._tick_frame: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+    def publish(self, final_state: Dict[str, Any], latency_ms: float):
+        totals = self.totals
+        totals["processed"] += 1
+        if final_state["success"]:
+            totals["successes"] += 1
+        if final_state["intervention_plan"] not in (None, "none"):
+            totals["interventions"] += 1
+        totals["latency_ms"] += latency_ms
+        routes = totals["routes"]
+        route = final_state["route_decision"]
+        routes[route] = routes.get(route, 0) + 1
+        if not self._subscribers:
+            return
+
+        # Reservoir sampling: every payment of the interval is equally likely
+        # to be among the samples
+        self._seen += 1
+        if len(self._samples) < self.max_samples:
+            self._samples.append((final_state, latency_ms, time.time()))
+        else:
+            j = random.randrange(self._seen)
+            if j < self.max_samples:
+                self._samples[j] = (final_state, latency_ms, time.time())
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(self.backlog)
+        if self._status_frame is None or not self._subscribers:
+            self._refresh_status(force=True)
+        queue.put_nowait(self._status_frame)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+        if not self._subscribers:
+            self._seen = 0
+            self._samples = []
+
+    async def stream(self) -> AsyncIterator[str]:
+        """SSE text for one subscriber, until the client disconnects."""
+        queue = self.subscribe()
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), self.keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(queue)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"subscribers": len(self._subscribers), "frames": self.frames, "coalesced": self.coalesced}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self._subscribers:
+                continue
+            try:
+                self._tick()
+            except Exception as e:
+                logger.error(f"Live feed tick failed: {e}")
+
+    def _tick(self):
+        if self._refresh_status():
+            self._broadcast(self._status_frame)
+        if not self._seen:
+            return
+        samples, seen = self._samples, self._seen
+        self._samples, self._seen = [], 0
+        transactions = []
+        for final_state, latency_ms, ts in samples:
+            tx = self.render(final_state)
+            tx["latency"] = latency_ms
+            tx["timestamp"] = ts
+            transactions.append(tx)
+        self._tick_frame = _sse("tick", {
+            "ts": time.time(),
+            "totals": self.totals,
+            "sampled": len(transactions),
+            "of": seen,
+            "transactions": transactions,
+        })
+        self._broadcast(self._tick_frame)
+
+    def _refresh_status(self, force: bool = False) -> bool:
+        """Rebuilds the state frame when due; True if it changed."""
+        now = time.monotonic()
+        sentinel = self.sentinel.get_all_statuses()
+        circuits = {gw: s["status"] for gw, s in sentinel.items()}
+        if not force and circuits == self._circuits and now - self._status_at < self.status_interval:
+            return False
+        status = json.dumps({"router": self.router.get_state(), "sentinel": sentinel}, default=str)
+        self._circuits = circuits
+        self._status_at = now
+        if status == self._status:
+            return False
+        self._status = status
+        self._status_frame = f"event: status\ndata: {status}\n\n"
+        return True
+
+    def _broadcast(self, frame: str):
+        self.frames += 1
+        for queue in self._subscribers:
+            if queue.full():
+                # Slow client: skip it ahead to the current state
+                self.coalesced += queue.qsize()
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(self._status_frame)
+                if frame is not self._status_frame and self._tick_frame is not None:
+                    queue.put_nowait(self._tick_frame)
+            else:
+                queue.put_nowait(frame)
@@ -0,0 +1,199 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import accumulate
+from typing import Any, Callable, Dict, List, Optional
+
+# Latencies are bucketed HDR-style: values are kept in microseconds, and
+# each power-of-two range is split into SUB_BUCKETS equal buckets, so any
+# recorded value is known to within 1/SUB_BUCKETS (~1.6%) at every scale.
+# Histograms are sparse {bucket index: count} dicts: latencies cluster in a
+# few dozen buckets, so a slot costs little memory however wide the range.
+SUB_BITS = 6
+SUB_BUCKETS = 1 << SUB_BITS
+MAX_SHIFT = 30  # values up to ~2^37 us (~38 hours) before clamping
+NUM_BUCKETS = (MAX_SHIFT + 2) * SUB_BUCKETS
+
+
+def bucket_index(value_us: int) -> int:
+    shift = value_us.bit_length() - SUB_BITS - 1
+    if shift <= 0:
+        return value_us
+    if shift > MAX_SHIFT:
+        return NUM_BUCKETS - 1
+    return shift * SUB_BUCKETS + (value_us >> shift)
+
+
+def bucket_value(index: int) -> float:
+    """Midpoint, in microseconds, of the values that land in bucket index."""
+    shift = max(0, index // SUB_BUCKETS - 1)
+    low = (index - shift * SUB_BUCKETS) << shift
+    return low + ((1 << shift) - 1) / 2
+
+
+def percentiles(histogram: Dict[int, int], qs: List[float]) -> List[Optional[float]]:
+    """Values (in ms) at each quantile q of a bucket histogram."""
+    if not histogram:
+        return [None] * len(qs)
+    indexes = sorted(histogram)
+    cumulative = list(accumulate(histogram[i] for i in indexes))
+    total = cumulative[-1]
+    return [bucket_value(indexes[bisect_left(cumulative, max(1, q * total))]) / 1000 for q in qs]
+
+
+class GatewayStats:
+    __slots__ = ("attempts", "failures", "latency_sum_ms", "histogram")
+
+    def __init__(self):
+        self.attempts = 0
+        self.failures = 0
+        self.latency_sum_ms = 0.0
+        self.histogram: Dict[int, int] = defaultdict(int)
+
+    def merge(self, other: "GatewayStats"):
+        self.attempts += other.attempts
+        self.failures += other.failures
+        self.latency_sum_ms += other.latency_sum_ms
+        for index, count in list(other.histogram.items()):
+            self.histogram[index] += count
+
+
+class _Slot:
+    """Counters for one time slot of one writer thread."""
+    __slots__ = ("epoch", "gateways", "errors")
+
+    def __init__(self, epoch: int):
+        self.epoch = epoch
+        self.gateways: Dict[str, GatewayStats] = {}
+        self.errors: Dict[str, int] = defaultdict(int)
+
+
+class _Ring(list):
+    """One writer thread's slots; `active` while it is in the aggregator's list."""
+    __slots__ = ("active",)
+
+    def __init__(self, slots: List[_Slot]):
+        super().__init__(slots)
+        self.active = True
+
+
+class MetricsAggregator:
+    """
+    Rolling per-gateway and per-error-code counters and latency histograms.
+
+    Time is split into num_slots slots of slot_seconds; a snapshot merges
+    the slots covering the requested window. Every writer thread records
+    into its own ring of slots, so record() takes no lock and is O(1): a
+    bucket index, a few increments and, once per slot period, a fresh slot.
+    Readers merge all rings and skip slots that have aged out, and drop
+    rings with no slot left in the window (as does each new writer), so
+    threads that come and go do not accumulate rings; a dropped ring's
+    thread re-adds it on its next fresh slot.
+    """
+
+    def __init__(self, slot_seconds: float = 10.0, num_slots: int = 30, clock: Callable[[], float] = time.time):
+        self.slot_seconds = slot_seconds
+        self.num_slots = num_slots
+        self.clock = clock
+        self._local = threading.local()
+        self._rings: List[_Ring] = []
+        self._rings_lock = threading.Lock()
+
+    def _ring(self) -> _Ring:
+        ring = getattr(self._local, "ring", None)
+        if ring is None:
+            ring = self._local.ring = _Ring([_Slot(-1) for _ in range(self.num_slots)])
+            with self._rings_lock:
+                # New threads prune too, for when nobody reads the metrics
+                self._prune(int(self.clock() // self.slot_seconds) - self.num_slots + 1)
+                self._rings.append(ring)
+        return ring
+
+    def _prune(self, oldest: int):
+        # Under _rings_lock. A ring whose newest slot is older than the ring
+        # itself spans has nothing any window can read. Its writer may be
+        # starting a fresh slot right now: it only re-adds the ring once
+        # `active` is False, so look again after clearing it
+        kept = []
+        for ring in self._rings:
+            if max(slot.epoch for slot in ring) >= oldest:
+                kept.append(ring)
+                continue
+            ring.active = False
+            if max(slot.epoch for slot in ring) >= oldest:
+                ring.active = True
+                kept.append(ring)
+        self._rings[:] = kept
+
+    def record(self, gateway: str, success: bool, latency_ms: float, error_code: Optional[str] = None):
+        epoch = int(self.clock() // self.slot_seconds)
+        ring = self._ring()
+        i = epoch % self.num_slots
+        slot = ring[i]
+        if slot.epoch != epoch:
+            slot = ring[i] = _Slot(epoch)
+            if not ring.active:
+                with self._rings_lock:
+                    if not ring.active:
+                        ring.active = True
+                        self._rings.append(ring)
+
+        stats = slot.gateways.get(gateway)
+        if stats is None:
+            stats = slot.gateways[gateway] = GatewayStats()
+        stats.attempts += 1
+        stats.latency_sum_ms += latency_ms
+        stats.histogram[bucket_index(int(latency_ms * 1000))] += 1
+        if not success:
+            stats.failures += 1
+            slot.errors[error_code or "UNKNOWN"] += 1
+
+    def snapshot(self, window_seconds: float = 60.0, quantiles=(0.5, 0.95, 0.99)) -> Dict[str, Any]:
+        """Counts, success rate and latency quantiles over the last window_seconds."""
+        now_epoch = int(self.clock() // self.slot_seconds)
+        num = min(self.num_slots, max(1, math.ceil(window_seconds / self.slot_seconds)))
+        oldest = now_epoch - num + 1
+
+        merged: Dict[str, GatewayStats] = {}
+        errors: Dict[str, int] = defaultdict(int)
+        with self._rings_lock:
+            self._prune(now_epoch - self.num_slots + 1)
+            rings = list(self._rings)
+        for ring in rings:
+            for slot in list(ring):
+                if not oldest <= slot.epoch <= now_epoch:
+                    continue
+                for gateway, stats in list(slot.gateways.items()):
+                    into = merged.get(gateway)
+                    if into is None:
+                        into = merged[gateway] = GatewayStats()
+                    into.merge(stats)
+                for code, count in list(slot.errors.items()):
+                    errors[code] += count
+
+        total = GatewayStats()
+        for stats in merged.values():
+            total.merge(stats)
+
+        return {
+            "window_seconds": num * self.slot_seconds,
+            "total": self._summary(total, quantiles),
+            "gateways": {gw: self._summary(stats, quantiles) for gw, stats in sorted(merged.items())},
+            "errors": dict(sorted(errors.items())),
+        }
+
+    @staticmethod
+    def _summary(stats: GatewayStats, quantiles) -> Dict[str, Any]:
+        values = percentiles(stats.histogram, list(quantiles))
+        return {
+            "attempts": stats.attempts,
+            "successes": stats.attempts - stats.failures,
+            "failures": stats.failures,
+            "success_rate": (stats.attempts - stats.failures) / stats.attempts if stats.attempts else None,
+            "latency_ms": {
+                "mean": stats.latency_sum_ms / stats.attempts if stats.attempts else None,
+                **{f"p{q * 100:g}": v for q, v in zip(quantiles, values)},
+            },
+        }
@@ -0,0 +1,416 @@
+import gzip
+import json
+import logging
+import math
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from core.simulation import VirtualClock
+
+logger = logging.getLogger("replay")
+
+CONTEXT_FIELDS = ("amount", "currency", "payment_method", "merchant_id", "bin")
+
+
+class Decision(NamedTuple):
+    """One logged routing decision: the gateway tried, whether it succeeded and how long it took."""
+    timestamp: Optional[float]
+    context: Dict[str, Any]
+    gateway: str
+    success: bool
+    latency_ms: Optional[float] = None
+
+
+def _timestamp(value: Any) -> Optional[float]:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _open(path: str):
+    return gzip.open(path, "rt") if path.endswith(".gz") else open(path)
+
+
+def read_decisions(paths: Sequence[str], context_cache: int = 100_000) -> Iterator[Decision]:
+    """
+    Streams decisions from JSONL logs, one line at a time. Understands:
+
+    - API responses (/process, /process/batch, /events/stream samples): each
+      execute step of "history" is a decision, with the context taken from
+      the top-level transaction fields or "payment_context";
+    - event bus dumps: TransactionEvent lines supply the context of later
+      PaymentResult lines (remembered for the last context_cache
+      transactions), and every PaymentResult is a decision.
+
+    Other lines are skipped. Plain and .gz files are read.
+    """
+    contexts: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    for path in paths:
+        with _open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(record, dict):
+                    continue
+
+                if "history" in record:
+                    context = record.get("payment_context") or {k: record.get(k) for k in CONTEXT_FIELDS}
+                    ts = _timestamp(record.get("timestamp"))
+                    for entry in record["history"] or []:
+                        if entry.get("step") == "execute" and entry.get("gateway"):
+                            yield Decision(ts, context, entry["gateway"], entry.get("result") == "success", entry.get("latency_ms"))
+                elif "gateway" in record and "status" in record:
+                    if record["status"] not in ("success", "failure") or not record["gateway"]:
+                        continue
+                    context = contexts.get(record.get("transaction_id"), {})
+                    yield Decision(
+                        _timestamp(record.get("timestamp")), context, record["gateway"], record["status"] == "success",
+                        record.get("latency_ms"),
+                    )
+                elif "merchant_id" in record and "transaction_id" in record:
+                    contexts[record["transaction_id"]] = {k: record.get(k) for k in CONTEXT_FIELDS}
+                    if len(contexts) > context_cache:
+                        contexts.popitem(last=False)
+
+
+def thompson_propensities(
+    alpha: np.ndarray,
+    beta: np.ndarray,
+    rng: np.random.Generator,
+    samples: int = 2000,
+    latency_weight: float = 0.0,
+    latency: Optional[np.ndarray] = None,
+    fees: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    P(gateway i has the largest sampled utility) for each row of alpha/beta
+    (shape n x k), by Monte Carlo. The utility is the one
+    ThompsonSamplingRouter._sample_utility draws: the Beta draw, less
+    latency_weight times a mean latency drawn from each row's log-normal
+    posterior (latency, shape n x 2 x k: center and spread) and less the
+    fees. Estimates are floored at 0.5 / samples, so a gateway the logging
+    policy did pick never gets infinite weight.
+    """
+    n, k = alpha.shape
+    out = np.empty((n, k))
+    # Bounded temporary: at most ~4M draws at a time
+    step = max(1, 4_000_000 // (samples * k))
+    for lo in range(0, n, step):
+        a, b = alpha[lo:lo + step, None, :], beta[lo:lo + step, None, :]
+        draws = rng.beta(a, b, size=(len(a), samples, k))
+        if latency_weight:
+            center, spread = latency[lo:lo + step, 0, None, :], latency[lo:lo + step, 1, None, :]
+            draws -= latency_weight * np.exp(center + spread * rng.standard_normal(draws.shape))
+        if fees is not None:
+            draws -= fees
+        winners = draws.argmax(axis=2) + k * np.arange(len(a))[:, None]
+        out[lo:lo + step] = np.bincount(winners.ravel(), minlength=len(a) * k).reshape(-1, k) / samples
+    out = np.maximum(out, 0.5 / samples)
+    return out / out.sum(axis=1, keepdims=True)
+
+
+def reroute(probs: np.ndarray, open_mask: np.ndarray) -> np.ndarray:
+    """
+    Final gateway distribution after the breaker check in core.graph's
+    route_step: a pick whose breaker is OPEN moves to the first gateway
+    that is not OPEN (and stays put when all are).
+    """
+    n, k = probs.shape
+    closed = ~open_mask
+    fallback = np.where(closed.any(axis=1), closed.argmax(axis=1), -1)
+    target = np.where(open_mask & (fallback[:, None] >= 0), fallback[:, None], np.arange(k))
+    out = np.zeros_like(probs)
+    np.add.at(out, (np.repeat(np.arange(n), k), target.ravel()), probs.ravel())
+    return out
+
+
+class ReplayPolicy:
+    """
+    A router (and optionally a sentinel) replayed over logged decisions.
+
+    Both see every logged outcome (and latency, when logged) in order, on a
+    virtual clock set to the log timestamps, so they learn from the same
+    feedback the production router got. What they would have chosen at
+    each step is their posterior at that moment, success and latency,
+    turned into propensities under the router's objective by the evaluator.
+    """
+
+    def __init__(self, name: str, router, sentinel=None, clock: Optional[VirtualClock] = None):
+        self.name = name
+        self.router = router
+        self.sentinel = sentinel
+        self.clock = clock
+
+    def step(
+        self,
+        decision: Decision,
+        gateways: List[str],
+        alpha: np.ndarray,
+        beta: np.ndarray,
+        latency: np.ndarray,
+        open_mask: np.ndarray,
+    ):
+        """Fills this decision's posterior and breaker row, then learns from the outcome."""
+        if self.clock is not None and decision.timestamp is not None:
+            self.clock.now = decision.timestamp
+        a, b = self.router._posterior(decision.context)
+        alpha[:] = a
+        beta[:] = b
+        if self.router.latency_weight:
+            latency[:] = self.router._latency_posterior()
+        if self.sentinel is not None:
+            for j, gw in enumerate(gateways):
+                open_mask[j] = self.sentinel.get_status(gw) == "OPEN"
+            self.sentinel.record_result(decision.gateway, decision.success)
+        self.router.update(decision.gateway, decision.success, context=decision.context)
+        if decision.latency_ms:
+            self.router.observe_latency(decision.gateway, decision.latency_ms)
+
+
+class _Sums:
+    __slots__ = ("n", "w", "w2", "ips", "ips2", "dr", "dr2", "dm", "match", "clipped")
+
+    def __init__(self):
+        self.n = self.clipped = 0
+        self.w = self.w2 = self.ips = self.ips2 = self.dr = self.dr2 = self.dm = self.match = 0.0
+
+
+class OffPolicyEvaluator:
+    """
+    Inverse propensity (IPS, self-normalised SNIPS) and doubly robust (DR)
+    estimates of each target policy's success rate per attempt, from
+    decisions logged under `logging_policy`.
+
+    Decisions are processed in chunks of chunk_size: the replay itself is
+    sequential, then propensities, weights and estimator terms are computed
+    for the whole chunk with NumPy and folded into running sums, so memory
+    is bounded by the chunk however long the log is. The reward model for
+    DR (and the direct-method estimate, DM) is a running Beta(1, 1) success
+    rate per (currency, payment method, gateway), using only earlier
+    decisions.
+
+    Importance weights are clipped at `max_weight` when it is set. Their
+    mean is 1 in expectation when the propensities are right, so a policy
+    whose mean weight is further than `weight_tolerance` from 1, or whose
+    effective sample size is below `min_ess` of its decisions, gets a
+    warning in the report: its IPS and DR estimates are not to be trusted
+    (SNIPS, normalised by the weights, is more robust).
+
+    Thompson propensities are estimated by Monte Carlo over the utility
+    each policy's router maximises (success, less its latency and fee
+    penalties when set), and cached per posterior and objective, rounded to
+    `tolerance` in log space: a global posterior with thousands of outcomes
+    moves too little between decisions to change them.
+    """
+
+    def __init__(
+        self,
+        gateways: List[str],
+        logging_policy: ReplayPolicy,
+        targets: List[ReplayPolicy],
+        samples: int = 2000,
+        tolerance: float = 0.01,
+        max_weight: Optional[float] = None,
+        min_ess: float = 0.1,
+        weight_tolerance: float = 0.1,
+        chunk_size: int = 8192,
+        seed: int = 0,
+        cache_size: int = 100_000,
+    ):
+        self.gateways = list(gateways)
+        self.index = {gw: i for i, gw in enumerate(self.gateways)}
+        self.logging_policy = logging_policy
+        self.targets = list(targets)
+        self.samples = samples
+        self.tolerance = tolerance
+        self.max_weight = max_weight
+        self.min_ess = min_ess
+        self.weight_tolerance = weight_tolerance
+        self.chunk_size = chunk_size
+        self.cache_size = cache_size
+        self._rng = np.random.default_rng(seed)
+        self._cache: Dict[bytes, np.ndarray] = {}
+        self._reward_counts: Dict[Any, np.ndarray] = {}
+        self.sums = {policy.name: _Sums() for policy in self.targets}
+        self.decisions = 0
+        self.skipped = 0
+        self.unsupported = 0
+        self.reward_sum = 0.0
+        self.propensity_evaluations = 0
+
+    def run(self, decisions: Iterable[Decision], default_rate: float = 100.0) -> Dict[str, Any]:
+        """default_rate spaces out decisions that carry no timestamp."""
+        policies = [self.logging_policy] + self.targets
+        k = len(self.gateways)
+        n = self.chunk_size
+        alpha = np.empty((len(policies), n, k))
+        beta = np.empty((len(policies), n, k))
+        latency = np.zeros((len(policies), n, 2, k))
+        open_mask = np.zeros((len(policies), n, k), dtype=bool)
+        chosen = np.empty(n, dtype=np.intp)
+        reward = np.empty(n)
+        q = np.empty((n, k))
+        last_ts = 0.0
+
+        i = 0
+        for decision in decisions:
+            j = self.index.get(decision.gateway)
+            if j is None:
+                self.skipped += 1
+                continue
+            if decision.timestamp is None:
+                decision = decision._replace(timestamp=last_ts + 1.0 / default_rate)
+            last_ts = decision.timestamp
+
+            counts = self._reward_row(decision.context)
+            q[i] = counts[0] / counts[1]
+            for p, policy in enumerate(policies):
+                policy.step(decision, self.gateways, alpha[p, i], beta[p, i], latency[p, i], open_mask[p, i])
+            counts[0, j] += decision.success
+            counts[1, j] += 1
+            chosen[i] = j
+            reward[i] = decision.success
+            i += 1
+            if i == n:
+                self._fold(alpha, beta, latency, open_mask, chosen, reward, q, i)
+                i = 0
+        if i:
+            self._fold(alpha, beta, latency, open_mask, chosen, reward, q, i)
+        return self.report()
+
+    def _reward_row(self, context: Dict[str, Any]) -> np.ndarray:
+        key = (context.get("currency"), context.get("payment_method"))
+        counts = self._reward_counts.get(key)
+        if counts is None:
+            # [successes; attempts] with a Beta(1, 1) prior
+            counts = self._reward_counts[key] = np.vstack([np.ones(len(self.gateways)), np.full(len(self.gateways), 2.0)])
+        return counts
+
+    def _propensities(self, router, alpha: np.ndarray, beta: np.ndarray, latency: np.ndarray) -> np.ndarray:
+        """Propensities of `router` for rows of (alpha, beta, latency), via the cache."""
+        columns = [np.log(alpha), np.log(beta)]
+        if router.latency_weight:
+            # Log latency centers are already on a log scale
+            columns += [latency[:, 0], np.log(latency[:, 1])]
+        quantized = np.round(np.concatenate(columns, axis=1) / self.tolerance).astype(np.int32)
+        unique, inverse = np.unique(quantized, axis=0, return_inverse=True)
+        # Policies with different objectives must not share estimates
+        objective = np.concatenate([[router.latency_weight], router.fees]).tobytes()
+        keys = [objective + row.tobytes() for row in unique]
+        missing = [u for u, key in enumerate(keys) if key not in self._cache]
+        if missing:
+            k = alpha.shape[1]
+            # Representative posterior of each missing bucket: its first row
+            first = np.full(len(unique), -1)
+            first[inverse.ravel()[::-1]] = np.arange(len(inverse))[::-1]
+            rows = first[missing]
+            computed = thompson_propensities(
+                alpha[rows], beta[rows], self._rng, self.samples,
+                latency_weight=router.latency_weight, latency=latency[rows],
+                fees=router.fees if router._has_fees else None,
+            )
+            self.propensity_evaluations += len(missing)
+            if len(self._cache) + len(missing) > self.cache_size:
+                self._cache.clear()
+            for u, probs in zip(missing, computed):
+                self._cache[keys[u]] = probs
+        table = np.stack([self._cache[key] for key in keys])
+        return table[inverse.ravel()]
+
+    def _fold(self, alpha, beta, latency, open_mask, chosen, reward, q, n):
+        chosen, reward, q = chosen[:n], reward[:n], q[:n]
+        logging_probs = reroute(
+            self._propensities(self.logging_policy.router, alpha[0, :n], beta[0, :n], latency[0, :n]), open_mask[0, :n]
+        )
+        logged = logging_probs[np.arange(n), chosen]
+        self.decisions += n
+        self.reward_sum += reward.sum()
+        # A pick the logging policy could not have made (e.g. a gateway its
+        # breaker had open) means the log and the assumed policy disagree;
+        # such decisions carry no usable propensity and are left out
+        keep = np.flatnonzero(logged > 0)
+        self.unsupported += n - len(keep)
+        if not len(keep):
+            return
+        chosen, reward, q, logged = chosen[keep], reward[keep], q[keep], logged[keep]
+        rows = np.arange(len(keep))
+
+        for p, policy in enumerate(self.targets, start=1):
+            target = reroute(
+                self._propensities(policy.router, alpha[p, keep], beta[p, keep], latency[p, keep]), open_mask[p, keep]
+            )
+            w = target[rows, chosen] / logged
+            s = self.sums[policy.name]
+            if self.max_weight is not None:
+                s.clipped += int((w > self.max_weight).sum())
+                w = np.minimum(w, self.max_weight)
+            dm = (target * q).sum(axis=1)
+            ips = w * reward
+            dr = dm + w * (reward - q[rows, chosen])
+
+            s.n += len(keep)
+            s.w += w.sum()
+            s.w2 += (w * w).sum()
+            s.ips += ips.sum()
+            s.ips2 += (ips * ips).sum()
+            s.dr += dr.sum()
+            s.dr2 += (dr * dr).sum()
+            s.dm += dm.sum()
+            s.match += (target.argmax(axis=1) == chosen).sum()
+
+    def report(self) -> Dict[str, Any]:
+        def stderr(total: float, squares: float, n: int) -> float:
+            mean = total / n
+            return math.sqrt(max(squares / n - mean * mean, 0.0) / n)
+
+        policies = {}
+        for name, s in self.sums.items():
+            if not s.n:
+                continue
+            ess = s.w * s.w / s.w2 if s.w2 else 0.0
+            mean_weight = s.w / s.n
+            warnings = []
+            if abs(mean_weight - 1.0) > self.weight_tolerance:
+                warnings.append(
+                    f"mean importance weight {mean_weight:.3f}: the logging policy's propensities do not match "
+                    "the logs, or the target picks gateways it never tried"
+                )
+            if ess < self.min_ess * s.n:
+                warnings.append(f"effective sample size {ess:.0f} of {s.n} decisions: a few weights dominate")
+            for warning in warnings:
+                logger.warning(f"{name}: {warning}")
+            policies[name] = {
+                "ips": s.ips / s.n,
+                "ips_stderr": stderr(s.ips, s.ips2, s.n),
+                "snips": s.ips / s.w if s.w else None,
+                "dr": s.dr / s.n,
+                "dr_stderr": stderr(s.dr, s.dr2, s.n),
+                "dm": s.dm / s.n,
+                # Effective sample size of the importance weights
+                "ess": ess,
+                "mean_weight": mean_weight,
+                "clipped": s.clipped,
+                "agreement": s.match / s.n,
+                "warnings": warnings,
+            }
+        return {
+            "decisions": self.decisions,
+            "skipped": self.skipped,
+            "unsupported": self.unsupported,
+            "logged_success_rate": self.reward_sum / self.decisions if self.decisions else None,
+            "propensity_evaluations": self.propensity_evaluations,
+            "policies": policies,
+        }
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import math
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("retry")
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel on the running event loop: `slots` buckets of `tick`
+    seconds, timers more than a revolution out carrying a round count.
+    Scheduling and firing are O(1), and the loop holds one callback (the
+    next tick) however many timers are pending, and none while idle.
+    Timers fire up to one tick late.
+    """
+
+    def __init__(self, tick: float = 0.01, slots: int = 512):
+        self.tick = tick
+        self.slots = slots
+        self._buckets: List[List[list]] = [[] for _ in range(slots)]
+        self._cursor = 0
+        self._next_tick = 0.0
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.pending = 0
+
+    def sleep(self, delay: float) -> "asyncio.Future[None]":
+        """A future resolved after `delay` seconds; cancelling it drops the timer."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Timers do not outlive their loop (asyncio.run per benchmark mode)
+            self._loop = loop
+            self._buckets = [[] for _ in range(self.slots)]
+            self._handle = None
+            self.pending = 0
+        future = loop.create_future()
+        if delay <= 0:
+            future.set_result(None)
+            return future
+        if self._handle is None:
+            self._next_tick = loop.time() + self.tick
+            self._handle = loop.call_at(self._next_tick, self._advance)
+        ticks = max(0, math.ceil((loop.time() + delay - self._next_tick) / self.tick))
+        rounds, offset = divmod(ticks, self.slots)
+        self._buckets[(self._cursor + offset) % self.slots].append([rounds, future])
+        self.pending += 1
+        return future
+
+    def _advance(self):
+        bucket = self._buckets[self._cursor]
+        if bucket:
+            later = []
+            for entry in bucket:
+                if entry[0] > 0:
+                    entry[0] -= 1
+                    later.append(entry)
+                    continue
+                self.pending -= 1
+                if not entry[1].done():
+                    entry[1].set_result(None)
+            self._buckets[self._cursor] = later
+        self._cursor = (self._cursor + 1) % self.slots
+        self._next_tick += self.tick
+        if self.pending:
+            self._handle = self._loop.call_at(self._next_tick, self._advance)
+        else:
+            self._handle = None
+
+
+class RetryBudget:
+    """
+    Per-gateway token buckets limiting retries after failures there. Every
+    payment first routed to a gateway deposits `ratio` tokens, time adds
+    `min_per_second`, and each retry takes one; balances are capped at
+    `burst`. While a gateway fails everything, its retries stay at about
+    `ratio` of its traffic instead of multiplying it.
+    """
+
+    def __init__(
+        self,
+        ratio: float = 0.2,
+        min_per_second: float = 10.0,
+        burst: float = 20.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.burst = burst
+        self.clock = clock
+        self.state: Dict[str, List[float]] = {}
+        self.allowed: Dict[str, int] = {}
+        self.denied: Dict[str, int] = {}
+
+    def _bucket(self, gateway: str) -> List[float]:
+        bucket = self.state.get(gateway)
+        now = self.clock()
+        if bucket is None:
+            bucket = self.state[gateway] = [self.burst, now]
+        elif now > bucket[1]:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.min_per_second)
+            bucket[1] = now
+        return bucket
+
+    def deposit(self, gateway: str):
+        bucket = self._bucket(gateway)
+        bucket[0] = min(self.burst, bucket[0] + self.ratio)
+
+    def try_withdraw(self, gateway: str) -> bool:
+        bucket = self._bucket(gateway)
+        if bucket[0] >= 1.0:
+            bucket[0] -= 1.0
+            self.allowed[gateway] = self.allowed.get(gateway, 0) + 1
+            return True
+        self.denied[gateway] = self.denied.get(gateway, 0) + 1
+        return False
+
+    def export_state(self) -> Dict[str, Any]:
+        return {gw: list(bucket) for gw, bucket in self.state.items()}
+
+    def load_state(self, state: Dict[str, Any]):
+        self.state = {gw: list(bucket) for gw, bucket in state.items()}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            gw: {"tokens": round(self._bucket(gw)[0], 2), "allowed": self.allowed.get(gw, 0), "denied": self.denied.get(gw, 0)}
+            for gw in self.state
+        }
+
+
+class RetryScheduler:
+    """
+    When a failed payment retries: after a full-jitter exponential backoff
+    (uniform in [0, min(cap, base * 2^(attempt - 1))]) and only within the
+    failed gateway's RetryBudget, if one is set. Async waits park the
+    payment's coroutine on a TimerWheel, so pending retries hold no thread;
+    sync ones sleep.
+    """
+
+    def __init__(
+        self,
+        base: float = 0.1,
+        cap: float = 2.0,
+        budget: Optional[RetryBudget] = None,
+        wheel: Optional[TimerWheel] = None,
+        seed: Optional[int] = None,
+    ):
+        self.base = base
+        self.cap = cap
+        self.budget = budget
+        self.wheel = wheel or TimerWheel()
+        self.rng = random.Random(seed)
+        self.retries = 0
+        self.waited = 0.0
+
+    def deposit(self, gateway: str):
+        if self.budget is not None:
+            self.budget.deposit(gateway)
+
+    def allow(self, gateway: str) -> bool:
+        return self.budget is None or self.budget.try_withdraw(gateway)
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retry number `attempt` (1 for the first retry)."""
+        if self.base <= 0:
+            return 0.0
+        return self.rng.uniform(0.0, min(self.cap, self.base * 2 ** (attempt - 1)))
+
+    def sleep(self, delay: float):
+        self.retries += 1
+        self.waited += delay
+        if delay > 0:
+            time.sleep(delay)
+
+    async def asleep(self, delay: float):
+        self.retries += 1
+        self.waited += delay
+        if delay > 0:
+            await self.wheel.sleep(delay)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backoff_s": {"base": self.base, "cap": self.cap},
+            "retries": self.retries,
+            "mean_backoff_ms": self.waited / self.retries * 1000 if self.retries else 0.0,
+            "pending": self.wheel.pending,
+            "budget": self.budget.get_stats() if self.budget is not None else None,
+        }
@@ -0,0 +1,166 @@
+import fcntl
+import logging
+import os
+import sys
+import tempfile
+import threading
+import zlib
+from contextlib import contextmanager
+from functools import wraps
+from multiprocessing import resource_tracker, shared_memory
+from typing import Any, Optional, Tuple
+
+import numpy as np
+
+from agents.sentinel import local_alloc
+
+logger = logging.getLogger("shared_state")
+
+_ALIGN = 8
+
+
+def _open_segment(name: str, size: int) -> Tuple[shared_memory.SharedMemory, bool]:
+    """
+    Creates or attaches the named segment without registering it with the
+    multiprocessing resource tracker: the segment must outlive whichever
+    worker happened to create it.
+    """
+    try:
+        try:
+            return shared_memory.SharedMemory(name=name, create=True, size=size, track=False), True
+        except FileExistsError:
+            return shared_memory.SharedMemory(name=name, track=False), False
+    except TypeError:
+        # Python < 3.13 has no track argument
+        try:
+            shm, created = shared_memory.SharedMemory(name=name, create=True, size=size), True
+        except FileExistsError:
+            shm, created = shared_memory.SharedMemory(name=name), False
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm, created
+
+
+class SharedArena:
+    """
+    A named shared-memory segment carved into fixed arrays, plus a host-wide
+    lock, so that every worker process on the host sees the same counters.
+
+    Allocation is a bump pointer: processes that allocate the same arrays in
+    the same order get the same offsets. Each allocation is preceded by an
+    8-byte tag recording its layout; the first process to reach it copies in
+    the initial values, later ones check the tag and attach. Read-modify-write
+    updates must hold `lock`, which serialises threads in-process and
+    processes via flock on a lock file.
+    """
+
+    def __init__(self, name: str, size: int = 1 << 20):
+        self.name = name
+        self.size = size
+        self._offset = 0
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._lock_fd = os.open(os.path.join(tempfile.gettempdir(), f"{name}.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        with self.lock():
+            self._shm, self.created = _open_segment(name, size)
+        if self._shm.size < size:
+            raise ValueError(f"Shared segment {name} is {self._shm.size} bytes, expected at least {size}")
+        logger.info(f"{'Created' if self.created else 'Attached to'} shared state segment {name}")
+
+    @contextmanager
+    def lock(self):
+        with self._thread_lock:
+            if self._depth == 0:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _reserve(self, nbytes: int, layout: str) -> Tuple[int, bool]:
+        tag_offset = self._offset
+        data_offset = tag_offset + _ALIGN
+        end = data_offset + -(-nbytes // _ALIGN) * _ALIGN
+        if end > self._shm.size:
+            raise MemoryError(f"Shared segment {self.name} is full ({self._shm.size} bytes)")
+        self._offset = end
+
+        tag_view = self._shm.buf[tag_offset:data_offset].cast("Q")
+        tag = zlib.crc32(layout.encode()) | (1 << 32)
+        fresh = tag_view[0] == 0
+        if fresh:
+            tag_view[0] = tag
+        elif tag_view[0] != tag:
+            raise RuntimeError(
+                f"Shared segment {self.name} was laid out by a differently configured process; "
+                f"unlink it or use another name"
+            )
+        tag_view.release()
+        return data_offset, fresh
+
+    def array(self, shape: Tuple[int, ...], dtype: Any, init: Optional[np.ndarray] = None) -> np.ndarray:
+        """NumPy view onto the next allocation; init is copied in only by the first process."""
+        dtype = np.dtype(dtype)
+        with self.lock():
+            offset, fresh = self._reserve(int(np.prod(shape)) * dtype.itemsize, f"array{shape}{dtype.str}")
+            arr = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset)
+            if fresh and init is not None:
+                arr[...] = init
+        return arr
+
+    def view(self, fmt: str, n: int) -> memoryview:
+        """Zero-initialised memoryview allocation; cheaper than NumPy for scalar access."""
+        itemsize = np.dtype(fmt).itemsize
+        with self.lock():
+            offset, _ = self._reserve(n * itemsize, f"view{fmt}{n}")
+        return self._shm.buf[offset:offset + n * itemsize].cast(fmt)
+
+    def unlink(self):
+        """Removes the segment; call when retiring state, not on worker exit."""
+        if sys.version_info < (3, 13):
+            # unlink() unregisters the segment, which we did on open
+            resource_tracker.register(self._shm._name, "shared_memory")
+        self._shm.unlink()
+
+
+def _locked(arena: SharedArena, method):
+    @wraps(method)
+    def locked(*args, **kwargs):
+        with arena.lock():
+            return method(*args, **kwargs)
+    return locked
+
+
+def share_router(router, arena: SharedArena):
+    """
+    Moves the router's posterior arrays into the arena and serialises its
+    mutating methods on the arena lock. The router API is unchanged.
+    """
+    if not router.SHARED_ARRAYS:
+        raise ValueError(f"{type(router).__name__} does not support shared state")
+    for attr in router.SHARED_ARRAYS:
+        local = getattr(router, attr)
+        setattr(router, attr, arena.array(local.shape, local.dtype, init=local))
+    for name in router.SHARED_LOCKED:
+        setattr(router, name, _locked(arena, getattr(router, name)))
+    return router
+
+
+def share_sentinel(sentinel, arena: SharedArena):
+    """
+    Re-creates the sentinel's per-gateway breakers on arena storage and
+    serialises its methods on the arena lock. Gateways must be registered up
+    front (in the same order in every process); ones first seen later stay
+    process-local.
+    """
+    gateways = list(sentinel.state.keys())
+    sentinel.state = {}
+    sentinel.alloc = arena.view
+    for gw in gateways:
+        sentinel._gateway_state(gw)
+    sentinel.alloc = local_alloc
+    for name in ("get_status", "record_result", "get_all_statuses"):
+        setattr(sentinel, name, _locked(arena, getattr(sentinel, name)))
+    return sentinel
@@ -0,0 +1,342 @@
+import heapq
+import json
+import logging
+import math
+import random
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from agents.mocks import MockGateway
+from core.metrics import bucket_index, percentiles
+
+logger = logging.getLogger("simulation")
+
+QUANTILES = (0.5, 0.95, 0.99, 0.999)
+
+# Built-in scenarios. Times are virtual seconds; each change applies
+# MockGateway.update_config to one gateway at `at`.
+BASELINE = {
+    "Issuer_Alpha": {"success_rate": 0.95, "latency_mean": 0.2, "latency_std": 0.05},
+    "Issuer_Beta": {"success_rate": 0.90, "latency_mean": 0.3, "latency_std": 0.1},
+    "Issuer_Gamma": {"success_rate": 0.85, "latency_mean": 0.5, "latency_std": 0.2},
+}
+
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "steady": {"duration": 3600, "rate": 500, "gateways": BASELINE, "changes": []},
+    # The best gateway goes hard down for ten minutes: every call fails slowly
+    "outage": {"duration": 3600, "rate": 500, "gateways": BASELINE, "changes": [
+        {"at": 900, "gateway": "Issuer_Alpha", "success_rate": 0.0, "latency_mean": 2.0, "latency_std": 0.5},
+        {"at": 1500, "gateway": "Issuer_Alpha", "success_rate": 0.95, "latency_mean": 0.2, "latency_std": 0.05},
+    ]},
+    # Degraded but not down: acceptance sags and latency triples for twenty minutes
+    "brownout": {"duration": 3600, "rate": 500, "gateways": BASELINE, "changes": [
+        {"at": 900, "gateway": "Issuer_Alpha", "success_rate": 0.7, "latency_mean": 0.6, "latency_std": 0.3},
+        {"at": 2100, "gateway": "Issuer_Alpha", "success_rate": 0.95, "latency_mean": 0.2, "latency_std": 0.05},
+    ]},
+    # A slightly better gateway that is ten times slower: the success-only
+    # objective prefers it, a latency-aware one should not
+    "slow_leader": {"duration": 3600, "rate": 500, "gateways": {
+        **BASELINE, "Issuer_Gamma": {"success_rate": 0.96, "latency_mean": 2.0, "latency_std": 0.5},
+    }, "changes": []},
+    # The best gateway keeps succeeding but slows down sevenfold for twenty minutes
+    "latency_spike": {"duration": 3600, "rate": 500, "gateways": BASELINE, "changes": [
+        {"at": 900, "gateway": "Issuer_Alpha", "latency_mean": 1.5, "latency_std": 0.3},
+        {"at": 2100, "gateway": "Issuer_Alpha", "latency_mean": 0.2, "latency_std": 0.05},
+    ]},
+    # Short outages every five minutes, long enough to trip breakers
+    "flapping": {"duration": 3600, "rate": 500, "gateways": BASELINE, "changes": [
+        change
+        for start in range(600, 3600, 300)
+        for change in (
+            {"at": start, "gateway": "Issuer_Alpha", "success_rate": 0.0},
+            {"at": start + 45, "gateway": "Issuer_Alpha", "success_rate": 0.95},
+        )
+    ]},
+}
+
+
+def load_scenario(name_or_path: str) -> Dict[str, Any]:
+    """A built-in scenario by name, or a JSON file with the same layout."""
+    if name_or_path in SCENARIOS:
+        return SCENARIOS[name_or_path]
+    with open(name_or_path) as f:
+        return json.load(f)
+
+
+class VirtualClock:
+    """Simulated time in seconds; pass it as the clock of routers and sentinels."""
+    __slots__ = ("now",)
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class _Payment:
+    __slots__ = ("context", "arrived", "attempts", "history", "last_error")
+
+    def __init__(self, context: Dict[str, Any], arrived: float):
+        self.context = context
+        self.arrived = arrived
+        self.attempts = 0
+        self.history: List[Dict[str, Any]] = []
+        self.last_error: Optional[str] = None
+
+
+class Simulation:
+    """
+    Discrete-event simulation of the payment workflow on a virtual clock.
+
+    Payments arrive as a Poisson process at the scenario's rate. Each
+    attempt is routed, checked against the breakers, and completes after
+    its sampled gateway latency; only then do the router and sentinel see
+    the outcome and recovery decide on a retry. This is the same loop as
+    core.graph (reroute to the first non-OPEN gateway, at most max_attempts
+    attempts, retry on "retry"/"retry_alternate", backoff and retry budget
+    from `retry_scheduler` if given), minus the real sleeps: attempts in
+    flight and retries waiting out their backoff are events on a heap, so
+    overlapping payments, delayed feedback and breaker timeouts all play
+    out in virtual time. Without a retry_scheduler retries start at once,
+    as with core.graph's defaults.
+
+    router, sentinel and the retry budget must use `clock` where they take
+    one.
+    """
+
+    def __init__(
+        self,
+        scenario: Dict[str, Any],
+        router,
+        sentinel,
+        recovery,
+        clock: VirtualClock,
+        seed: int = 0,
+        max_attempts: int = 3,
+        timeline_seconds: float = 60.0,
+        num_contexts: int = 64,
+        retry_scheduler=None,
+    ):
+        self.scenario = scenario
+        self.router = router
+        self.sentinel = sentinel
+        self.recovery = recovery
+        self.clock = clock
+        self.max_attempts = max_attempts
+        self.retry_scheduler = retry_scheduler
+        self.timeline_seconds = timeline_seconds
+        self._rng = np.random.default_rng(seed)
+        self._random = random.Random(seed)
+        self.gateways = {
+            name: MockGateway(name, p["success_rate"], p["latency_mean"], p["latency_std"], seed=seed + i + 1)
+            for i, (name, p) in enumerate(scenario["gateways"].items())
+        }
+        self.names = list(self.gateways)
+        # A fixed pool of payment contexts, so contextual routers have
+        # buckets to learn without a dict allocation per payment
+        self.contexts = [
+            {
+                "currency": ("USD", "EUR", "GBP")[i % 3],
+                "payment_method": ("credit_card", "debit_card")[i % 2],
+                "bin": f"4{i % 8:05d}",
+                "merchant_id": f"merchant_{i % 16:03d}",
+                "amount": 100.0,
+            }
+            for i in range(num_contexts)
+        ]
+
+        self.payments = 0
+        self.accepted = 0
+        self.attempt_counts: Dict[int, int] = defaultdict(int)
+        self.payment_latency: Dict[int, int] = defaultdict(int)
+        self.gateway_attempts: Dict[str, int] = defaultdict(int)
+        self.gateway_failures: Dict[str, int] = defaultdict(int)
+        self.gateway_latency: Dict[str, Dict[int, int]] = {name: defaultdict(int) for name in self.names}
+        self.actions: Dict[str, int] = defaultdict(int)
+        self.breaker_trips: Dict[str, int] = defaultdict(int)
+        self.timeline: List[Dict[str, Any]] = []
+        self._slot: Dict[str, Any] = {}
+
+    def run(self) -> Dict[str, Any]:
+        duration = float(self.scenario["duration"])
+        rate = float(self.scenario["rate"])
+        changes = sorted((c for c in self.scenario.get("changes", []) if c["at"] < duration), key=lambda c: c["at"])
+        clock = self.clock
+        in_flight: List[Any] = []
+        seq = 0
+        change_i = 0
+        next_tick = clock.now + self.timeline_seconds
+        self._new_slot(clock.now)
+
+        # Arrival times are drawn in chunks; one exponential draw per payment
+        chunk = max(1024, int(rate * 10))
+        arrivals: List[float] = []
+        arrival_i = 0
+        start = last_arrival = clock.now
+        end = start + duration
+
+        while True:
+            if arrival_i == len(arrivals):
+                gaps = self._rng.exponential(1.0 / rate, chunk) if rate > 0 else np.array([math.inf])
+                arrivals = (last_arrival + np.cumsum(gaps)).tolist()
+                last_arrival = arrivals[-1]
+                arrival_i = 0
+            next_arrival = arrivals[arrival_i]
+            if next_arrival >= end:
+                next_arrival = math.inf
+            next_done = in_flight[0][0] if in_flight else math.inf
+            next_change = start + changes[change_i]["at"] if change_i < len(changes) else math.inf
+            t = min(next_arrival, next_done, next_change, next_tick)
+            if t == math.inf:
+                break
+
+            clock.now = t
+            if t == next_tick:
+                self._close_slot(t)
+                next_tick = t + self.timeline_seconds if (next_arrival < math.inf or in_flight) else math.inf
+            elif t == next_change:
+                change = changes[change_i]
+                change_i += 1
+                self.gateways[change["gateway"]].update_config(
+                    success_rate=change.get("success_rate"),
+                    latency_mean=change.get("latency_mean"),
+                    latency_std=change.get("latency_std"),
+                )
+            elif t == next_done:
+                _, _, payment, gateway, result = heapq.heappop(in_flight)
+                if gateway is None:
+                    # Backoff over: the retry starts now
+                    seq += 1
+                    heapq.heappush(in_flight, self._attempt(payment, seq))
+                elif self._complete(payment, gateway, result):
+                    seq += 1
+                    delay = self.retry_scheduler.backoff(payment.attempts) if self.retry_scheduler else 0.0
+                    if delay > 0:
+                        payment.history.append({"step": "backoff", "delay_ms": delay * 1000})
+                        heapq.heappush(in_flight, (t + delay, seq, payment, None, None))
+                    else:
+                        heapq.heappush(in_flight, self._attempt(payment, seq))
+            else:
+                arrival_i += 1
+                payment = _Payment(self._random.choice(self.contexts), t)
+                seq += 1
+                heapq.heappush(in_flight, self._attempt(payment, seq))
+
+        if self._slot["payments"]:
+            self._close_slot(clock.now)
+        return self.report()
+
+    def _attempt(self, payment: _Payment, seq: int):
+        sentinel = self.sentinel
+        gateway = self.router.select_gateway(payment.context)
+        status = sentinel.get_status(gateway)
+        if status == "OPEN":
+            for gw in self.names:
+                if sentinel.get_status(gw) != "OPEN":
+                    gateway = gw
+                    break
+            status = sentinel.get_status(gateway)
+        if payment.attempts == 0 and self.retry_scheduler is not None:
+            self.retry_scheduler.deposit(gateway)
+        payment.history.append({"step": "route", "gateway": gateway, "status": status})
+        result = self.gateways[gateway].sample()
+        return (self.clock.now + result["latency_ms"] / 1000, seq, payment, gateway, result)
+
+    def _complete(self, payment: _Payment, gateway: str, result: Dict[str, Any]) -> bool:
+        """Applies an attempt's outcome; True if the payment retries."""
+        success = result["status"] == "success"
+        latency_ms = result["latency_ms"]
+        payment.attempts += 1
+        self.gateway_attempts[gateway] += 1
+        self.gateway_latency[gateway][bucket_index(int(latency_ms * 1000))] += 1
+        self._slot["attempts"][gateway] += 1
+
+        self.router.update(gateway, success, context=payment.context)
+        self.router.observe_latency(gateway, latency_ms)
+        if success:
+            self.sentinel.record_result(gateway, True)
+        else:
+            # Only failures trip a breaker
+            was_open = self.sentinel.get_status(gateway) == "OPEN"
+            self.sentinel.record_result(gateway, False)
+            if not was_open and self.sentinel.get_status(gateway) == "OPEN":
+                self.breaker_trips[gateway] += 1
+
+        if success:
+            payment.history.append({"step": "execute", "result": "success", "gateway": gateway, "latency_ms": latency_ms})
+        else:
+            payment.last_error = result["error_code"]
+            self.gateway_failures[gateway] += 1
+            payment.history.append({
+                "step": "execute", "result": "failure", "error": payment.last_error,
+                "gateway": gateway, "latency_ms": latency_ms,
+            })
+
+        analysis = self.recovery.analyze_failure(payment.last_error, payment.history)
+        action = analysis["action"]
+        payment.history.append({"step": "recovery", "analysis": analysis})
+        if not success:
+            self.actions[action] += 1
+            if payment.attempts < self.max_attempts and action in ("retry", "retry_alternate"):
+                if self.retry_scheduler is None or self.retry_scheduler.allow(gateway):
+                    return True
+                self.actions["retry_denied"] += 1
+                payment.history.append({"step": "retry_denied", "gateway": gateway, "reason": "retry_budget"})
+        self._finish(payment, success)
+        return False
+
+    def _finish(self, payment: _Payment, success: bool):
+        bucket = bucket_index(int((self.clock.now - payment.arrived) * 1e6))
+        self.payments += 1
+        self.accepted += success
+        self.attempt_counts[payment.attempts] += 1
+        self.payment_latency[bucket] += 1
+        slot = self._slot
+        slot["payments"] += 1
+        slot["accepted"] += success
+        slot["latency"][bucket] += 1
+
+    def _new_slot(self, start: float):
+        self._slot = {"start": start, "payments": 0, "accepted": 0, "attempts": defaultdict(int), "latency": defaultdict(int)}
+
+    def _close_slot(self, now: float):
+        slot = self._slot
+        attempts = sum(slot["attempts"].values())
+        p99 = percentiles(slot["latency"], [0.99])[0]
+        self.timeline.append({
+            "t": round(slot["start"], 3),
+            "payments": slot["payments"],
+            "acceptance": slot["accepted"] / slot["payments"] if slot["payments"] else None,
+            "share": {gw: slot["attempts"][gw] / attempts for gw in self.names} if attempts else {},
+            "p99_ms": p99,
+            "breakers": {gw: self.sentinel.get_status(gw) for gw in self.names},
+        })
+        self._new_slot(now)
+
+    def report(self) -> Dict[str, Any]:
+        def latency(histogram: Dict[int, int]) -> Dict[str, Optional[float]]:
+            return {f"p{q * 100:g}": v for q, v in zip(QUANTILES, percentiles(histogram, list(QUANTILES)))}
+
+        total_attempts = sum(n * count for n, count in self.attempt_counts.items())
+        return {
+            "payments": self.payments,
+            "acceptance": self.accepted / self.payments if self.payments else None,
+            "attempts_per_payment": total_attempts / self.payments if self.payments else None,
+            "attempts": {str(n): count for n, count in sorted(self.attempt_counts.items())},
+            "payment_latency_ms": latency(self.payment_latency),
+            "gateways": {
+                gw: {
+                    "attempts": self.gateway_attempts[gw],
+                    "share": self.gateway_attempts[gw] / total_attempts if total_attempts else None,
+                    "success_rate": 1 - self.gateway_failures[gw] / self.gateway_attempts[gw] if self.gateway_attempts[gw] else None,
+                    "breaker_trips": self.breaker_trips[gw],
+                    "latency_ms": latency(self.gateway_latency[gw]),
+                }
+                for gw in self.names
+            },
+            "recovery_actions": dict(sorted(self.actions.items())),
+            "timeline": self.timeline,
+        }
@@ -0,0 +1,97 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger("snapshot")
+
+SNAPSHOT_VERSION = 1
+
+
+def save_snapshot(path: str, router, sentinel) -> int:
+    """
+    Writes router and sentinel state to `path` as an uncompressed .npz.
+
+    The file is written next to the target and renamed over it, so readers
+    only ever see a complete snapshot. Returns the size in bytes.
+    """
+    arrays: Dict[str, np.ndarray] = {
+        "version": np.array(SNAPSHOT_VERSION),
+        "router_type": np.array(type(router).__name__),
+    }
+    arrays.update({f"router/{k}": v for k, v in router.export_state().items()})
+    arrays.update({f"sentinel/{k}": v for k, v in sentinel.export_state().items()})
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def load_snapshot(path: str, router, sentinel, prior_decay: float = 1.0) -> bool:
+    """
+    Warm-starts router and sentinel from a snapshot written by save_snapshot.
+    Returns False when there is nothing usable to load.
+    """
+    if not os.path.exists(path):
+        return False
+
+    with np.load(path, allow_pickle=False) as data:
+        if int(data["version"]) != SNAPSHOT_VERSION:
+            logger.warning(f"Ignoring snapshot {path} with unsupported version {int(data['version'])}")
+            return False
+        router_state = {k[len("router/"):]: data[k] for k in data.files if k.startswith("router/")}
+        sentinel_state = {k[len("sentinel/"):]: data[k] for k in data.files if k.startswith("sentinel/")}
+        router_type = str(data["router_type"])
+
+    if router_type != type(router).__name__:
+        # Global posteriors are common to every router; the rest is not
+        logger.warning(f"Snapshot router is {router_type}, running {type(router).__name__}: restoring global posteriors only")
+        router_state = {k: router_state[k] for k in ("gateways", "alpha", "beta")}
+    router.load_state(router_state, prior_decay=prior_decay)
+    sentinel.load_state(sentinel_state)
+    return True
+
+
+class SnapshotWriter:
+    """
+    Background thread that snapshots router and sentinel every `interval`
+    seconds, keeping the work off the request path. stop() writes a final
+    snapshot.
+    """
+
+    def __init__(self, path: str, router, sentinel, interval: float = 30.0):
+        self.path = path
+        self.router = router
+        self.sentinel = sentinel
+        self.interval = interval
+        self._stop = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.thread:
+            self.thread.join()
+        self._write()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._write()
+
+    def _write(self):
+        try:
+            start = time.perf_counter()
+            size = save_snapshot(self.path, self.router, self.sentinel)
+            logger.debug(f"Snapshot written to {self.path} ({size} bytes, {(time.perf_counter() - start) * 1000:.1f} ms)")
+        except Exception as e:
+            logger.error(f"Snapshot to {self.path} failed: {e}")
@@ -7,6 +7,7 @@ class PaymentContext(BaseModel):
     currency: str
     payment_method: str
     merchant_id: str
+    bin: Optional[str] = None
     client_metadata: Dict[str, Any] = {}
 
 class AgentState(TypedDict):
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import os
+import signal
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+from core.kafka import (
+    TOPIC_DEAD_LETTERS,
+    TOPIC_INTERVENTIONS,
+    TOPIC_PAYMENT_REQUESTS,
+    TOPIC_RESULTS,
+    TOPIC_TRANSACTIONS,
+    EventBus,
+    EventPublisher,
+    payment_events,
+)
+from core.idempotency import payment_fingerprint
+from core.state import AgentState
+from data.schemas.events import Intervention, PaymentResult, TransactionEvent
+
+logger = logging.getLogger("worker")
+
+EVENT_MODELS = {TOPIC_RESULTS: PaymentResult, TOPIC_INTERVENTIONS: Intervention}
+
+
+def _initial_state(event: TransactionEvent) -> AgentState:
+    return AgentState(
+        transaction_id=event.transaction_id,
+        payment_context={
+            "transaction_id": event.transaction_id,
+            "amount": event.amount,
+            "currency": event.currency,
+            "payment_method": event.payment_method,
+            "merchant_id": event.merchant_id,
+            "bin": event.bin,
+        },
+        route_decision=None,
+        intervention_plan=None,
+        attempt_count=0,
+        last_error=None,
+        success=False,
+        history=[]
+    )
+
+
+class PaymentWorker:
+    """
+    Processes TransactionEvents from the event bus instead of HTTP.
+
+    Each consumed batch is run through the payment graph on an event loop
+    with at most `concurrency` payments in flight. Payments of one merchant
+    run one after another, in topic order; different merchants run
+    concurrently. The resulting PaymentResults and Interventions are
+    published (and flushed) before the batch returns, and the consumer only
+    commits offsets after that, so a crash replays unpublished payments
+    rather than losing them. Messages that are not valid TransactionEvents
+    go to the dead-letter topic (with an error PaymentResult when they carry
+    a transaction_id) and are committed with the rest of their batch.
+    """
+
+    def __init__(
+        self,
+        bus: EventBus,
+        graph=None,
+        concurrency: int = 64,
+        topic: str = TOPIC_PAYMENT_REQUESTS,
+        group_id: str = "payment-worker",
+        idempotency=None,
+    ):
+        if graph is None:
+            from core.graph import payment_graph as graph
+        self.bus = bus
+        self.graph = graph
+        self.concurrency = concurrency
+        self.topic = topic
+        self.group_id = group_id
+        self.idempotency = idempotency
+        self.processed = 0
+        self.errors = 0
+        self.rejected = 0
+        self.consumer = None
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(target=self.loop.run_forever, name="payment-worker-loop", daemon=True)
+
+    def start(self):
+        self._loop_thread.start()
+        self.consumer = self.bus.start_consumer(self.topic, self._process_batch, batch=True, group_id=self.group_id)
+
+    def stop(self):
+        if self.consumer:
+            # Finishes the batch in progress
+            self.consumer.stop()
+            self.bus.consumers.remove(self.consumer)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._loop_thread.join()
+
+    def _process_batch(self, messages: List[Any]):
+        # Runs on the consumer thread; returning lets the consumer commit
+        events: List[TransactionEvent] = []
+        rejected: List[Tuple[str, Any]] = []
+        for m in messages:
+            if isinstance(m, TransactionEvent):
+                events.append(m)
+                continue
+            try:
+                events.append(TransactionEvent.model_validate(m))
+            except ValidationError as e:
+                rejected.extend(self._reject(m, e))
+        outcomes = asyncio.run_coroutine_threadsafe(self._run(events), self.loop).result() if events else []
+        outcomes.extend(rejected)
+        for topic, event in outcomes:
+            self.bus.get_producer(topic, EventPublisher.KEY_FIELDS[topic]).send(event)
+        for topic in {topic for topic, _ in outcomes}:
+            self.bus.producers[topic].flush()
+        self.processed += len(events)
+
+    def _reject(self, message: Any, error: ValidationError) -> List[Tuple[str, Any]]:
+        # Retrying would fail the same way and hold back the whole topic
+        transaction_id = message.get("transaction_id") if isinstance(message, dict) else None
+        logger.error(f"Invalid payment request {transaction_id or message!r:.200}: {error.error_count()} validation errors")
+        self.rejected += 1
+        outcomes: List[Tuple[str, Any]] = [(TOPIC_DEAD_LETTERS, {
+            "topic": self.topic,
+            "error": str(error),
+            "message": message,
+        })]
+        if isinstance(transaction_id, str):
+            outcomes.append((TOPIC_RESULTS, PaymentResult(
+                transaction_id=transaction_id,
+                gateway="",
+                status="error",
+                error_code="INVALID_EVENT",
+                latency_ms=0.0,
+            )))
+        return outcomes
+
+    async def _run(self, events: List[TransactionEvent]) -> List[Tuple[str, BaseModel]]:
+        chains: "OrderedDict[str, List[TransactionEvent]]" = OrderedDict()
+        for event in events:
+            chains.setdefault(event.merchant_id, []).append(event)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        outcomes: List[Tuple[str, BaseModel]] = []
+
+        async def run_chain(chain: List[TransactionEvent]):
+            for event in chain:
+                async with semaphore:
+                    outcomes.extend(await self._run_one(event))
+
+        await asyncio.gather(*(run_chain(chain) for chain in chains.values()))
+        return outcomes
+
+    async def _run_one(self, event: TransactionEvent) -> List[Tuple[str, BaseModel]]:
+        try:
+            if self.idempotency is None:
+                return await self._execute(event)
+            # Redelivered events republish the first run's events. Keys are
+            # namespaced: the API caches responses, not events
+            state = _initial_state(event)
+            outcomes = await self.idempotency.execute(
+                f"worker:{event.transaction_id}",
+                payment_fingerprint(state["payment_context"]),
+                lambda: self._execute_serialized(event),
+            )
+            return [(o["topic"], EVENT_MODELS[o["topic"]].model_validate(o["event"])) for o in outcomes]
+        except Exception as e:
+            logger.error(f"Payment {event.transaction_id} failed: {e}")
+            self.errors += 1
+            return [(TOPIC_RESULTS, PaymentResult(
+                transaction_id=event.transaction_id,
+                gateway="",
+                status="error",
+                error_code=type(e).__name__,
+                latency_ms=0.0,
+            ))]
+
+    async def _execute(self, event: TransactionEvent) -> List[Tuple[str, BaseModel]]:
+        final_state = await self.graph.ainvoke(_initial_state(event))
+        return [(topic, e) for topic, e in payment_events(final_state, event.timestamp) if topic != TOPIC_TRANSACTIONS]
+
+    async def _execute_serialized(self, event: TransactionEvent) -> List[Dict[str, Any]]:
+        return [{"topic": topic, "event": e.model_dump(mode="json")} for topic, e in await self._execute(event)]
+
+    def lag(self) -> Optional[int]:
+        """Unprocessed messages on the topic, when running on a LocalBroker."""
+        broker = self.bus.broker
+        if broker is None or self.topic not in broker.logs:
+            return None
+        log = broker.logs[self.topic]
+        return log.end - log.committed.get(self.group_id, log.start)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"processed": self.processed, "errors": self.errors, "rejected": self.rejected, "lag": self.lag()}
+
+
+def main():
+    """Runs a worker against KAFKA_BOOTSTRAP_SERVERS until SIGINT/SIGTERM."""
+    logging.basicConfig(level=logging.INFO)
+    bus = EventBus(use_mock=False)
+    from core.graph import idempotency
+    worker = PaymentWorker(bus, concurrency=int(os.getenv("WORKER_CONCURRENCY", "64")), idempotency=idempotency)
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    worker.start()
+    logger.info(f"Consuming {worker.topic} as {worker.group_id}")
+    stopping.wait()
+    worker.stop()
+    bus.close()
+
+
+if __name__ == "__main__":
+    main()
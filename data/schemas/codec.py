@@ -0,0 +1,248 @@
+import json
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Tuple, Type
+
+from pydantic import BaseModel
+
+from data.schemas.events import Intervention, PaymentResult, TransactionEvent
+
+# Compact binary encoding of the event schemas.
+#
+# A message is a fixed little-endian struct followed by its string fields:
+#
+#   magic (B) | schema id (B) | version (B) | numeric fields | None mask (B) | string lengths (I) | UTF-8 text
+#
+# String lengths are in characters, so all strings of a message are encoded
+# and decoded in one call and split by slicing. Bit i of the None mask marks
+# string i as None (its length is then 0). Datetimes are microseconds since
+# the epoch (UTC) and dict fields are embedded as JSON strings.
+#
+# Each schema version has its own hand-written encoder and decoder. When a
+# schema changes, add a new version and keep the old decoder registered so
+# messages from producers still on the old version can be read. Version 1
+# had 16-bit lengths with 0xFFFF marking None, so strings were limited to
+# 65534 characters.
+
+MAGIC = 0xE5  # never the first byte of a JSON document
+_NONE_V1 = 0xFFFF
+_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+_set = object.__setattr__
+
+
+def _to_us(dt: datetime) -> int:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - _EPOCH) // _US
+
+
+def _lengths(strings: Tuple[Any, ...]):
+    # None mask, then one length per string
+    mask = 0
+    lengths = [0]
+    for i, s in enumerate(strings):
+        if s is None:
+            mask |= 1 << i
+            lengths.append(0)
+        else:
+            lengths.append(len(s))
+    lengths[0] = mask
+    return lengths
+
+
+def _text(strings: Tuple[Any, ...]) -> bytes:
+    return "".join([s for s in strings if s is not None]).encode("utf-8")
+
+
+def _opt_v1(text: str, start: int, length: int):
+    return None if length == _NONE_V1 else text[start:start + length]
+
+
+# TransactionEvent, schema 1
+
+_TRANSACTION_V1 = struct.Struct("<BBBqdHHHHH")
+_TRANSACTION_V2 = struct.Struct("<BBBqdBIIIII")
+
+
+def _encode_transaction(event: TransactionEvent) -> bytes:
+    d = event.__dict__
+    strings = (d["transaction_id"], d["merchant_id"], d["currency"], d["payment_method"], d["bin"])
+    return _TRANSACTION_V2.pack(MAGIC, 1, 2, _to_us(d["timestamp"]), d["amount"], *_lengths(strings)) + _text(strings)
+
+
+def _decode_transaction_v1(raw: bytes) -> Dict[str, Any]:
+    _, _, _, ts, amount, l_id, l_merchant, l_currency, l_method, l_bin = _TRANSACTION_V1.unpack_from(raw)
+    text = raw[_TRANSACTION_V1.size:].decode("utf-8")
+    a = l_id
+    b = a + l_merchant
+    c = b + l_currency
+    d = c + l_method
+    return {
+        "transaction_id": text[:a],
+        "timestamp": _EPOCH + timedelta(0, 0, ts),
+        "merchant_id": text[a:b],
+        "amount": amount,
+        "currency": text[b:c],
+        "payment_method": text[c:d],
+        "bin": _opt_v1(text, d, l_bin),
+    }
+
+
+def _decode_transaction_v2(raw: bytes) -> Dict[str, Any]:
+    _, _, _, ts, amount, mask, l_id, l_merchant, l_currency, l_method, l_bin = _TRANSACTION_V2.unpack_from(raw)
+    text = raw[_TRANSACTION_V2.size:].decode("utf-8")
+    a = l_id
+    b = a + l_merchant
+    c = b + l_currency
+    d = c + l_method
+    return {
+        "transaction_id": text[:a],
+        "timestamp": _EPOCH + timedelta(0, 0, ts),
+        "merchant_id": text[a:b],
+        "amount": amount,
+        "currency": text[b:c],
+        "payment_method": text[c:d],
+        "bin": None if mask & 0b10000 else text[d:d + l_bin],
+    }
+
+
+# PaymentResult, schema 2
+
+_RESULT_V1 = struct.Struct("<BBBqdHHHH")
+_RESULT_V2 = struct.Struct("<BBBqdBIIII")
+
+
+def _encode_result(event: PaymentResult) -> bytes:
+    d = event.__dict__
+    strings = (d["transaction_id"], d["gateway"], d["status"], d["error_code"])
+    return _RESULT_V2.pack(MAGIC, 2, 2, _to_us(d["timestamp"]), d["latency_ms"], *_lengths(strings)) + _text(strings)
+
+
+def _decode_result_v1(raw: bytes) -> Dict[str, Any]:
+    _, _, _, ts, latency_ms, l_id, l_gateway, l_status, l_error = _RESULT_V1.unpack_from(raw)
+    text = raw[_RESULT_V1.size:].decode("utf-8")
+    a = l_id
+    b = a + l_gateway
+    c = b + l_status
+    return {
+        "transaction_id": text[:a],
+        "gateway": text[a:b],
+        "status": text[b:c],
+        "error_code": _opt_v1(text, c, l_error),
+        "latency_ms": latency_ms,
+        "timestamp": _EPOCH + timedelta(0, 0, ts),
+    }
+
+
+def _decode_result_v2(raw: bytes) -> Dict[str, Any]:
+    _, _, _, ts, latency_ms, mask, l_id, l_gateway, l_status, l_error = _RESULT_V2.unpack_from(raw)
+    text = raw[_RESULT_V2.size:].decode("utf-8")
+    a = l_id
+    b = a + l_gateway
+    c = b + l_status
+    return {
+        "transaction_id": text[:a],
+        "gateway": text[a:b],
+        "status": text[b:c],
+        "error_code": None if mask & 0b1000 else text[c:c + l_error],
+        "latency_ms": latency_ms,
+        "timestamp": _EPOCH + timedelta(0, 0, ts),
+    }
+
+
+# Intervention, schema 3
+
+_INTERVENTION_V1 = struct.Struct("<BBBqHHHH")
+_INTERVENTION_V2 = struct.Struct("<BBBqBIIII")
+
+
+def _encode_intervention(event: Intervention) -> bytes:
+    d = event.__dict__
+    strings = (d["transaction_id"], d["action"], d["reason"], json.dumps(d["parameters"], default=str))
+    return _INTERVENTION_V2.pack(MAGIC, 3, 2, _to_us(d["timestamp"]), *_lengths(strings)) + _text(strings)
+
+
+def _decode_intervention_v1(raw: bytes) -> Dict[str, Any]:
+    _, _, _, ts, l_id, l_action, l_reason, l_params = _INTERVENTION_V1.unpack_from(raw)
+    text = raw[_INTERVENTION_V1.size:].decode("utf-8")
+    a = l_id
+    b = a + l_action
+    c = b + l_reason
+    return {
+        "transaction_id": text[:a],
+        "action": text[a:b],
+        "reason": text[b:c],
+        "parameters": json.loads(text[c:c + l_params]),
+        "timestamp": _EPOCH + timedelta(0, 0, ts),
+    }
+
+
+def _decode_intervention_v2(raw: bytes) -> Dict[str, Any]:
+    _, _, _, ts, _, l_id, l_action, l_reason, l_params = _INTERVENTION_V2.unpack_from(raw)
+    text = raw[_INTERVENTION_V2.size:].decode("utf-8")
+    a = l_id
+    b = a + l_action
+    c = b + l_reason
+    return {
+        "transaction_id": text[:a],
+        "action": text[a:b],
+        "reason": text[b:c],
+        "parameters": json.loads(text[c:c + l_params]),
+        "timestamp": _EPOCH + timedelta(0, 0, ts),
+    }
+
+
+_ENCODERS: Dict[Type[BaseModel], Callable[[Any], bytes]] = {
+    TransactionEvent: _encode_transaction,
+    PaymentResult: _encode_result,
+    Intervention: _encode_intervention,
+}
+
+# (schema id, version) -> (model, decoder); decoders return fields in the
+# model's declared order
+_DECODERS: Dict[Tuple[int, int], Tuple[Type[BaseModel], Callable[[bytes], Dict[str, Any]]]] = {
+    (1, 1): (TransactionEvent, _decode_transaction_v1),
+    (1, 2): (TransactionEvent, _decode_transaction_v2),
+    (2, 1): (PaymentResult, _decode_result_v1),
+    (2, 2): (PaymentResult, _decode_result_v2),
+    (3, 1): (Intervention, _decode_intervention_v1),
+    (3, 2): (Intervention, _decode_intervention_v2),
+}
+
+_FIELDS_SET = {model: frozenset(model.model_fields) for model in _ENCODERS}
+
+
+def encodable(event: Any) -> bool:
+    return type(event) in _ENCODERS
+
+
+def encode(event: BaseModel) -> bytes:
+    return _ENCODERS[type(event)](event)
+
+
+def decode(raw: bytes, trusted: bool = False) -> BaseModel:
+    """
+    Decodes a message written by encode. With trusted=True the model is
+    built without pydantic validation; use it only for messages from our
+    own producers.
+    """
+    if raw[0] != MAGIC:
+        raise ValueError("Not a binary-encoded event")
+    entry = _DECODERS.get((raw[1], raw[2]))
+    if entry is None:
+        raise ValueError(f"Unknown event schema {raw[1]} version {raw[2]}")
+    model, decoder = entry
+    fields = decoder(raw)
+    if not trusted:
+        return model.model_validate(fields)
+    event = model.__new__(model)
+    _set(event, "__dict__", fields)
+    _set(event, "__pydantic_fields_set__", set(_FIELDS_SET[model]))
+    _set(event, "__pydantic_extra__", None)
+    _set(event, "__pydantic_private__", None)
+    return event
+
+
+def is_encoded(raw: bytes) -> bool:
+    return bool(raw) and raw[0] == MAGIC
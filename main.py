@@ -1,16 +1,85 @@
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, Any, List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import os
+import time
 import uvicorn
 import logging
 from core.state import AgentState, PaymentContext
-from core.graph import payment_graph
+
+# GRAPH_EXECUTOR=native runs the same nodes without LangGraph's per-step
+# dispatch (see core/executor.py); the default is the compiled StateGraph.
+if os.getenv("GRAPH_EXECUTOR") == "native":
+    from core.executor import native_payment_graph as payment_graph
+else:
+    from core.graph import payment_graph
+from core.graph import idempotency
+from core.idempotency import IdempotencyConflict, payment_fingerprint
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("api")
 
-app = FastAPI(title="Payment Agent API")
+# SNAPSHOT_PATH enables warm starts: learned router/sentinel state is loaded
+# from it on startup and written back every SNAPSHOT_INTERVAL seconds.
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH")
+
+# EVENT_BUS publishes every payment's TransactionEvent, PaymentResults and
+# Interventions: "kafka" to KAFKA_BOOTSTRAP_SERVERS, "mock" to an in-process
+# broker, "local" to one through the Kafka client path (serialised, as in
+# production). Publishing happens off the request path.
+EVENT_BUS = os.getenv("EVENT_BUS")
+event_publisher = None
+
+# /events/stream pushes one frame every LIVE_INTERVAL seconds to all
+# subscribers, with at most LIVE_SAMPLES of the payments processed since the
+# previous frame; with no subscriber, payments only update its totals.
+LIVE_INTERVAL = float(os.getenv("LIVE_INTERVAL", "0.5"))
+LIVE_SAMPLES = int(os.getenv("LIVE_SAMPLES", "20"))
+live_feed = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from core import graph
+    from core.snapshot import SnapshotWriter, load_snapshot
+    from core.kafka import EventBus, EventPublisher, LocalBroker
+    from core.live import LiveFeed
+    global event_publisher, live_feed
+
+    live_feed = LiveFeed(graph.router, graph.sentinel, render_live, interval=LIVE_INTERVAL, max_samples=LIVE_SAMPLES)
+    live_feed.start()
+
+    if EVENT_BUS:
+        if EVENT_BUS == "kafka":
+            bus = EventBus(use_mock=False)
+        elif EVENT_BUS == "local":
+            bus = EventBus(use_mock=False, broker=LocalBroker())
+        else:
+            bus = EventBus()
+        event_publisher = EventPublisher(bus)
+        event_publisher.start()
+
+    writer = None
+    if SNAPSHOT_PATH:
+        # With shared state, only the worker that created the segment seeds it
+        if not graph.SHARED_STATE_NAME or graph.shared_arena.created:
+            prior_decay = float(os.getenv("SNAPSHOT_PRIOR_DECAY", "1.0"))
+            if load_snapshot(SNAPSHOT_PATH, graph.router, graph.sentinel, prior_decay=prior_decay):
+                logger.info(f"Warm-started from snapshot {SNAPSHOT_PATH} (prior decay {prior_decay})")
+        writer = SnapshotWriter(SNAPSHOT_PATH, graph.router, graph.sentinel, float(os.getenv("SNAPSHOT_INTERVAL", "30")))
+        writer.start()
+    yield
+    if writer:
+        writer.stop()
+    if event_publisher:
+        event_publisher.stop()
+    live_feed.stop()
+
+app = FastAPI(title="Payment Agent API", lifespan=lifespan)
 
 class TransactionRequest(BaseModel):
     transaction_id: str
@@ -18,17 +87,20 @@ class TransactionRequest(BaseModel):
     currency: str
     payment_method: str
     merchant_id: str
+    bin: Optional[str] = None
 
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
 
-@app.post("/process")
-def process_payment(tx: TransactionRequest):
-    logger.info(f"Received transaction: {tx.transaction_id}")
-    
-    # Initialize state
-    initial_state = AgentState(
+class BatchRequest(BaseModel):
+    transactions: List[TransactionRequest]
+    max_concurrency: int = Field(64, ge=1, le=1024)
+    stream: bool = False
+    compact: bool = False
+
+def build_initial_state(tx: TransactionRequest) -> AgentState:
+    return AgentState(
         transaction_id=tx.transaction_id,
         payment_context=tx.dict(),
         route_decision=None,
@@ -38,19 +110,116 @@ def process_payment(tx: TransactionRequest):
         success=False,
         history=[]
     )
-    
-    # Invoke LangGraph
-    final_state = payment_graph.invoke(initial_state)
-    
-    # Return result
-    return {
+
+def render_history(history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Reasoning traces are rendered lazily; only responses that carry the
+    # history pay for the text.
+    rendered = []
+    for entry in history:
+        if entry.get("step") == "recovery":
+            analysis = entry["analysis"]
+            entry = dict(entry, analysis=dict(analysis, reason=str(analysis["reason"])))
+        rendered.append(entry)
+    return rendered
+
+def build_response(final_state: AgentState, compact: bool = False) -> Dict[str, Any]:
+    """
+    compact=True omits the history, keeping the response a fixed size.
+    """
+    response = {
         "transaction_id": final_state["transaction_id"],
         "success": final_state["success"],
         "route_decision": final_state["route_decision"],
         "intervention_plan": final_state["intervention_plan"],
         "last_error": final_state["last_error"],
-        "history": final_state["history"]
+        "attempt_count": final_state["attempt_count"],
     }
+    if not compact:
+        response["history"] = render_history(final_state["history"])
+    return response
+
+def render_live(final_state: AgentState) -> Dict[str, Any]:
+    # A sampled payment on /events/stream: the full response plus the
+    # transaction fields the dashboard shows
+    context = final_state["payment_context"]
+    response = build_response(final_state)
+    for field in ("amount", "currency", "payment_method", "merchant_id"):
+        response[field] = context.get(field)
+    return response
+
+async def run_payment(tx: TransactionRequest, compact: bool = False) -> Dict[str, Any]:
+    """
+    Runs a transaction through the payment graph and returns its response.
+    With idempotency on, a repeated transaction_id gets the first run's
+    response (shared, so callers copy before changing it) and publishes
+    nothing.
+    """
+    if idempotency is None:
+        return await execute_payment(tx, compact)
+    fingerprint = payment_fingerprint(tx.dict())
+    response = await idempotency.execute(tx.transaction_id, fingerprint, lambda: execute_payment(tx))
+    if compact:
+        response = {k: v for k, v in response.items() if k != "history"}
+    return response
+
+async def execute_payment(tx: TransactionRequest, compact: bool = False) -> Dict[str, Any]:
+    # Invoke LangGraph on the event loop; gateway calls are awaited, so
+    # in-flight payments do not occupy threadpool workers.
+    started = time.perf_counter()
+    final_state = await payment_graph.ainvoke(build_initial_state(tx))
+    if event_publisher:
+        event_publisher.publish(final_state)
+    if live_feed:
+        live_feed.publish(final_state, (time.perf_counter() - started) * 1000)
+    return build_response(final_state, compact)
+
+@app.post("/process")
+async def process_payment(tx: TransactionRequest, compact: bool = False):
+    logger.info(f"Received transaction: {tx.transaction_id}")
+    try:
+        return await run_payment(tx, compact)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/process/batch")
+async def process_batch(batch: BatchRequest):
+    """
+    Runs a list of transactions through the payment graph concurrently,
+    with at most max_concurrency in flight.
+
+    Returns results in input order, or, with stream=true, an NDJSON stream
+    emitting each result (tagged with its input index) as it completes.
+    """
+    logger.info(f"Received batch of {len(batch.transactions)} transactions")
+    semaphore = asyncio.Semaphore(batch.max_concurrency)
+
+    async def run_one(index: int, tx: TransactionRequest) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                result = dict(await run_payment(tx, batch.compact))
+            except Exception as e:
+                # One bad payment must not take down the rest of the batch
+                logger.error(f"Batch transaction {tx.transaction_id} failed: {e}")
+                result = {"transaction_id": tx.transaction_id, "success": False, "error": str(e)}
+        result["index"] = index
+        return result
+
+    if not batch.stream:
+        results = await asyncio.gather(*(run_one(i, tx) for i, tx in enumerate(batch.transactions)))
+        return {"results": results}
+
+    async def stream_results():
+        tasks = [asyncio.create_task(run_one(i, tx)) for i, tx in enumerate(batch.transactions)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                yield json.dumps(result) + "\n"
+        finally:
+            # Client went away mid-stream: stop the remaining payments
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
 
 @app.get("/system/status")
 def get_system_status():
@@ -58,12 +227,50 @@ def get_system_status():
     Returns the internal state of the agentic system.
     """
     # Import singletons from graph module
-    from core.graph import router, sentinel
+    from core.graph import router, sentinel, recovery, hedger, bulkheads, retry_scheduler
     
-    return {
+    status = {
         "router": router.get_state(),
-        "sentinel": sentinel.get_all_statuses()
+        "sentinel": sentinel.get_all_statuses(),
+        "hedging": hedger.get_stats(),
+        "retries": retry_scheduler.get_stats(),
     }
+    if hasattr(recovery, "get_stats"):
+        status["recovery"] = recovery.get_stats()
+    if bulkheads is not None:
+        status["bulkheads"] = bulkheads.get_stats()
+    if idempotency is not None:
+        status["idempotency"] = idempotency.get_stats()
+    if live_feed:
+        status["live"] = live_feed.get_stats()
+    return status
+
+@app.get("/events/stream")
+async def stream_events():
+    """
+    Server-Sent Events: "status" frames with router and sentinel state
+    (on circuit changes, otherwise at most every few seconds) and "tick"
+    frames every LIVE_INTERVAL seconds with totals since startup and a sample
+    of the payments processed since the previous tick.
+    """
+    if live_feed is None:
+        # Started by the app's lifespan
+        raise HTTPException(status_code=503, detail="Live feed is not running")
+    return StreamingResponse(
+        live_feed.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/metrics")
+def get_metrics(window: float = 60.0):
+    """
+    Attempts, success rate, error codes and p50/p95/p99 gateway latency,
+    overall and per gateway, over the last `window` seconds (up to 5 minutes).
+    """
+    from core.graph import metrics
+
+    return metrics.snapshot(window)
 
 class ConfigRequest(BaseModel):
     gateway: str
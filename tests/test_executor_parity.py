@@ -0,0 +1,81 @@
+"""
+core.executor.native_payment_graph must reach the same final state, router
+posteriors and breaker states as the LangGraph payment_graph, synchronously
+and asynchronously, with backoff and retry budgets on.
+"""
+import asyncio
+import random
+
+import numpy as np
+import pytest
+
+from agents.mocks import GATEWAYS
+from core.executor import native_payment_graph
+from core.graph import payment_graph, retry_scheduler, router, sentinel
+from core.retry import RetryBudget
+from core.state import AgentState
+
+FROZEN = 1_000_000.0
+
+RUNNERS = {
+    "invoke": lambda graph, state: graph.invoke(state),
+    "ainvoke": lambda graph, state: asyncio.run(graph.ainvoke(state)),
+}
+
+
+@pytest.fixture(scope="module")
+def configured():
+    """Configures the graph singletons for parity runs, and restores them after."""
+    gateways = {name: (gw.success_rate, gw.latency_mean, gw.latency_std, gw.rng) for name, gw in GATEWAYS.items()}
+    saved_clock = sentinel.clock
+    saved_retry = (retry_scheduler.base, retry_scheduler.budget, retry_scheduler.rng)
+    saved_rng = router._rng
+
+    # Low success rates so retries, blocks and breaker trips all occur
+    for gw, rate in zip(GATEWAYS.values(), [0.6, 0.4, 0.2]):
+        gw.update_config(success_rate=rate, latency_mean=0.0)
+    # Frozen breaker clock so trip timestamps compare equal across runs
+    sentinel.clock = lambda: FROZEN
+    # Backoff and retry budget on (both default off), with short backoffs to
+    # keep the sync runs quick and the same frozen clock
+    retry_scheduler.base = 0.001
+    retry_scheduler.budget = RetryBudget(clock=lambda: FROZEN)
+    yield
+    for name, (rate, mean, std, rng) in gateways.items():
+        GATEWAYS[name].update_config(success_rate=rate, latency_mean=mean, latency_std=std)
+        GATEWAYS[name].rng = rng
+    sentinel.clock = saved_clock
+    retry_scheduler.base, retry_scheduler.budget, retry_scheduler.rng = saved_retry
+    router._rng = saved_rng
+
+
+def run(graph, runner, seed: int):
+    """One seeded payment; shared agent state is rewound afterwards."""
+    router_state, sentinel_state = router.export_state(), sentinel.export_state()
+    budget_state = retry_scheduler.budget.export_state()
+    retry_scheduler.rng = random.Random(seed)
+    for i, gw in enumerate(GATEWAYS.values()):
+        gw.rng = random.Random(seed * 10 + i)
+    router._rng = np.random.default_rng(seed)
+    state = AgentState(
+        transaction_id=f"parity-{seed}",
+        payment_context={"transaction_id": f"parity-{seed}", "amount": 100.0, "currency": "USD",
+                         "payment_method": "credit_card", "merchant_id": "merchant_001"},
+        route_decision=None, intervention_plan=None, attempt_count=0,
+        last_error=None, success=False, history=[]
+    )
+    try:
+        final_state = runner(graph, state)
+        return final_state, router.get_state(), sentinel.get_all_statuses()
+    finally:
+        router.load_state(router_state)
+        sentinel.load_state(sentinel_state)
+        retry_scheduler.budget.load_state(budget_state)
+
+
+@pytest.mark.parametrize("mode", list(RUNNERS))
+@pytest.mark.parametrize("seed", range(20))
+def test_native_executor_matches_payment_graph(configured, mode, seed):
+    runner = RUNNERS[mode]
+    expected = run(payment_graph, runner, seed)
+    assert run(native_payment_graph, runner, seed) == expected
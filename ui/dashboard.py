@@ -1,14 +1,22 @@
 import streamlit as st
 import pandas as pd
 import requests
+import json
+import threading
 import time
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
 from scipy.stats import beta
-from datetime import datetime
+from collections import deque
 import os
 
+try:
+    from ui.traffic import generate_mock_transaction
+except ImportError:
+    # `streamlit run ui/dashboard.py` puts ui/ itself on sys.path
+    from traffic import generate_mock_transaction
+
 # --- Configuration & Styles ---
 st.set_page_config(
     page_title="Agentic Payment Ops", 
@@ -57,12 +65,12 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- State Management ---
-if "events" not in st.session_state:
-    st.session_state.events = []
-if "simulation_running" not in st.session_state:
-    st.session_state.simulation_running = False
+if "simulation" not in st.session_state:
+    st.session_state.simulation = None
 
 API_URL = os.getenv("API_URL", "http://localhost:8000")
+# How often the live views redraw from the stream buffer (no API calls)
+LIVE_REFRESH = float(os.getenv("LIVE_REFRESH", "1.0"))
 
 # --- Helper Functions ---
 def fetch_system_status():
@@ -74,67 +82,121 @@ def fetch_system_status():
         return None
     return None
 
-def generate_mock_transaction():
-    import random
-    import uuid
-    amounts = [50, 100, 250, 1000, 5000]
-    currencies = ["USD", "EUR", "GBP"]
-    return {
-        "transaction_id": str(uuid.uuid4()),
-        "amount": random.choice(amounts),
-        "currency": random.choice(currencies),
-        "payment_method": "credit_card",
-        "merchant_id": "merchant_001"
-    }
+class LiveStream:
+    """
+    Subscription to the API's /events/stream (Server-Sent Events).
 
-def run_simulation_step(speed):
-    if st.session_state.simulation_running:
-        tx = generate_mock_transaction()
-        try:
-            start_t = time.time()
-            resp = requests.post(f"{API_URL}/process", json=tx)
-            latency_ms = (time.time() - start_t) * 1000
-            
-            if resp.status_code == 200:
-                data = resp.json()
-                data.update(tx)
-                data["timestamp"] = datetime.now()
-                data["latency"] = latency_ms
-                st.session_state.events.append(data)
-                # Keep buffer manageable
-                if len(st.session_state.events) > 100:
-                    st.session_state.events.pop(0)
-        except Exception as e:
-            # Silence transient connection errors to avoid UI spam in high load
-            # st.toast(f"Simulation Error: {e}")
-            time.sleep(1) # Backoff on error
-        
-        # Enforce minimum sleep to prevent UI freezing (max 2 req/s effectively if speed=5)
-        # "Light" mode: ensure at least 0.5s sleep always
-        sleep_time = max(0.5, 1.0 / speed)
-        time.sleep(sleep_time)
-        st.rerun()
+    A background thread keeps the latest router/sentinel state, the
+    cumulative totals and the most recent sampled transactions; the page
+    only reads them. It sees all traffic, not just this dashboard's, and
+    reconnects when the API restarts.
+    """
+
+    def __init__(self, url, max_events=200):
+        self.url = url
+        self.events = deque(maxlen=max_events)
+        self.status = None
+        self.totals = None
+        self.baseline = None
+        self.connected = False
+        self.lock = threading.Lock()
+        threading.Thread(target=self._run, name="live-stream", daemon=True).start()
+
+    def _run(self):
+        while True:
+            try:
+                with requests.get(self.url, stream=True, timeout=(2, 30)) as resp:
+                    self.connected = True
+                    event = None
+                    for line in resp.iter_lines(decode_unicode=True):
+                        if line.startswith("event:"):
+                            event = line[6:].strip()
+                        elif line.startswith("data:"):
+                            self._handle(event, json.loads(line[5:]))
+            except Exception:
+                pass
+            self.connected = False
+            time.sleep(2)
+
+    def _handle(self, event, payload):
+        with self.lock:
+            if event == "status":
+                self.status = payload
+            elif event == "tick":
+                totals = payload["totals"]
+                if self.baseline is None or totals["processed"] < self.baseline["processed"]:
+                    # First frame, or the API restarted and its totals reset
+                    self.baseline = {"processed": 0, "successes": 0, "interventions": 0, "latency_ms": 0.0, "routes": {}}
+                self.totals = totals
+                self.events.extend(payload["transactions"])
+
+    def clear(self):
+        with self.lock:
+            self.events.clear()
+            if self.totals:
+                self.baseline = dict(self.totals, routes=dict(self.totals["routes"]))
+
+    def snapshot(self):
+        """Sampled transactions and the totals since the last clear."""
+        with self.lock:
+            events = list(self.events)
+            if not self.totals:
+                return events, None
+            totals = {k: self.totals[k] - self.baseline[k] for k in ("processed", "successes", "interventions", "latency_ms")}
+            totals["routes"] = {
+                gw: n - self.baseline["routes"].get(gw, 0) for gw, n in self.totals["routes"].items()
+            }
+            return events, totals
+
+@st.cache_resource
+def live_stream():
+    # One subscription per dashboard process, shared by every browser session
+    return LiveStream(f"{API_URL}/events/stream")
+
+def run_simulation(speed, stop):
+    # Traffic generator; results reach the dashboard through the live stream
+    with requests.Session() as session:
+        while not stop.is_set():
+            try:
+                session.post(f"{API_URL}/process", params={"compact": "true"}, json=generate_mock_transaction(), timeout=10)
+            except Exception:
+                stop.wait(1)  # Backoff on error
+            stop.wait(1.0 / speed)
+
+def start_simulation(speed):
+    stop = threading.Event()
+    threading.Thread(target=run_simulation, args=(speed, stop), daemon=True).start()
+    st.session_state.simulation = stop
+
+def stop_simulation():
+    if st.session_state.simulation:
+        st.session_state.simulation.set()
+    st.session_state.simulation = None
+
+stream = live_stream()
 
 # --- Sidebar ---
 with st.sidebar:
     st.header("Simulation Controls")
     
-    sim_speed = st.slider("Traffic Speed (req/s)", 0.5, 5.0, 1.0)
+    sim_speed = st.slider("Traffic Speed (req/s)", 0.5, 50.0, 1.0)
     
     c1, c2 = st.columns(2)
-    if st.session_state.simulation_running:
+    if st.session_state.simulation:
         if c1.button("Stop", type="primary", use_container_width=True):
-            st.session_state.simulation_running = False
+            stop_simulation()
             st.rerun()
     else:
         if c1.button("Start", type="primary", use_container_width=True):
-            st.session_state.simulation_running = True
+            start_simulation(sim_speed)
             st.rerun()
             
     if c2.button("Clear Data", use_container_width=True):
-        st.session_state.events = []
+        stream.clear()
         st.rerun()
 
+    st.caption("Live stream: connected" if stream.connected else "Live stream: connecting...")
+
     st.divider()
     
     st.subheader("Chaos Engineering")
@@ -181,16 +243,10 @@ with st.sidebar:
                 "merchant_id": "manual_user"
             }
             try:
-                start_t = time.time()
                 resp = requests.post(f"{API_URL}/process", json=tx_data)
-                latency_ms = (time.time() - start_t) * 1000
                 
                 if resp.status_code == 200:
                     data = resp.json()
-                    data.update(tx_data)
-                    data["timestamp"] = datetime.now()
-                    data["latency"] = latency_ms
-                    st.session_state.events.append(data)
                     st.toast(f"Transaction Processed! {data['success']}")
                 else:
                     st.error(f"API Error: {resp.status_code}")
@@ -202,23 +258,29 @@ st.title("Agentic Payment Operations")
 
 tab1, tab2, tab3 = st.tabs(["Live Operations", "Agent Brain", "Analytics"])
 
+def live_frame():
+    events, totals = stream.snapshot()
+    df = pd.DataFrame(events)
+    if not df.empty:
+        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="s")
+    return df, totals
+
 # --- TAB 1: Live Operations ---
-with tab1:
-    # KPI Row
-    df = pd.DataFrame(st.session_state.events)
-    
+@st.fragment(run_every=LIVE_REFRESH)
+def live_operations():
+    df, totals = live_frame()
+
+    # KPI Row: exact totals from the stream; the feed below is a sample
     kpi1, kpi2, kpi3, kpi4 = st.columns(4)
     
-    if not df.empty:
-        success_rate = (df["success"].sum() / len(df)) * 100
-        avg_latency = df["latency"].mean()
-        intervention_count = df[df["intervention_plan"].notnull()].shape[0]
-        total_vol = df["amount"].sum() if "amount" in df.columns else 0 # Mock amount not always in resp, need to fix if wanted
+    if totals and totals["processed"]:
+        success_rate = (totals["successes"] / totals["processed"]) * 100
+        avg_latency = totals["latency_ms"] / totals["processed"]
         
         kpi1.metric("Success Rate", f"{success_rate:.1f}%", delta_color="normal")
         kpi2.metric("Avg Latency", f"{avg_latency:.0f} ms")
-        kpi3.metric("Agent Interventions", intervention_count)
-        kpi4.metric("Total Transactions", len(df))
+        kpi3.metric("Agent Interventions", totals["interventions"])
+        kpi4.metric("Total Transactions", totals["processed"])
     else:
         for k in [kpi1, kpi2, kpi3, kpi4]:
             k.metric("Waiting...", "-")
@@ -318,12 +380,17 @@ with tab1:
     else:
         st.info("Select a transaction to see agent details.")
 
+with tab1:
+    live_operations()
+
 
 # --- TAB 2: Agent Brain ---
-with tab2:
+@st.fragment(run_every=LIVE_REFRESH)
+def agent_brain():
     st.subheader("Thompson Sampling State (The Router)")
     
-    system_status = fetch_system_status()
+    # Pushed by the API on circuit changes; polled only while the stream is down
+    system_status = stream.status if stream.connected else fetch_system_status()
     
     if system_status:
         c_brain_1, c_brain_2 = st.columns([2, 1])
@@ -374,11 +441,16 @@ with tab2:
     else:
         st.error("Cannot connect to Agent System API.")
 
+with tab2:
+    agent_brain()
+
 # --- TAB 3: Analytics ---
-with tab3:
+@st.fragment(run_every=LIVE_REFRESH)
+def analytics():
+    df, totals = live_frame()
     if not df.empty:
         st.subheader("Routing Distribution")
-        counts = df["route_decision"].value_counts().reset_index()
+        counts = pd.DataFrame(list(totals["routes"].items()), columns=["route_decision", "count"])
         fig_pie = px.pie(counts, values="count", names="route_decision", hole=0.4, template="plotly_dark")
         st.plotly_chart(fig_pie, use_container_width=True)
         
@@ -388,6 +460,5 @@ with tab3:
     else:
         st.info("No data yet.")
 
-# --- Background Runner ---
-if st.session_state.simulation_running:
-    run_simulation_step(sim_speed)
+with tab3:
+    analytics()
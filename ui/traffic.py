@@ -0,0 +1,18 @@
+import random
+import uuid
+
+# Mock traffic shared by the dashboard's simulator and the headless load
+# generator (benchmarks/load_test.py). Kept free of Streamlit so it can be
+# imported outside the dashboard.
+
+
+def generate_mock_transaction():
+    amounts = [50, 100, 250, 1000, 5000]
+    currencies = ["USD", "EUR", "GBP"]
+    return {
+        "transaction_id": str(uuid.uuid4()),
+        "amount": random.choice(amounts),
+        "currency": random.choice(currencies),
+        "payment_method": "credit_card",
+        "merchant_id": "merchant_001"
+    }